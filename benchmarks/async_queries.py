@@ -0,0 +1,111 @@
+"""
+Concurrency benchmark for cities_db.async_queries.
+
+    python -m benchmarks.async_queries [path/to/cities.db]
+
+For each concurrency level it fires a batch of hour queries and reports
+throughput, latency percentiles and the worst event-loop stall observed
+by a ticker task (which stays near the tick interval when nothing blocks
+the loop).
+"""
+
+import asyncio
+import logging
+import statistics
+import sys
+import time
+
+from cities_db import async_queries
+from cities_db.queries import top_cities_by_population_at_hour
+from config import CITIES_DB_PATH
+from db.session import create_session
+
+REQUESTS = 200
+CONCURRENCY_LEVELS = (1, 4, 8, 16, 64)
+TICK = 0.005
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def _ticker(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - started - TICK)
+
+
+async def _run_level(db_path, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            started = time.perf_counter()
+            await async_queries.top_cities_by_population_at_hour(db_path, i % 24, 50)
+            latencies.append(time.perf_counter() - started)
+
+    stop = asyncio.Event()
+    lags = []
+    ticker = asyncio.create_task(_ticker(stop, lags))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(REQUESTS)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await ticker
+
+    return {
+        "concurrency": concurrency,
+        "rps": REQUESTS / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "max_loop_lag_ms": max(lags, default=0.0) * 1000,
+    }
+
+
+def _run_sync(db_path) -> dict:
+    session, _ = create_session(db_path, profile="reader")
+    latencies = []
+
+    started = time.perf_counter()
+    for i in range(REQUESTS):
+        t = time.perf_counter()
+        top_cities_by_population_at_hour(session, i % 24, 50)
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - started
+
+    session.close()
+
+    return {
+        "concurrency": "sync",
+        "rps": REQUESTS / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "max_loop_lag_ms": float("nan"),
+    }
+
+
+async def main(db_path):
+    results = [_run_sync(db_path)]
+
+    for level in CONCURRENCY_LEVELS:
+        results.append(await _run_level(db_path, level))
+
+    async_queries.shutdown()
+
+    print(f"{'concurrency':>12} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'loop lag ms':>12}")
+    for r in results:
+        print(
+            f"{r['concurrency']:>12} {r['rps']:>9.1f} {r['p50_ms']:>9.2f} "
+            f"{r['p95_ms']:>9.2f} {r['max_loop_lag_ms']:>12.2f}"
+        )
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else CITIES_DB_PATH))
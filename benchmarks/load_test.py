@@ -0,0 +1,345 @@
+"""
+Offline HTTP load generator for the query servers.
+
+    python -m benchmarks.load_test [--server api|prefork] [--db cities.db]
+                                   [--url http://host:port] [--profile mixed]
+                                   [--duration 10] [--connections 16]
+                                   [--out result.json] [--baseline old.json]
+    python -m benchmarks.load_test --compare old.json new.json
+
+Without --url the chosen server (services.query_api by default) is
+started on --db in a child process. Keep-alive clients replay a traffic
+profile for --duration seconds after a short warm-up. The JSON report
+holds throughput, p50/p95/p99/p999 latency and error rates, overall and
+per request kind. --baseline (or --compare) puts two reports side by
+side, e.g. the same profile against two builds of cities.db.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from config import CITIES_DB_PATH
+
+# ---------------------------------------------------------
+# Traffic profiles
+# ---------------------------------------------------------
+#
+# A profile is a list of (weight, kind, path builder). Hours are skewed
+# toward HOT_HOUR: the "it's 5 o'clock somewhere" page gets most of the
+# traffic, the other 23 hours share the rest.
+
+HOT_HOUR = 17
+HOT_HOUR_SHARE = 0.4
+PAGE_SIZE = 20
+MAX_PAGE_DEPTH = 50
+
+
+def _hour(rng: random.Random) -> int:
+    if rng.random() < HOT_HOUR_SHARE:
+        return HOT_HOUR
+    return rng.choice([h for h in range(24) if h != HOT_HOUR])
+
+
+def _plain(rng):
+    return f"/cities?hour={_hour(rng)}&limit={PAGE_SIZE}"
+
+
+def _round_robin(rng):
+    return f"/cities?hour={_hour(rng)}&limit={PAGE_SIZE}&round_robin=country"
+
+
+def _page(rng):
+    # Geometric depth: most users stop after a page or two, a few dig deep
+    depth = min(int(rng.expovariate(0.3)), MAX_PAGE_DEPTH)
+    return f"/cities?hour={_hour(rng)}&limit={PAGE_SIZE}&offset={depth * PAGE_SIZE}"
+
+
+def _random_city(rng):
+    return f"/random?hour={_hour(rng)}"
+
+
+PROFILES = {
+    "mixed": [(0.55, "plain", _plain), (0.15, "round_robin", _round_robin),
+              (0.15, "pagination", _page), (0.15, "random", _random_city)],
+    "hours": [(1.0, "plain", _plain)],
+    "round_robin": [(0.5, "plain", _plain), (0.5, "round_robin", _round_robin)],
+    "pagination": [(1.0, "pagination", _page)],
+    "random": [(1.0, "random", _random_city)],
+}
+
+# Servers that implement only part of the API (prefork: /cities, no paging)
+SERVER_PROFILES = {
+    "api": set(PROFILES),
+    "prefork": {"hours"},
+}
+
+SERVERS = {
+    "api": """
+import asyncio, sys
+from services.query_api import serve_api
+asyncio.run(serve_api(sys.argv[1], "127.0.0.1", int(sys.argv[2])))
+""",
+    "prefork": """
+import sys
+from services.prefork_server import serve_prefork
+serve_prefork(sys.argv[1], "127.0.0.1", int(sys.argv[2]), int(sys.argv[3]))
+""",
+}
+
+
+# ---------------------------------------------------------
+# Statistics
+# ---------------------------------------------------------
+
+def percentile(ordered: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(latencies: list[float], errors: dict, seconds: float) -> dict:
+    ordered = sorted(latencies)
+    requests = len(ordered) + sum(errors.values())
+    ms = lambda v: round(v * 1000, 3)
+    return {
+        "requests": requests,
+        "throughput": round(len(ordered) / seconds, 1),
+        "latency_ms": {
+            "mean": ms(sum(ordered) / len(ordered)) if ordered else 0.0,
+            "p50": ms(percentile(ordered, 50)),
+            "p95": ms(percentile(ordered, 95)),
+            "p99": ms(percentile(ordered, 99)),
+            "p999": ms(percentile(ordered, 99.9)),
+            "max": ms(ordered[-1]) if ordered else 0.0,
+        },
+        "errors": dict(errors),
+        "error_rate": round(sum(errors.values()) / requests, 6) if requests else 0.0,
+    }
+
+
+# ---------------------------------------------------------
+# Load generation
+# ---------------------------------------------------------
+
+async def _request(reader, writer, host: str, path: str) -> int:
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode("latin-1"))
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("connection closed")
+    status = int(status_line.split()[1])
+
+    length = 0
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+
+    if length:
+        await reader.readexactly(length)
+    return status
+
+
+async def _client(url, profile, rng, deadline: float, warmup_until: float, results: dict, timeout: float):
+    weights = [w for w, _, _ in profile]
+    reader = writer = None
+
+    while time.perf_counter() < deadline:
+        _, kind, build = rng.choices(profile, weights)[0]
+        path = build(rng)
+
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+            status = await asyncio.wait_for(_request(reader, writer, url.netloc, path), timeout)
+            error = None if 200 <= status < 400 else f"http_{status}"
+        except asyncio.TimeoutError:
+            error = "timeout"
+        except (OSError, ConnectionError, ValueError, asyncio.IncompleteReadError):
+            error = "connection"
+
+        elapsed = time.perf_counter() - started
+        if error is not None and writer is not None:
+            writer.close()
+            writer = None
+
+        if started < warmup_until:
+            continue
+
+        latencies, errors = results.setdefault(kind, ([], {}))
+        if error is None:
+            latencies.append(elapsed)
+        else:
+            errors[error] = errors.get(error, 0) + 1
+            if error == "connection":
+                await asyncio.sleep(0.01)
+
+    if writer is not None:
+        writer.close()
+
+
+async def run_load(
+    base_url: str,
+    profile_name: str = "mixed",
+    duration: float = 10.0,
+    connections: int = 16,
+    warmup: float = 1.0,
+    seed: int = 0,
+    timeout: float = 10.0,
+) -> dict:
+    url = urlsplit(base_url)
+    profile = PROFILES[profile_name]
+    results: dict = {}
+
+    now = time.perf_counter()
+    warmup_until = now + warmup
+    deadline = warmup_until + duration
+
+    await asyncio.gather(*(
+        _client(url, profile, random.Random(seed * 1000 + i), deadline, warmup_until, results, timeout)
+        for i in range(connections)
+    ))
+
+    all_latencies = [v for latencies, _ in results.values() for v in latencies]
+    all_errors: dict = {}
+    for _, errors in results.values():
+        for name, count in errors.items():
+            all_errors[name] = all_errors.get(name, 0) + count
+
+    return {
+        "url": base_url,
+        "profile": profile_name,
+        "duration": duration,
+        "connections": connections,
+        **summarize(all_latencies, all_errors, duration),
+        "by_kind": {
+            kind: summarize(latencies, errors, duration)
+            for kind, (latencies, errors) in sorted(results.items())
+        },
+    }
+
+
+# ---------------------------------------------------------
+# Local servers and comparison
+# ---------------------------------------------------------
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(kind: str, db_path, workers: int = 1) -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-c", SERVERS[kind], str(db_path), str(port), str(workers)],
+        cwd=Path(__file__).resolve().parent.parent,
+        stderr=subprocess.DEVNULL,
+    )
+
+    for _ in range(300):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+
+    process.kill()
+    raise RuntimeError(f"{kind} server did not start")
+
+
+def compare(baseline: dict, candidate: dict) -> dict:
+    """Relative change per metric; negative latency / positive throughput is better."""
+    def delta(a, b):
+        return round((b - a) / a * 100, 1) if a else None
+
+    return {
+        "throughput_pct": delta(baseline["throughput"], candidate["throughput"]),
+        "latency_pct": {
+            name: delta(baseline["latency_ms"][name], candidate["latency_ms"][name])
+            for name in ("p50", "p95", "p99", "p999")
+        },
+        "error_rate": {"baseline": baseline["error_rate"], "candidate": candidate["error_rate"]},
+    }
+
+
+def print_report(name: str, report: dict):
+    lat = report["latency_ms"]
+    print(
+        f"{name:>12} {report['throughput']:>9,.1f} req/s  p50 {lat['p50']:>8.2f}  "
+        f"p95 {lat['p95']:>8.2f}  p99 {lat['p99']:>8.2f}  p999 {lat['p999']:>8.2f} ms  "
+        f"errors {report['error_rate']:.2%}",
+        file=sys.stderr,
+    )
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load_test")
+    parser.add_argument("--server", choices=sorted(SERVERS), default="api")
+    parser.add_argument("--db", default=str(CITIES_DB_PATH))
+    parser.add_argument("--workers", type=int, default=1, help="prefork workers")
+    parser.add_argument("--url", help="measure an already running server instead")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="mixed")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=1.0)
+    parser.add_argument("--connections", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the JSON report here as well")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"),
+                        help="only compare two saved reports")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        baseline, candidate = (json.loads(Path(p).read_text()) for p in args.compare)
+        print(json.dumps(compare(baseline, candidate), indent=2))
+        return
+
+    if not args.url and args.profile not in SERVER_PROFILES[args.server]:
+        parser.error(f"the {args.server} server cannot run the {args.profile} profile")
+
+    process = None
+    url = args.url
+    if url is None:
+        process, url = start_server(args.server, args.db, args.workers)
+
+    try:
+        report = asyncio.run(run_load(
+            url, args.profile, args.duration, args.connections, args.warmup, args.seed,
+        ))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    report["server"] = args.url or args.server
+    report["db"] = None if args.url else str(Path(args.db).resolve())
+
+    for kind, kind_report in report["by_kind"].items():
+        print_report(kind, kind_report)
+    print_report("total", report)
+
+    if args.baseline:
+        report["comparison"] = compare(json.loads(Path(args.baseline).read_text()), report)
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,118 @@
+"""
+services.local_time_table vs one zoneinfo datetime per pair.
+
+    python -m benchmarks.local_time [pairs] [seed]
+
+First every zone is validated against zoneinfo: one second before, at
+and after each stored transition, plus random instants from 1800 to
+well past the table's `until` (the zoneinfo fallback). Then `pairs`
+random (timestamp, zone) pairs are converted both ways, once over the
+bucketed window (1970 to `until`) and once over the wider range.
+"""
+
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+from services.local_time_table import LocalTimeTable, _zone_entries
+
+VALIDATION_SAMPLES = 200_000
+
+
+def _zoneinfo_convert(table: LocalTimeTable, timestamps, zone_ids):
+    zones = [ZoneInfo(name) for name in table.zones]
+    hours, minutes, offsets, abbreviations = [], [], [], []
+
+    for t, zone_id in zip(timestamps, zone_ids):
+        local = datetime.fromtimestamp(t, zones[zone_id])
+        hours.append(local.hour)
+        minutes.append(local.minute)
+        offsets.append(int(local.utcoffset().total_seconds()))
+        abbreviations.append(local.tzname())
+
+    return hours, minutes, offsets, abbreviations
+
+
+def _mismatches(table: LocalTimeTable, timestamps, zone_ids) -> list[tuple]:
+    local = table.convert(timestamps, zone_ids)
+    expected = _zoneinfo_convert(table, timestamps, zone_ids)
+
+    return [
+        (table.zones[zone_ids[i]], timestamps[i])
+        for i, want in enumerate(zip(*expected))
+        if want != (local.hour[i], local.minute[i], local.utc_offset[i], local.abbreviation[i])
+    ]
+
+
+def _epoch(year: int) -> int:
+    return int(datetime(year, 1, 1, tzinfo=timezone.utc).timestamp())
+
+
+def validate(table: LocalTimeTable, rng: random.Random) -> int:
+    # Around every transition of every zone
+    timestamps, zone_ids = [], []
+    for zone_id, tz_name in enumerate(table.zones):
+        for t, _ in _zone_entries(tz_name, table.until):
+            if t > _epoch(1800):
+                for delta in (-1, 0, 1):
+                    timestamps.append(t + delta)
+                    zone_ids.append(zone_id)
+
+    # Anywhere, including before 1970 and past the table
+    high = int(table.until.timestamp()) + 50 * 365 * 86400
+    for _ in range(VALIDATION_SAMPLES):
+        timestamps.append(rng.randrange(_epoch(1800), high))
+        zone_ids.append(rng.randrange(len(table.zones)))
+
+    bad = _mismatches(table, timestamps, zone_ids)
+    print(f"validated {len(timestamps):,} conversions: {len(bad)} mismatches", file=sys.stderr)
+    for tz_name, t in bad[:10]:
+        print(f"   {tz_name} at {t}", file=sys.stderr)
+
+    return len(bad)
+
+
+def throughput(table: LocalTimeTable, pairs: int, low: int, high: int, rng: random.Random):
+    timestamps = [rng.randrange(low, high) for _ in range(pairs)]
+    zone_ids = [rng.randrange(len(table.zones)) for _ in range(pairs)]
+
+    started = time.perf_counter()
+    table.convert(timestamps, zone_ids)
+    bulk = time.perf_counter() - started
+
+    started = time.perf_counter()
+    _zoneinfo_convert(table, timestamps, zone_ids)
+    scalar = time.perf_counter() - started
+
+    print(
+        f"{pairs:,} pairs: table {pairs / bulk:>12,.0f}/s   zoneinfo {pairs / scalar:>12,.0f}/s   "
+        f"({scalar / bulk:.1f}x)"
+    )
+
+
+def main(pairs: int, seed: int):
+    started = time.perf_counter()
+    table = LocalTimeTable()
+    print(
+        f"table: {len(table.zones)} zones, {len(table):,} transitions, "
+        f"built in {time.perf_counter() - started:.2f} s"
+    )
+
+    rng = random.Random(seed)
+    if validate(table, rng):
+        sys.exit(1)
+
+    until = int(table.until.timestamp())
+    print("1970 – until:   ", end="")
+    throughput(table, pairs, 0, until, rng)
+    print("1800 – until+50:", end=" ")
+    throughput(table, pairs, _epoch(1800), until + 50 * 365 * 86400, rng)
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 0,
+    )
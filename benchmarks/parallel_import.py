@@ -0,0 +1,109 @@
+"""
+geonames_db.importer.import_cities500 with 1..N parser processes.
+
+    python -m benchmarks.parallel_import [cities.txt] [max_workers]
+
+Each run imports into a scratch database. Reports wall time and lines/s
+per worker count, plus parse-only and write-only times: the writer is
+the ceiling parallel parsing can approach. Fails if any run's rows
+differ from the serial import.
+"""
+
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from config import CITIES_FILE, GEONAMES_PARSE_CHUNK_BYTES
+from db.base import Base
+from db.session import create_session, dispose_engines
+from geonames_db.importer import _INSERT_CITY, import_cities500, parse_cities_range
+from geonames_db.models import GeoNamesCity
+from utils.chunked_parse import byte_ranges
+
+
+def _count_lines(path) -> int:
+    with open(path, "rb") as f:
+        return sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b""))
+
+
+def _digest(session) -> str:
+    digest = hashlib.sha256()
+    for row in session.execute(GeoNamesCity.__table__.select().order_by(GeoNamesCity.geonameid)):
+        digest.update(repr(tuple(row)).encode())
+    return digest.hexdigest()
+
+
+def _run(cities_file, db_path: Path, workers: int):
+    session, engine = create_session(db_path)
+    Base.metadata.create_all(engine, tables=[GeoNamesCity.__table__])
+
+    started = time.perf_counter()
+    rows = import_cities500(session, cities_file, workers=workers)
+    elapsed = time.perf_counter() - started
+
+    digest = _digest(session)
+    session.close()
+    dispose_engines(db_path)
+    return elapsed, rows, digest
+
+
+def _parse_only(cities_file) -> tuple[float, list]:
+    started = time.perf_counter()
+    chunks = [
+        parse_cities_range(cities_file, start, end)
+        for start, end in byte_ranges(cities_file, GEONAMES_PARSE_CHUNK_BYTES)
+    ]
+    return time.perf_counter() - started, chunks
+
+
+def _write_only(chunks, db_path: Path) -> float:
+    session, engine = create_session(db_path)
+    Base.metadata.create_all(engine, tables=[GeoNamesCity.__table__])
+
+    conn = session.connection()
+
+    started = time.perf_counter()
+    for chunk in chunks:
+        if chunk:
+            conn.exec_driver_sql(_INSERT_CITY, chunk)
+    session.commit()
+    elapsed = time.perf_counter() - started
+
+    session.close()
+    dispose_engines(db_path)
+    return elapsed
+
+
+def main(cities_file, max_workers: int):
+    lines = _count_lines(cities_file)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        parse_seconds, chunks = _parse_only(cities_file)
+        write_seconds = _write_only(chunks, Path(tmp) / "write.db")
+        del chunks
+
+        print(f"{lines} lines, {os.cpu_count()} CPUs")
+        print(f"parse only: {parse_seconds:.2f}s   write only: {write_seconds:.2f}s\n")
+        print(f"{'workers':>7} {'time s':>8} {'lines/s':>10} {'speedup':>8}")
+
+        baseline = None
+        for workers in range(1, max_workers + 1):
+            elapsed, rows, digest = _run(cities_file, Path(tmp) / f"w{workers}.db", workers)
+
+            if baseline is None:
+                baseline = (elapsed, digest)
+            assert digest == baseline[1], f"{workers} workers: rows differ from serial import"
+
+            print(f"{workers:>7} {elapsed:>8.2f} {lines / elapsed:>10,.0f} {baseline[0] / elapsed:>7.2f}x")
+
+    print(f"\n{rows} rows, identical for every worker count")
+
+
+if __name__ == "__main__":
+    main(
+        sys.argv[1] if len(sys.argv) > 1 else CITIES_FILE,
+        int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1),
+    )
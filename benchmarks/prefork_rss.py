@@ -0,0 +1,128 @@
+"""
+Startup time and memory of services.prefork_server per worker count,
+with the snapshot loaded once before fork (shared) and per worker.
+
+    python -m benchmarks.prefork_rss [cities.db] [max_workers]
+
+Each worker is warmed with hour queries first, so every page a request
+touches has been touched. Memory comes from /proc/<pid>/smaps_rollup
+(Linux): RSS counts shared pages in full, PSS splits them between the
+processes sharing them, Private is what a worker alone holds.
+"""
+
+import http.client
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from config import CITIES_DB_PATH
+
+SERVER = """
+import sys
+from services.prefork_server import serve_prefork
+serve_prefork(sys.argv[1], "127.0.0.1", int(sys.argv[2]), int(sys.argv[3]), preload=sys.argv[4] == "1")
+"""
+
+PORT = 18095
+
+
+def _children(pid: int) -> list[int]:
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            stat = Path(f"/proc/{entry}/stat").read_text()
+        except OSError:
+            continue
+        # Fields after the parenthesised command name: state, ppid, ...
+        if int(stat.rsplit(")", 1)[1].split()[1]) == pid:
+            children.append(int(entry))
+    return children
+
+
+def _memory_kib(pid: int) -> dict[str, int]:
+    fields = {}
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()[1:]:
+        name, value = line.split(":", 1)
+        fields[name] = int(value.split()[0])
+    return {
+        "rss": fields["Rss"],
+        "pss": fields["Pss"],
+        "private": fields["Private_Clean"] + fields["Private_Dirty"],
+    }
+
+
+def _get(path: str):
+    conn = http.client.HTTPConnection("127.0.0.1", PORT, timeout=5)
+    try:
+        conn.request("GET", path)
+        return conn.getresponse().read()
+    finally:
+        conn.close()
+
+
+def _run(db_path, workers: int, preload: bool) -> dict:
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-c", SERVER, str(db_path), str(PORT), str(workers), "1" if preload else "0"],
+        cwd=Path(__file__).resolve().parent.parent,
+    )
+
+    try:
+        while True:
+            try:
+                _get("/health")
+                break
+            except OSError:
+                if time.perf_counter() - started > 60:
+                    raise RuntimeError("server did not start")
+                time.sleep(0.01)
+        ready = time.perf_counter() - started
+
+        # Without preload, workers load after fork: wait for all of them
+        for _ in range(50 * workers):
+            for hour in range(24):
+                _get(f"/cities?hour={hour}&limit=50")
+
+        pids = _children(process.pid)
+        master = _memory_kib(process.pid)
+        per_worker = [_memory_kib(pid) for pid in pids]
+    finally:
+        process.terminate()
+        process.wait()
+
+    n = len(per_worker)
+    return {
+        "ready": ready,
+        "workers": n,
+        "rss": sum(m["rss"] for m in per_worker) / n,
+        "pss": sum(m["pss"] for m in per_worker) / n,
+        "private": sum(m["private"] for m in per_worker) / n,
+        "total_pss": master["pss"] + sum(m["pss"] for m in per_worker),
+    }
+
+
+def main(db_path, max_workers: int):
+    counts = [n for n in (1, 2, 4, 8, 16) if n <= max_workers]
+
+    print(f"{'mode':>8} {'workers':>7} {'ready ms':>9} {'RSS/w MiB':>10} {'PSS/w MiB':>10} "
+          f"{'priv/w MiB':>11} {'total PSS':>10}")
+
+    for preload in (True, False):
+        for workers in counts:
+            r = _run(db_path, workers, preload)
+            print(
+                f"{'shared' if preload else 'private':>8} {r['workers']:>7} {r['ready'] * 1000:>9.0f} "
+                f"{r['rss'] / 1024:>10.1f} {r['pss'] / 1024:>10.1f} "
+                f"{r['private'] / 1024:>11.1f} {r['total_pss'] / 1024:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main(
+        sys.argv[1] if len(sys.argv) > 1 else CITIES_DB_PATH,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 8,
+    )
@@ -0,0 +1,81 @@
+"""
+ORM vs rows=True result modes for a large cities_at_hour() result.
+
+    python -m benchmarks.row_results [path/to/cities.db] [hour]
+
+Without an hour argument the busiest local hour right now is used, so the
+result is as large as the database allows. Each mode fetches every city
+and reads name/population/timezone name, as main.some_data() does.
+"""
+
+import gc
+import logging
+import sys
+import time
+import tracemalloc
+
+from cities_db.queries import cities_at_hour, cities_by_hour
+from config import CITIES_DB_PATH
+from db.session import create_session
+
+RUNS = 3
+
+
+def _consume_orm(session, hour):
+    cities = cities_at_hour(session, hour)
+    for city in cities:
+        (city.name, city.population, city.timezone.name)
+    return len(cities)
+
+
+def _consume_rows(session, hour):
+    cities = cities_at_hour(session, hour, rows=True, columns=("name", "population", "timezone"))
+    for city in cities:
+        (city.name, city.population, city.timezone)
+    return len(cities)
+
+
+def _measure(db_path, hour, consume):
+    timings = []
+
+    for _ in range(RUNS):
+        # Fresh session per run: no identity map carried over
+        session, _ = create_session(db_path, profile="reader")
+        gc.collect()
+        started = time.perf_counter()
+        count = consume(session, hour)
+        timings.append(time.perf_counter() - started)
+        session.close()
+
+    session, _ = create_session(db_path, profile="reader")
+    gc.collect()
+    tracemalloc.start()
+    consume(session, hour)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    session.close()
+
+    return count, min(timings), peak
+
+
+def main(db_path, hour=None):
+    if hour is None:
+        session, _ = create_session(db_path, profile="reader")
+        buckets = cities_by_hour(session, top_n=0)
+        hour = max(buckets, key=lambda b: b["city_count"])["hour"]
+        session.close()
+
+    print(f"cities_at_hour({hour}), best of {RUNS}")
+    print(f"{'mode':>6} {'rows':>8} {'time ms':>9} {'peak MiB':>9}")
+
+    for label, consume in (("orm", _consume_orm), ("rows", _consume_rows)):
+        count, best, peak = _measure(db_path, hour, consume)
+        print(f"{label:>6} {count:>8} {best * 1000:>9.1f} {peak / 2**20:>9.1f}")
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    main(
+        sys.argv[1] if len(sys.argv) > 1 else CITIES_DB_PATH,
+        int(sys.argv[2]) if len(sys.argv) > 2 else None,
+    )
@@ -0,0 +1,174 @@
+"""
+services.static_server vs a plain file server, under a local load generator.
+
+    python -m benchmarks.static_server [json/timezones] [seconds] [concurrency]
+    python -m benchmarks.static_server --url http://localhost:8043 [seconds] [concurrency]
+
+Without --url, both the static serve mode and the stdlib http.server
+(threaded, HTTP/1.1, no caching headers: the same contract as the
+gostatic image) are started on the export directory. With --url, an
+already running server (e.g. the static Docker image) is measured instead.
+
+Three workloads per server: cold GETs, GETs with Accept-Encoding: gzip,
+and browser-style revalidation with If-None-Match.
+"""
+
+import asyncio
+import random
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+
+async def _request(reader, writer, host: str, path: str, headers: dict) -> tuple[int, dict, int]:
+    lines = [f"GET {path} HTTP/1.1", f"Host: {host}"]
+    lines.extend(f"{k}: {v}" for k, v in headers.items())
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+    status = int((await reader.readline()).split()[1])
+    response_headers = {}
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        name, _, value = line.decode("latin-1").partition(":")
+        response_headers[name.strip().lower()] = value.strip()
+
+    length = int(response_headers.get("content-length", 0))
+    if length:
+        await reader.readexactly(length)
+
+    return status, response_headers, length
+
+
+async def _client(base_url: str, paths, mode: str, deadline: float, totals: dict):
+    url = urlsplit(base_url)
+    etags = {}
+    reader = writer = None
+
+    while time.perf_counter() < deadline:
+        if writer is None:
+            reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+
+        path = random.choice(paths)
+        headers = {}
+        if mode == "gzip":
+            headers["Accept-Encoding"] = "gzip"
+        elif mode == "revalidate" and path in etags:
+            headers["If-None-Match"] = etags[path]
+
+        status, response_headers, length = await _request(reader, writer, url.netloc, path, headers)
+
+        totals["requests"] += 1
+        totals["bytes"] += length
+        totals[status] = totals.get(status, 0) + 1
+        if "etag" in response_headers:
+            etags[path] = response_headers["etag"]
+
+        if response_headers.get("connection", "").lower() == "close":
+            writer.close()
+            writer = None
+
+    if writer is not None:
+        writer.close()
+
+
+async def _load(base_url: str, paths, mode: str, seconds: float, concurrency: int) -> dict:
+    totals = {"requests": 0, "bytes": 0}
+    deadline = time.perf_counter() + seconds
+    await asyncio.gather(*(
+        _client(base_url, paths, mode, deadline, totals) for _ in range(concurrency)
+    ))
+    return totals
+
+
+# ---------------------------------------------------------
+# Servers under test
+# ---------------------------------------------------------
+#
+# Each runs in its own process so it does not share the load generator's
+# GIL; the baseline mirrors the gostatic image: threaded, keep-alive, no
+# validators beyond Last-Modified, no compression.
+
+STATIC_SERVER = """
+import asyncio, sys
+from pathlib import Path
+from services.static_server import serve_static
+asyncio.run(serve_static("127.0.0.1", int(sys.argv[2]), {"/json/timezones/": Path(sys.argv[1])}))
+"""
+
+PLAIN_SERVER = """
+import functools, sys
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+class Handler(SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    def log_message(self, *args):
+        pass
+
+root = Path(sys.argv[1]).parent.parent
+ThreadingHTTPServer(("127.0.0.1", int(sys.argv[2])), functools.partial(Handler, directory=str(root))).serve_forever()
+"""
+
+
+def _spawn(code: str, directory: Path, port: int) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [sys.executable, "-c", code, str(directory), str(port)],
+        cwd=Path(__file__).resolve().parent.parent,
+    )
+
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+
+    process.kill()
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def main(argv):
+    processes = []
+
+    if argv and argv[0] == "--url":
+        servers = {"external": argv[1]}
+        directory = Path("json/timezones")
+        argv = argv[2:]
+    else:
+        directory = Path(argv[0] if argv else "json/timezones").resolve()
+        argv = argv[1:]
+        processes = [
+            _spawn(PLAIN_SERVER, directory, 18081),
+            _spawn(STATIC_SERVER, directory, 18082),
+        ]
+        servers = {
+            "http.server": "http://127.0.0.1:18081",
+            "static_server": "http://127.0.0.1:18082",
+        }
+
+    seconds = float(argv[0]) if argv else 5
+    concurrency = int(argv[1]) if len(argv) > 1 else 32
+
+    paths = [f"/json/timezones/{p.name}" for p in sorted(directory.glob("*.json"))]
+
+    print(f"{len(paths)} files, {concurrency} connections, {seconds:g}s per run\n")
+    print(f"{'server':>14} {'workload':>11} {'req/s':>9} {'MiB/s':>8} {'200':>7} {'304':>7}")
+
+    try:
+        for name, base_url in servers.items():
+            for mode in ("cold", "gzip", "revalidate"):
+                totals = asyncio.run(_load(base_url, paths, mode, seconds, concurrency))
+                print(
+                    f"{name:>14} {mode:>11} {totals['requests'] / seconds:>9,.0f} "
+                    f"{totals['bytes'] / seconds / 2**20:>8.1f} "
+                    f"{totals.get(200, 0):>7} {totals.get(304, 0):>7}"
+                )
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
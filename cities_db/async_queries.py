@@ -0,0 +1,177 @@
+"""
+Async front-end for cities_db.queries and services.timezone_service.
+
+SQLite I/O runs on a dedicated thread pool, each call with its own
+short-lived reader session, so the event loop is never blocked.
+The synchronous query functions are reused as-is; the hour queries go
+through the hour-flip-aware result cache (cities_db/cache.py).
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional, Sequence
+
+from cities_db import cache, queries
+from cities_db.models import City
+from config import ASYNC_QUERY_WORKERS
+from db.session import create_session
+from services import timezone_service
+
+_executor = ThreadPoolExecutor(
+    max_workers=ASYNC_QUERY_WORKERS,
+    thread_name_prefix="cities-db",
+)
+
+
+def _run_in_session(db_path, fn, args, kwargs):
+    session, _ = create_session(db_path, profile="reader")
+    try:
+        result = fn(session, *args, **kwargs)
+
+        # Load the timezone while the session is open; rows are detached
+        # on close and handed back to the event loop thread.
+        for row in result if isinstance(result, list) else [result]:
+            if isinstance(row, City):
+                row.timezone
+
+        return result
+    finally:
+        session.close()
+
+
+async def run_query(db_path, fn, *args, **kwargs):
+    """
+    Run any `fn(session, ...)` query helper off the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _executor,
+        partial(_run_in_session, db_path, fn, args, kwargs),
+    )
+
+
+def shutdown(wait: bool = True):
+    _executor.shutdown(wait=wait)
+
+
+# ---------------------------------------------------------
+# services.timezone_service
+# ---------------------------------------------------------
+
+async def timezones_at_hour(db_path, target_hour: int) -> list[str]:
+    return await run_query(db_path, timezone_service.timezones_at_hour, target_hour)
+
+
+# ---------------------------------------------------------
+# cities_db.queries
+# ---------------------------------------------------------
+
+async def cities_at_hour(
+    db_path,
+    hour: int,
+    limit: Optional[int] = None,
+    round_robin_by: Optional[str] = None,
+    rows: bool = False,
+    columns: Optional[Sequence[str]] = None,
+    offset: Optional[int] = None,
+):
+    return await run_query(
+        db_path, cache.cached_cities_at_hour, hour, limit, round_robin_by,
+        rows=rows, columns=columns, offset=offset,
+    )
+
+
+async def cities_in_timezone(
+    db_path,
+    tz_name: str,
+    limit: Optional[int] = None,
+    round_robin_by: Optional[str] = None,
+    rows: bool = False,
+    columns: Optional[Sequence[str]] = None,
+):
+    return await run_query(
+        db_path, queries.cities_in_timezone, tz_name, limit, round_robin_by,
+        rows=rows, columns=columns,
+    )
+
+
+async def top_cities_by_population_in_timezone(
+    db_path,
+    tz_name: str,
+    limit: Optional[int] = None,
+    rows: bool = False,
+    columns: Optional[Sequence[str]] = None,
+):
+    return await run_query(
+        db_path, queries.top_cities_by_population_in_timezone, tz_name, limit,
+        rows=rows, columns=columns,
+    )
+
+
+async def bottom_cities_by_population_in_timezone(
+    db_path,
+    tz_name: str,
+    limit: Optional[int] = None,
+    rows: bool = False,
+    columns: Optional[Sequence[str]] = None,
+):
+    return await run_query(
+        db_path, queries.bottom_cities_by_population_in_timezone, tz_name, limit,
+        rows=rows, columns=columns,
+    )
+
+
+async def top_cities_by_population_at_hour(
+    db_path,
+    hour: int,
+    limit: Optional[int] = None,
+    rows: bool = False,
+    columns: Optional[Sequence[str]] = None,
+    offset: Optional[int] = None,
+):
+    return await run_query(
+        db_path, cache.cached_top_cities_by_population_at_hour, hour, limit,
+        rows=rows, columns=columns, offset=offset,
+    )
+
+
+async def bottom_cities_by_population_at_hour(
+    db_path,
+    hour: int,
+    limit: Optional[int] = None,
+    rows: bool = False,
+    columns: Optional[Sequence[str]] = None,
+):
+    return await run_query(
+        db_path, queries.bottom_cities_by_population_at_hour, hour, limit,
+        rows=rows, columns=columns,
+    )
+
+
+async def random_city_at_hour(
+    db_path,
+    hour: int,
+    rows: bool = False,
+    columns: Optional[Sequence[str]] = None,
+):
+    return await run_query(
+        db_path, queries.random_city_at_hour, hour,
+        rows=rows, columns=columns,
+    )
+
+
+async def cities_by_country(
+    db_path,
+    country_code: str,
+    rows: bool = False,
+    columns: Optional[Sequence[str]] = None,
+):
+    return await run_query(
+        db_path, queries.cities_by_country, country_code,
+        rows=rows, columns=columns,
+    )
+
+
+async def cities_by_hour(db_path, top_n: int = 5):
+    return await run_query(db_path, queries.cities_by_hour, top_n)
@@ -0,0 +1,202 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional, Sequence
+
+from sqlalchemy import select
+
+from cities_db.models import IANATimezone
+from cities_db.queries import cities_at_hour, top_cities_by_population_at_hour
+from config import QUERY_CACHE_SIZE
+from db.diagnostics import diagnostics
+from db.session import live_files
+from services.timezone_service import hour_flip_schedule
+
+
+class HourQueryCache:
+    """
+    LRU cache for hour-based queries.
+
+    An entry for hour H stays valid until the next instant any zone in
+    cities.db enters or leaves local hour H, so cached results are never
+    stale, only recomputed when the answer can actually change.
+
+    Only rows mode results (immutable Row tuples) are cached: they can be
+    handed to concurrent callers on any thread, ORM instances cannot.
+    """
+
+    def __init__(self, maxsize: int = QUERY_CACHE_SIZE, clock=None):
+        self.maxsize = maxsize
+        self.clock = clock or (lambda: datetime.now(timezone.utc))
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Per-database flip schedules, valid until their earliest flip
+        self._schedules: dict[str, tuple[datetime, dict]] = {}
+
+    # -------------------------------------------------
+    # Expiry
+    # -------------------------------------------------
+
+    def _schedule(self, session, db_key: str, now: datetime) -> dict:
+        with self._lock:
+            cached = self._schedules.get(db_key)
+        if cached is not None and now < cached[0]:
+            return cached[1]
+
+        tz_names = session.execute(select(IANATimezone.name)).scalars().all()
+        schedule = hour_flip_schedule(tz_names, now)
+
+        valid_until = min((flip for _, flip, _ in schedule.values()), default=now)
+
+        with self._lock:
+            self._schedules[db_key] = (valid_until, schedule)
+            self._prune_generations()
+
+        return schedule
+
+    def _prune_generations(self):
+        # Schedules and entries of generations that have been superseded
+        # (no live path resolves to them any more). Caller holds _lock.
+        live = live_files()
+        for db_key in [k for k in self._schedules if k not in live]:
+            del self._schedules[db_key]
+        for key in [k for k in self._entries if k[0] not in live]:
+            del self._entries[key]
+
+    def expires_at(self, session, db_key: str, hour: int, now: datetime) -> datetime:
+        """
+        Next instant the set of zones at `hour` can change.
+        """
+        schedule = self._schedule(session, db_key, now)
+
+        relevant = [
+            flip
+            for current, flip, upcoming in schedule.values()
+            if current == hour or upcoming == hour
+        ]
+
+        if relevant:
+            return min(relevant)
+
+        # No zone is at, or about to reach, this hour: fall back to the
+        # earliest flip anywhere, which is always safe.
+        return min((flip for _, flip, _ in schedule.values()), default=now)
+
+    # -------------------------------------------------
+    # Lookup
+    # -------------------------------------------------
+
+    def get_or_compute(self, session, name: str, hour: int, args: tuple, compute):
+        """`compute()` must return rows mode results."""
+        # Engines are bound to the resolved generation file (db/session.py),
+        # so a newly published generation gets entries of its own
+        db_key = session.get_bind().url.database.removeprefix("file:")
+        key = (db_key, name, hour, args)
+        now = self.clock()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now < entry[0]:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return list(entry[1])
+
+            self.misses += 1
+
+        result = compute()
+        expires = self.expires_at(session, db_key, hour, now)
+
+        with self._lock:
+            self._entries[key] = (expires, result)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+        return list(result)
+
+    # -------------------------------------------------
+    # Maintenance
+    # -------------------------------------------------
+
+    def invalidate(self):
+        """
+        Drop every entry. Not needed after a rebuild: entries are keyed
+        by generation file and superseded generations are pruned.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._schedules.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+query_cache = HourQueryCache()
+diagnostics.register_gauges("query_cache", query_cache.stats)
+
+
+def _columns_key(columns: Optional[Sequence[str]]):
+    return None if columns is None else tuple(columns)
+
+
+def cached_cities_at_hour(
+    session,
+    hour: int,
+    limit: Optional[int] = None,
+    round_robin_by: Optional[str] = None,
+    rows: bool = False,
+    columns: Optional[Sequence[str]] = None,
+    offset: Optional[int] = None,
+):
+    if not rows:
+        return cities_at_hour(session, hour, limit, round_robin_by, offset=offset)
+
+    return query_cache.get_or_compute(
+        session,
+        "cities_at_hour",
+        hour,
+        (limit, round_robin_by, _columns_key(columns), offset),
+        lambda: cities_at_hour(
+            session, hour, limit, round_robin_by,
+            rows=rows, columns=columns, offset=offset,
+        ),
+    )
+
+
+def cached_top_cities_by_population_at_hour(
+    session,
+    hour: int,
+    limit: Optional[int] = None,
+    rows: bool = False,
+    columns: Optional[Sequence[str]] = None,
+    offset: Optional[int] = None,
+):
+    if not rows:
+        return top_cities_by_population_at_hour(session, hour, limit, offset=offset)
+
+    return query_cache.get_or_compute(
+        session,
+        "top_cities_by_population_at_hour",
+        hour,
+        (limit, _columns_key(columns), offset),
+        lambda: top_cities_by_population_at_hour(
+            session, hour, limit,
+            rows=rows, columns=columns, offset=offset,
+        ),
+    )
@@ -1,7 +1,11 @@
-from collections import defaultdict
+from datetime import datetime, timezone
 
-from cities_db.models import IANATimezone, City
+from sqlalchemy import insert, select
+
+from cities_db.models import IANATimezone, City, CityStats, TimezoneOffset
 from geonames_db.models import GeoNamesCity, Admin1Code, CountryInfo
+from config import CITY_STATS_QUANTILES, CITY_STATS_THRESHOLDS, IMPORT_BATCH_SIZE
+from services.timezone_service import offset_intervals
 import pytz
 
 
@@ -23,11 +27,15 @@ def build_timezones(geo_session, city_session):
     city_session.commit()
 
 
-def build_cities(geo_session, city_session):
+def build_cities(geo_session, city_session, batch_size: int = IMPORT_BATCH_SIZE):
     """
     Populate cities table:
     - Grouped by timezone
     - Within each timezone, sorted by population DESC
+
+    Rows arrive from geonames.db already in that order (see
+    geonames_db.importer.create_indexes) and are inserted in batches, so
+    memory stays flat whatever the dump size.
     """
 
     # -------------------------------------------------
@@ -50,73 +58,375 @@ def build_cities(geo_session, city_session):
     }
 
     # -------------------------------------------------
-    # Group cities by timezone_id
+    # Stream grouped + sorted
     # -------------------------------------------------
 
-    cities_by_timezone: dict[int, list[City]] = defaultdict(list)
+    stmt = (
+        select(
+            GeoNamesCity.name,
+            GeoNamesCity.admin1_code,
+            GeoNamesCity.country_code,
+            GeoNamesCity.latitude,
+            GeoNamesCity.longitude,
+            GeoNamesCity.population,
+            GeoNamesCity.timezone,
+        )
+        .order_by(GeoNamesCity.timezone, GeoNamesCity.population.desc())
+    )
+
+    # Core insert on the table: the ORM bulk path drops None values and
+    # splits the batch on every change of key set (e.g. a missing state)
+    insert_city = insert(City.__table__)
+    batch = []
 
-    for c in geo_session.query(GeoNamesCity).yield_per(1000):
+    for c in geo_session.execute(stmt).yield_per(batch_size):
         tz_id = tz_map.get(c.timezone)
         if not tz_id:
             continue
 
         admin_key = f"{c.country_code}.{c.admin1_code}"
 
-        city = City(
-            name=c.name,
-            state=admin_map.get(admin_key),
-            state_code=c.admin1_code,
-            country=country_map.get(c.country_code),
-            country_code=c.country_code,
-            latitude=c.latitude,
-            longitude=c.longitude,
-            population=c.population or 0,
-            timezone_id=tz_id,
+        batch.append({
+            "name": c.name,
+            "state": admin_map.get(admin_key),
+            "state_code": c.admin1_code,
+            "country": country_map.get(c.country_code),
+            "country_code": c.country_code,
+            "latitude": c.latitude,
+            "longitude": c.longitude,
+            "population": c.population or 0,
+            "timezone_id": tz_id,
+        })
+
+        if len(batch) >= batch_size:
+            city_session.execute(insert_city, batch)
+            batch = []
+
+    if batch:
+        city_session.execute(insert_city, batch)
+
+    city_session.commit()
+
+def build_offset_schedule(city_session, years: int, start_year: int | None = None):
+    """
+    Populate timezone_offsets with the UTC offset intervals of every
+    timezone in cities.db, from Jan 1 of `start_year` for `years` years.
+    """
+
+    start_year = start_year or datetime.now(timezone.utc).year
+    window_start = datetime(start_year, 1, 1, tzinfo=timezone.utc)
+    window_end = datetime(start_year + years, 1, 1, tzinfo=timezone.utc)
+
+    city_session.query(TimezoneOffset).delete()
+
+    rows = []
+
+    for tz in city_session.query(IANATimezone):
+        try:
+            intervals = offset_intervals(tz.name, window_start, window_end)
+        except Exception:
+            # Unknown to this tzdata: hour queries skip it as well
+            continue
+
+        for starts_at, ends_at, offset, abbreviation, is_dst in intervals:
+            rows.append({
+                "timezone_id": tz.id,
+                "starts_at": int(starts_at.timestamp()),
+                "ends_at": int(ends_at.timestamp()),
+                "utc_offset": offset,
+                "abbreviation": abbreviation,
+                "is_dst": is_dst,
+            })
+
+    city_session.bulk_insert_mappings(TimezoneOffset, rows)
+    city_session.commit()
+
+
+# Grouping column per city_stats scope; both lead an index ordered by
+# population DESC, so the ranking pass below reads them without a sort
+STATS_SCOPES = {
+    "timezone": "timezone_id",
+    "country": "country_code",
+}
+
+
+def _quantile_name(q: float) -> str:
+    return f"p{q * 100:g}"
+
+
+def _nearest_rank(q: float, n: int) -> int:
+    # ceil(q * n), at least 1; q in basis points keeps it integer
+    return max(1, -(-round(q * 10000) * n // 10000))
+
+
+def _nearest_rank_sql(q: float, n: str) -> str:
+    return f"MAX(1, ({n} * {round(q * 10000)} + 9999) / 10000)"
+
+
+def build_city_stats(
+    city_session,
+    quantiles=CITY_STATS_QUANTILES,
+    thresholds=CITY_STATS_THRESHOLDS,
+):
+    """
+    Materialize city_stats: per timezone and per country the city count,
+    total / max / min population, largest city, nearest-rank population
+    quantiles and exact counts of cities at or above each threshold.
+    One aggregate and one ranking pass over cities per scope.
+    """
+
+    city_session.query(CityStats).delete()
+    conn = city_session.connection()
+
+    tz_names = dict(conn.exec_driver_sql("SELECT id, name FROM iana_timezones").all())
+    thresholds = [int(t) for t in thresholds]
+    rows = []
+
+    for scope, column in STATS_SCOPES.items():
+        above = "".join(
+            f", SUM(COALESCE(population, 0) >= {t})" for t in thresholds
         )
+        summary = conn.exec_driver_sql(f"""
+        SELECT
+            {column},
+            COUNT(*),
+            SUM(COALESCE(population, 0)),
+            MAX(COALESCE(population, 0)),
+            MIN(COALESCE(population, 0))
+            {above}
+        FROM cities
+        GROUP BY {column}
+        """)
 
-        cities_by_timezone[tz_id].append(city)
+        stats = {}
+        for group, count, total, largest, smallest, *counts in summary:
+            stats[group] = {
+                "city_count": count,
+                "total_population": total,
+                "max_population": largest,
+                "min_population": smallest,
+                "largest_city_id": None,
+                "quantiles": {_quantile_name(q): None for q in quantiles},
+                "counts_above": {str(t): c for t, c in zip(thresholds, counts)},
+            }
 
-    # -------------------------------------------------
-    # Insert grouped + sorted
-    # -------------------------------------------------
+        # rn ranks by population DESC; the ascending rank n - rn + 1 is
+        # compared against each quantile's nearest rank.
+        targets = ", ".join(_nearest_rank_sql(q, "n") for q in quantiles)
+        ranked = conn.exec_driver_sql(f"""
+        SELECT grp, rn, n, population, id
+        FROM (
+            SELECT
+                {column} AS grp,
+                id,
+                COALESCE(population, 0) AS population,
+                ROW_NUMBER() OVER (
+                    PARTITION BY {column}
+                    ORDER BY population DESC, id
+                ) AS rn,
+                COUNT(*) OVER (PARTITION BY {column}) AS n
+            FROM cities
+        )
+        WHERE rn = 1 OR n - rn + 1 IN ({targets})
+        """)
+
+        for group, rn, n, population, city_id in ranked:
+            entry = stats[group]
+            if rn == 1:
+                entry["largest_city_id"] = city_id
 
-    for tz_id, cities in cities_by_timezone.items():
-        # Sort by population DESC within timezone
-        cities.sort(key=lambda c: c.population, reverse=True)
+            ascending = n - rn + 1
+            for q in quantiles:
+                if _nearest_rank(q, n) == ascending:
+                    entry["quantiles"][_quantile_name(q)] = population
 
-        city_session.bulk_save_objects(cities)
+        for group, entry in stats.items():
+            key = tz_names.get(group) if scope == "timezone" else group
+            if key is None:
+                continue
+            rows.append({"scope": scope, "key": key, **entry})
 
+    city_session.execute(insert(CityStats.__table__), rows)
     city_session.commit()
 
+
+# iana_timezones.name is already indexed by its UNIQUE constraint, a DESC
+# index serves ASC scans backwards, and a (country_code, population) index
+# covers country_code lookups on its own.
+REDUNDANT_INDEXES = (
+    "idx_iana_timezones_name",
+    "idx_cities_tz_pop_desc",
+    "idx_cities_tz_pop_asc",
+    "idx_cities_country",
+)
+
+
+def _is_compact(conn) -> bool:
+    kind = conn.exec_driver_sql(
+        "SELECT type FROM sqlite_master WHERE name = 'cities'"
+    ).scalar()
+    return kind == "view"
+
+
 def create_indexes(engine):
     with engine.begin() as conn:
-        conn.exec_driver_sql("""
-        CREATE UNIQUE INDEX IF NOT EXISTS idx_iana_timezones_name
-        ON iana_timezones (name);
-        """)
+        # Every hour/timezone query filters on timezone_id and orders or
+        # ranks by population; the rowid rides along, which makes this
+        # index covering for cities_by_hour's ranking pass.
+        if _is_compact(conn):
+            conn.exec_driver_sql("""
+            CREATE INDEX IF NOT EXISTS idx_city_data_tz_population
+            ON city_data (timezone_id, population DESC);
+            """)
 
-        conn.exec_driver_sql("""
-        CREATE INDEX IF NOT EXISTS idx_cities_tz_population
-        ON cities (timezone_id, population DESC);
-        """)
-        
-        conn.exec_driver_sql("""
-        CREATE INDEX IF NOT EXISTS idx_cities_tz_pop_desc
-        ON cities (timezone_id, population DESC);
-        """)
-        
-        conn.exec_driver_sql("""
-        CREATE INDEX IF NOT EXISTS idx_cities_tz_pop_asc
-        ON cities (timezone_id, population ASC);
-        """)
+            conn.exec_driver_sql("""
+            CREATE INDEX IF NOT EXISTS idx_city_data_country_pop_desc
+            ON city_data (country_id, population DESC);
+            """)
+        else:
+            conn.exec_driver_sql("""
+            CREATE INDEX IF NOT EXISTS idx_cities_tz_population
+            ON cities (timezone_id, population DESC);
+            """)
+
+            conn.exec_driver_sql("""
+            CREATE INDEX IF NOT EXISTS idx_cities_country_pop_desc
+            ON cities (country_code, population DESC);
+            """)
         
         conn.exec_driver_sql("""
-        CREATE INDEX IF NOT EXISTS idx_cities_country
-        ON cities (country_code);
+        CREATE INDEX IF NOT EXISTS idx_tz_offsets_range
+        ON timezone_offsets (starts_at, ends_at, timezone_id, utc_offset);
         """)
         
         conn.exec_driver_sql("""
-        CREATE INDEX IF NOT EXISTS idx_cities_country_pop_desc
-        ON cities (country_code, population DESC);
+        CREATE INDEX IF NOT EXISTS idx_tz_offsets_tz_range
+        ON timezone_offsets (timezone_id, ends_at);
         """)
 
+
+def _storage_stats(conn) -> dict:
+    page_size = conn.exec_driver_sql("PRAGMA page_size").scalar()
+    page_count = conn.exec_driver_sql("PRAGMA page_count").scalar()
+    return {
+        "page_size": page_size,
+        "page_count": page_count,
+        "bytes": page_size * page_count,
+    }
+
+
+def compact_cities(conn):
+    """
+    Move cities into the compact layout: country and state names are
+    interned into lookup tables, the rows live in city_data, and a
+    `cities` view with the original columns keeps every reader (ORM
+    included) working unchanged. The view is read-only.
+    """
+
+    conn.exec_driver_sql("""
+    CREATE TABLE countries (
+        id INTEGER PRIMARY KEY,
+        code TEXT NOT NULL UNIQUE,
+        name TEXT
+    )
+    """)
+    conn.exec_driver_sql("""
+    INSERT INTO countries (code, name)
+    SELECT country_code, MAX(country)
+    FROM cities
+    GROUP BY country_code
+    ORDER BY country_code
+    """)
+
+    conn.exec_driver_sql("""
+    CREATE TABLE states (
+        id INTEGER PRIMARY KEY,
+        country_id INTEGER NOT NULL REFERENCES countries (id),
+        code TEXT,
+        name TEXT,
+        UNIQUE (country_id, code, name)
+    )
+    """)
+    conn.exec_driver_sql("""
+    INSERT INTO states (country_id, code, name)
+    SELECT DISTINCT co.id, c.state_code, c.state
+    FROM cities c
+    JOIN countries co ON co.code = c.country_code
+    ORDER BY co.id, c.state_code
+    """)
+
+    # Same row order as build_cities: grouped by timezone, population DESC
+    conn.exec_driver_sql("""
+    CREATE TABLE city_data (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        country_id INTEGER NOT NULL REFERENCES countries (id),
+        state_id INTEGER REFERENCES states (id),
+        latitude REAL NOT NULL,
+        longitude REAL NOT NULL,
+        population INTEGER,
+        timezone_id INTEGER NOT NULL REFERENCES iana_timezones (id)
+    )
+    """)
+    conn.exec_driver_sql("""
+    INSERT INTO city_data
+        (id, name, country_id, state_id, latitude, longitude, population, timezone_id)
+    SELECT c.id, c.name, co.id, s.id, c.latitude, c.longitude, c.population, c.timezone_id
+    FROM cities c
+    JOIN countries co ON co.code = c.country_code
+    LEFT JOIN states s
+        ON s.country_id = co.id
+        AND s.code IS c.state_code
+        AND s.name IS c.state
+    ORDER BY c.id
+    """)
+
+    conn.exec_driver_sql("DROP TABLE cities")
+
+    conn.exec_driver_sql("""
+    CREATE VIEW cities AS
+    SELECT
+        c.id AS id,
+        c.name AS name,
+        s.name AS state,
+        s.code AS state_code,
+        co.name AS country,
+        co.code AS country_code,
+        c.latitude AS latitude,
+        c.longitude AS longitude,
+        c.population AS population,
+        c.timezone_id AS timezone_id
+    FROM city_data c
+    JOIN countries co ON co.id = c.country_id
+    LEFT JOIN states s ON s.id = c.state_id
+    """)
+
+
+def optimize_cities_db(engine, compact: bool = False) -> dict:
+    """
+    Post-build pass: drop redundant indexes, optionally switch to the
+    compact layout, then ANALYZE and VACUUM. Returns storage stats from
+    before and after.
+    """
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        before = _storage_stats(conn)
+
+        conn.exec_driver_sql("BEGIN")
+        for name in REDUNDANT_INDEXES:
+            conn.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+
+        if compact and not _is_compact(conn):
+            compact_cities(conn)
+        conn.exec_driver_sql("COMMIT")
+
+    create_indexes(engine)
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("ANALYZE")
+        conn.exec_driver_sql("VACUUM")
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        after = _storage_stats(conn)
+
+    return {"before": before, "after": after}
@@ -0,0 +1,96 @@
+import sqlite3
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+# ---------------------------------------------------------
+# Stdlib-only read path
+# ---------------------------------------------------------
+#
+# For short-lived processes (cron, serverless, `main.py query`): plain
+# sqlite3 against the published cities.db generation, no SQLAlchemy and
+# no zoneinfo scan. Local hours come from the prebuilt timezone_offsets
+# schedule, so results match cities_at_time() ordered by population.
+# Instants past the stored schedule fall back to zoneinfo, zone by zone,
+# as cities_db.queries does.
+
+_CITIES_AT_TIME = """
+    SELECT c.name, c.state, c.country, c.population, t.name
+    FROM cities AS c
+    JOIN iana_timezones AS t ON t.id = c.timezone_id
+    WHERE c.timezone_id IN (
+        SELECT timezone_id
+        FROM timezone_offsets
+        WHERE starts_at <= :t
+          AND ends_at > :t
+          AND (:t + utc_offset) % 86400 BETWEEN :first_second AND :last_second
+    )
+    ORDER BY c.population DESC
+    LIMIT :limit
+"""
+
+
+_SCHEDULE_COVERS = """
+    SELECT EXISTS (
+        SELECT 1 FROM timezone_offsets WHERE starts_at <= :t AND ends_at > :t
+    )
+"""
+
+_CITIES_IN_ZONES = """
+    SELECT c.name, c.state, c.country, c.population, t.name
+    FROM cities AS c
+    JOIN iana_timezones AS t ON t.id = c.timezone_id
+    WHERE c.timezone_id IN ({ids})
+    ORDER BY c.population DESC
+    LIMIT ?
+"""
+
+
+def _zone_ids_live(conn: sqlite3.Connection, t: int, first_second: int, last_second: int) -> list[int]:
+    from zoneinfo import ZoneInfo
+
+    instant = datetime.fromtimestamp(t, timezone.utc)
+    ids = []
+    for tz_id, tz_name in conn.execute("SELECT id, name FROM iana_timezones"):
+        local = instant.astimezone(ZoneInfo(tz_name))
+        if first_second <= local.hour * 3600 + local.minute * 60 + local.second <= last_second:
+            ids.append(tz_id)
+    return ids
+
+
+def connect_readonly(db_path) -> sqlite3.Connection:
+    """Read-only connection to the generation `db_path` points at."""
+    path = Path(db_path).resolve()
+    if not path.exists():
+        raise FileNotFoundError(f"{db_path} does not exist, run the build first")
+    return sqlite3.connect(f"file:{path.as_posix()}?mode=ro", uri=True)
+
+
+def cities_at_hour_lite(
+    conn: sqlite3.Connection,
+    hour: int,
+    at: Optional[datetime] = None,
+    limit: int = 20,
+) -> list[tuple]:
+    """
+    (name, state, country, population, timezone) of the most populated
+    cities whose local time at `at` (default: now) is in `hour`.
+    """
+    t = int(at.timestamp() if at else time.time())
+    first_second, last_second = hour * 3600, hour * 3600 + 3599
+
+    (covered,), = conn.execute(_SCHEDULE_COVERS, {"t": t})
+    if not covered:
+        ids = _zone_ids_live(conn, t, first_second, last_second)
+        if not ids:
+            return []
+        sql = _CITIES_IN_ZONES.format(ids=",".join("?" * len(ids)))
+        return conn.execute(sql, (*ids, limit)).fetchall()
+
+    return conn.execute(_CITIES_AT_TIME, {
+        "t": t,
+        "first_second": first_second,
+        "last_second": last_second,
+        "limit": limit,
+    }).fetchall()
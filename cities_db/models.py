@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey
+from sqlalchemy import JSON, Column, Integer, String, Float, Boolean, ForeignKey, UniqueConstraint
 from sqlalchemy.orm import relationship
 from db.base import Base
 
@@ -24,3 +24,47 @@ class City(Base):
     timezone_id = Column(Integer, ForeignKey("iana_timezones.id"), nullable=False)
 
     timezone = relationship("IANATimezone")
+
+
+class TimezoneOffset(Base):
+    """
+    Constant-offset interval of one timezone: local time is
+    UTC + utc_offset for starts_at <= t < ends_at (epoch seconds).
+    """
+    __tablename__ = "timezone_offsets"
+
+    id = Column(Integer, primary_key=True)
+    timezone_id = Column(Integer, ForeignKey("iana_timezones.id"), nullable=False)
+    starts_at = Column(Integer, nullable=False)
+    ends_at = Column(Integer, nullable=False)
+    utc_offset = Column(Integer, nullable=False)
+    abbreviation = Column(String)
+    is_dst = Column(Boolean, nullable=False, default=False)
+
+    timezone = relationship("IANATimezone")
+
+
+class CityStats(Base):
+    """
+    Precomputed summary of the cities in one timezone (scope "timezone",
+    key = IANA name) or one country (scope "country", key = ISO code).
+    Rebuilt with the cities table.
+    """
+    __tablename__ = "city_stats"
+
+    id = Column(Integer, primary_key=True)
+    scope = Column(String, nullable=False)
+    key = Column(String, nullable=False)
+    city_count = Column(Integer, nullable=False)
+    total_population = Column(Integer, nullable=False)
+    max_population = Column(Integer, nullable=False)
+    min_population = Column(Integer, nullable=False)
+    largest_city_id = Column(Integer)
+    # {"p50": population, ...} (nearest rank)
+    quantiles = Column(JSON, nullable=False)
+    # {"15000": number of cities with population >= 15000, ...}
+    counts_above = Column(JSON, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("scope", "key"),
+    )
@@ -1,31 +1,89 @@
-from typing import Optional
-from sqlalchemy import select
-from cities_db.models import City, IANATimezone
-from services.timezone_service import timezones_at_hour
+import random
+from datetime import datetime, timezone
+from typing import Optional, Sequence
+from zoneinfo import ZoneInfo
+from sqlalchemy import Integer, column, exists, func, select, values
+from cities_db.models import City, CityStats, IANATimezone, TimezoneOffset
+from db.diagnostics import instrumented
+from services.timezone_service import local_hours_by_timezone, timezones_at_hour
 from utils.round_robin import round_robin
 
-def cities_at_hour(
+# ---------------------------------------------------------
+# Result modes
+# ---------------------------------------------------------
+#
+# Every city query returns City ORM instances by default. With rows=True
+# it instead runs a Core SELECT joined to iana_timezones and returns
+# lightweight Row tuples (attribute access, __slots__, no identity map)
+# holding only the requested columns.
+
+ROW_COLUMNS = {
+    "id": City.id,
+    "name": City.name,
+    "state": City.state,
+    "state_code": City.state_code,
+    "country": City.country,
+    "country_code": City.country_code,
+    "latitude": City.latitude,
+    "longitude": City.longitude,
+    "population": City.population,
+    "timezone": IANATimezone.name,
+}
+
+DEFAULT_ROW_COLUMNS = (
+    "name",
+    "state",
+    "country",
+    "country_code",
+    "population",
+    "timezone",
+)
+
+
+def _row_columns(columns: Optional[Sequence[str]], round_robin_by: Optional[str]):
+    names = list(columns or DEFAULT_ROW_COLUMNS)
+
+    # round_robin() groups on an attribute, so it has to be selected
+    if round_robin_by and round_robin_by not in names:
+        names.append(round_robin_by)
+
+    unknown = [n for n in names if n not in ROW_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown city columns: {unknown}")
+
+    return [ROW_COLUMNS[n].label(n) for n in names]
+
+
+def _fetch_cities(
     session,
-    hour: int,
+    criteria,
+    order_by=None,
     limit: Optional[int] = None,
     round_robin_by: Optional[str] = None,
+    rows: bool = False,
+    columns: Optional[Sequence[str]] = None,
+    offset: Optional[int] = None,
 ):
-    tz_names = timezones_at_hour(session, hour)
+    if rows:
+        query = (
+            select(*_row_columns(columns, round_robin_by))
+            .select_from(City)
+            .join(IANATimezone, City.timezone_id == IANATimezone.id)
+            .where(*criteria)
+        )
+    else:
+        query = session.query(City).filter(*criteria)
 
-    tz_ids_stmt = (
-        select(IANATimezone.id)
-        .where(IANATimezone.name.in_(tz_names))
-    )
-
-    query = (
-        session.query(City)
-        .filter(City.timezone_id.in_(tz_ids_stmt))
-    )
+    if order_by is not None:
+        query = query.order_by(*order_by) if isinstance(order_by, tuple) else query.order_by(order_by)
 
     if limit is not None:
         query = query.limit(limit)
 
-    cities = query.all()
+    if offset:
+        query = query.offset(offset)
+
+    cities = session.execute(query).all() if rows else query.all()
 
     if round_robin_by:
         cities = round_robin(cities, round_robin_by)
@@ -33,102 +91,607 @@ def cities_at_hour(
     return cities
 
 
+def _timezone_ids(tz_names: Sequence[str]):
+    return (
+        select(IANATimezone.id)
+        .where(IANATimezone.name.in_(tz_names))
+    )
+
+
+def _timezone_ids_at_hour(session, hour: int):
+    return _timezone_ids(timezones_at_hour(session, hour))
+
+
+def _timezone_id(tz_name: str):
+    return (
+        select(IANATimezone.id)
+        .where(IANATimezone.name == tz_name)
+        .scalar_subquery()
+    )
+
+
+# ---------------------------------------------------------
+# City queries
+# ---------------------------------------------------------
+
+@instrumented
+def cities_at_hour(
+    session,
+    hour: int,
+    limit: Optional[int] = None,
+    round_robin_by: Optional[str] = None,
+    rows: bool = False,
+    columns: Optional[Sequence[str]] = None,
+    offset: Optional[int] = None,
+):
+    return _fetch_cities(
+        session,
+        [City.timezone_id.in_(_timezone_ids_at_hour(session, hour))],
+        limit=limit,
+        round_robin_by=round_robin_by,
+        rows=rows,
+        columns=columns,
+        offset=offset,
+    )
+
+
+@instrumented
 def cities_in_timezone(
     session,
     tz_name: str,
     limit: Optional[int] = None,
     round_robin_by: Optional[str] = None,
+    rows: bool = False,
+    columns: Optional[Sequence[str]] = None,
 ):
-    tz_id_subq = (
-        select(IANATimezone.id)
-        .where(IANATimezone.name == tz_name)
-        .scalar_subquery()
+    return _fetch_cities(
+        session,
+        [City.timezone_id == _timezone_id(tz_name)],
+        limit=limit,
+        round_robin_by=round_robin_by,
+        rows=rows,
+        columns=columns,
     )
 
-    query = (
-        session.query(City)
-        .filter(City.timezone_id == tz_id_subq)
+
+@instrumented
+def top_cities_by_population_in_timezone(
+    session,
+    tz_name: str,
+    limit: Optional[int] = None,
+    rows: bool = False,
+    columns: Optional[Sequence[str]] = None,
+):
+    return _fetch_cities(
+        session,
+        [City.timezone_id == _timezone_id(tz_name)],
+        order_by=City.population.desc(),
+        limit=limit,
+        rows=rows,
+        columns=columns,
     )
 
-    if limit is not None:
-        query = query.limit(limit)
+@instrumented
+def bottom_cities_by_population_in_timezone(
+    session,
+    tz_name: str,
+    limit: Optional[int] = None,
+    rows: bool = False,
+    columns: Optional[Sequence[str]] = None,
+):
+    return _fetch_cities(
+        session,
+        [City.timezone_id == _timezone_id(tz_name)],
+        order_by=City.population.asc(),
+        limit=limit,
+        rows=rows,
+        columns=columns,
+    )
 
-    cities = query.all()
+@instrumented
+def cities_in_timezones(
+    session,
+    tz_names: Sequence[str],
+    limit: Optional[int] = None,
+    round_robin_by: Optional[str] = None,
+    rows: bool = False,
+    columns: Optional[Sequence[str]] = None,
+    offset: Optional[int] = None,
+):
+    """Cities in any of `tz_names`, e.g. the zones at an hour resolved once."""
+    return _fetch_cities(
+        session,
+        [City.timezone_id.in_(_timezone_ids(tz_names))],
+        limit=limit,
+        round_robin_by=round_robin_by,
+        rows=rows,
+        columns=columns,
+        offset=offset,
+    )
 
-    if round_robin_by:
-        cities = round_robin(cities, round_robin_by)
+@instrumented
+def top_cities_by_population_in_timezones(
+    session,
+    tz_names: Sequence[str],
+    limit: Optional[int] = None,
+    rows: bool = False,
+    columns: Optional[Sequence[str]] = None,
+    offset: Optional[int] = None,
+):
+    """Same order as top_cities_by_population_at_hour (ties by city id)."""
+    return _fetch_cities(
+        session,
+        [City.timezone_id.in_(_timezone_ids(tz_names))],
+        order_by=(City.population.desc(), City.id),
+        limit=limit,
+        rows=rows,
+        columns=columns,
+        offset=offset,
+    )
 
-    return cities
+@instrumented
+def top_cities_by_population_at_hour(
+    session,
+    hour: int,
+    limit: Optional[int] = None,
+    rows: bool = False,
+    columns: Optional[Sequence[str]] = None,
+    offset: Optional[int] = None,
+):
+    """Pages with `offset` are stable: ties are broken by city id."""
+    return _fetch_cities(
+        session,
+        [City.timezone_id.in_(_timezone_ids_at_hour(session, hour))],
+        order_by=(City.population.desc(), City.id),
+        limit=limit,
+        rows=rows,
+        columns=columns,
+        offset=offset,
+    )
+
+@instrumented
+def bottom_cities_by_population_at_hour(
+    session,
+    hour: int,
+    limit: Optional[int] = None,
+    rows: bool = False,
+    columns: Optional[Sequence[str]] = None,
+):
+    return _fetch_cities(
+        session,
+        [City.timezone_id.in_(_timezone_ids_at_hour(session, hour))],
+        order_by=City.population.asc(),
+        limit=limit,
+        rows=rows,
+        columns=columns,
+    )
 
+@instrumented
+def random_city_at_hour(
+    session,
+    hour: int,
+    rows: bool = False,
+    columns: Optional[Sequence[str]] = None,
+    rng=random,
+):
+    """
+    One uniformly random city at `hour` (None if there is none): a COUNT
+    and a single-row OFFSET instead of ORDER BY RANDOM() over every row.
+    """
+    criteria = [City.timezone_id.in_(_timezone_ids_at_hour(session, hour))]
 
+    count = session.scalar(select(func.count()).select_from(City).where(*criteria))
+    if not count:
+        return None
 
-def top_cities_by_population_in_timezone(session, tz_name: str, limit: Optional[int] = None):
-    query = (
-        session.query(City)
-        .join(City.timezone)
-        .filter(IANATimezone.name == tz_name)
-        .order_by(City.population.desc())
+    cities = _fetch_cities(
+        session,
+        criteria,
+        order_by=City.id,
+        limit=1,
+        rows=rows,
+        columns=columns,
+        offset=rng.randrange(count),
     )
-    
-    if limit is not None:
-        query = query.limit(limit)
-    
-    return query.all()
+    return cities[0]
 
-def bottom_cities_by_population_in_timezone(session, tz_name: str, limit: Optional[int] = None):
-    query = (
-        session.query(City)
-        .join(City.timezone)
-        .filter(IANATimezone.name == tz_name)
-        .order_by(City.population.asc())
+@instrumented
+def cities_by_country(
+    session,
+    country_code: str,
+    rows: bool = False,
+    columns: Optional[Sequence[str]] = None,
+):
+    return _fetch_cities(
+        session,
+        [City.country_code == country_code],
+        rows=rows,
+        columns=columns,
     )
-    
-    if limit is not None:
-        query = query.limit(limit)
-    
-    return query.all()
 
-def top_cities_by_population_at_hour(session, hour: int, limit: Optional[int] = None):
-    tz_names = timezones_at_hour(session, hour)
+@instrumented
+def cities_by_hour(session, top_n: int = 5, now_utc: Optional[datetime] = None) -> list[dict]:
+    """
+    All 24 local hours at once: per hour the number of cities, their total
+    population and the top_n cities by population.
 
-    tz_ids_stmt = (
-        select(IANATimezone.id)
-        .where(IANATimezone.name.in_(tz_names))
+    Each zone's local hour is computed once and joined in as a VALUES
+    table, so the whole dashboard is a single grouped query.
+    """
+    buckets = [
+        {"hour": hour, "city_count": 0, "total_population": 0, "top_cities": []}
+        for hour in range(24)
+    ]
+
+    tz_hours = local_hours_by_timezone(session, now_utc)
+    if not tz_hours:
+        return buckets
+
+    hours = (
+        values(
+            column("timezone_id", Integer),
+            column("hour", Integer),
+            name="tz_hours",
+        )
+        .data(list(tz_hours.items()))
+        .cte()
     )
 
-    query = (
-        session.query(City)
-        .filter(City.timezone_id.in_(tz_ids_stmt))
-        .order_by(City.population.desc())
+    # Rank on narrow (id, hour, population) rows; names are only joined
+    # back in for the rows that make the cut.
+    by_hour = {"partition_by": hours.c.hour}
+
+    ranked = (
+        select(
+            City.id,
+            hours.c.hour,
+            func.count().over(**by_hour).label("city_count"),
+            func.sum(City.population).over(**by_hour).label("total_population"),
+            func.row_number().over(
+                order_by=City.population.desc(), **by_hour
+            ).label("rank"),
+        )
+        .join(hours, City.timezone_id == hours.c.timezone_id)
+        .subquery()
+    )
+
+    stmt = (
+        select(
+            ranked.c.hour,
+            ranked.c.city_count,
+            ranked.c.total_population,
+            ranked.c.rank,
+            City.name,
+            City.state,
+            City.country,
+            City.population,
+            IANATimezone.name.label("timezone"),
+        )
+        .join(City, City.id == ranked.c.id)
+        .join(City.timezone)
+        .where(ranked.c.rank <= max(top_n, 1))
+        .order_by(ranked.c.hour, ranked.c.rank)
     )
-    
-    if limit is not None:
-        query = query.limit(limit)
-    
-    return query.all()
 
-def bottom_cities_by_population_at_hour(session, hour: int, limit: Optional[int] = None):
-    tz_names = timezones_at_hour(session, hour)
+    for row in session.execute(stmt):
+        bucket = buckets[row.hour]
+        bucket["city_count"] = row.city_count
+        bucket["total_population"] = row.total_population or 0
 
-    tz_ids_stmt = (
-        select(IANATimezone.id)
-        .where(IANATimezone.name.in_(tz_names))
+        if row.rank <= top_n:
+            bucket["top_cities"].append({
+                "city": row.name,
+                "state": row.state,
+                "country": row.country,
+                "population": row.population,
+                "timezone": row.timezone,
+            })
+
+    return buckets
+
+
+# ---------------------------------------------------------
+# City statistics (city_stats)
+# ---------------------------------------------------------
+
+STATS_FIELDS = (
+    "city_count",
+    "total_population",
+    "max_population",
+    "min_population",
+    "largest_city_id",
+    "quantiles",
+    "counts_above",
+)
+
+
+def _stats_scope(tz_name: Optional[str], country_code: Optional[str]) -> tuple[str, str]:
+    if (tz_name is None) == (country_code is None):
+        raise ValueError("Pass exactly one of tz_name or country_code")
+
+    if tz_name is not None:
+        return "timezone", tz_name
+    return "country", country_code
+
+
+def _stats_dict(stats: CityStats) -> dict:
+    return {field: getattr(stats, field) for field in STATS_FIELDS}
+
+
+@instrumented
+def city_stats(
+    session,
+    tz_name: Optional[str] = None,
+    country_code: Optional[str] = None,
+) -> Optional[dict]:
+    """
+    Precomputed summary of one timezone or one country (see
+    cities_db.importer.build_city_stats), or None if it has no cities.
+    """
+    scope, key = _stats_scope(tz_name, country_code)
+
+    stats = session.execute(
+        select(CityStats)
+        .where(CityStats.scope == scope)
+        .where(CityStats.key == key)
+    ).scalar_one_or_none()
+
+    return _stats_dict(stats) if stats is not None else None
+
+
+@instrumented
+def all_city_stats(session, scope: str = "timezone") -> dict[str, dict]:
+    """
+    Summaries of every timezone ("timezone") or country ("country"),
+    keyed by IANA name or country code.
+    """
+    stmt = (
+        select(CityStats)
+        .where(CityStats.scope == scope)
+        .order_by(CityStats.key)
     )
 
-    query = (
-        session.query(City)
-        .filter(City.timezone_id.in_(tz_ids_stmt))
-        .order_by(City.population.asc())
+    return {
+        stats.key: _stats_dict(stats)
+        for stats in session.execute(stmt).scalars()
+    }
+
+
+@instrumented
+def count_cities_above(
+    session,
+    min_population: int,
+    tz_name: Optional[str] = None,
+    country_code: Optional[str] = None,
+) -> int:
+    """
+    Number of cities with population >= min_population in one timezone or
+    country. Answered from city_stats when the threshold is outside the
+    population range or one of the stored thresholds; otherwise a single
+    indexed range count.
+    """
+    stats = city_stats(session, tz_name, country_code)
+
+    if stats is None or min_population > stats["max_population"]:
+        return 0
+    if min_population <= stats["min_population"]:
+        return stats["city_count"]
+
+    exact = stats["counts_above"].get(str(min_population))
+    if exact is not None:
+        return exact
+
+    if tz_name is not None:
+        criteria = City.timezone_id == _timezone_id(tz_name)
+    else:
+        criteria = City.country_code == country_code
+
+    return session.execute(
+        select(func.count())
+        .select_from(City)
+        .where(criteria)
+        .where(City.population >= min_population)
+    ).scalar_one()
+
+
+@instrumented
+def largest_city(
+    session,
+    tz_name: Optional[str] = None,
+    country_code: Optional[str] = None,
+    rows: bool = False,
+    columns: Optional[Sequence[str]] = None,
+):
+    """
+    Most populous city of one timezone or country, looked up by the id
+    stored in city_stats. None if there is none.
+    """
+    stats = city_stats(session, tz_name, country_code)
+    if stats is None or stats["largest_city_id"] is None:
+        return None
+
+    cities = _fetch_cities(
+        session,
+        [City.id == stats["largest_city_id"]],
+        rows=rows,
+        columns=columns,
     )
-    
-    if limit is not None:
-        query = query.limit(limit)
-    
-    return query.all()
+    return cities[0] if cities else None
+
+
+# ---------------------------------------------------------
+# Offset schedule (timezone_offsets) queries
+# ---------------------------------------------------------
+
+def _epoch(at: Optional[datetime]) -> int:
+    return int((at or datetime.now(timezone.utc)).timestamp())
+
+
+def _timezone_ids_at_time(session, hour: int, at: Optional[datetime], minute_from: int, minute_to: int):
+    """
+    Ids of the zones whose local time at `at` is in hour:minute_from..
+    hour:minute_to: a subquery on the offset schedule, or, for instants
+    outside the stored schedule, ids computed live with zoneinfo.
+    """
+    t = _epoch(at)
+    first_second = hour * 3600 + minute_from * 60
+    last_second = hour * 3600 + minute_to * 60 + 59
+
+    covered = session.scalar(select(exists().where(
+        TimezoneOffset.starts_at <= t,
+        TimezoneOffset.ends_at > t,
+    )))
+
+    if not covered:
+        instant = datetime.fromtimestamp(t, timezone.utc)
+        ids = []
+        for tz_id, tz_name in session.execute(select(IANATimezone.id, IANATimezone.name)):
+            local = instant.astimezone(ZoneInfo(tz_name))
+            if first_second <= local.hour * 3600 + local.minute * 60 + local.second <= last_second:
+                ids.append(tz_id)
+        return ids
+
+    local_second = (t + TimezoneOffset.utc_offset) % 86400
 
-def cities_by_country(session, country_code: str):
     return (
-        session.query(City)
-        .filter(City.country_code == country_code)
-        .all()
+        select(TimezoneOffset.timezone_id)
+        .where(TimezoneOffset.starts_at <= t)
+        .where(TimezoneOffset.ends_at > t)
+        .where(local_second.between(first_second, last_second))
+    )
+
+
+@instrumented
+def timezones_at_time(
+    session,
+    hour: int,
+    at: Optional[datetime] = None,
+    minute_from: int = 0,
+    minute_to: int = 59,
+) -> list[str]:
+    """
+    Timezones whose local time at instant `at` (default: now) falls in
+    hour:minute_from..hour:minute_to. Instants outside the stored offset
+    schedule are resolved with zoneinfo instead.
+    """
+    stmt = (
+        select(IANATimezone.name)
+        .where(IANATimezone.id.in_(
+            _timezone_ids_at_time(session, hour, at, minute_from, minute_to)
+        ))
+        .order_by(IANATimezone.name)
     )
+
+    return list(session.execute(stmt).scalars())
+
+
+@instrumented
+def cities_at_time(
+    session,
+    hour: int,
+    at: Optional[datetime] = None,
+    minute_from: int = 0,
+    minute_to: int = 59,
+    limit: Optional[int] = None,
+    round_robin_by: Optional[str] = None,
+    rows: bool = False,
+    columns: Optional[Sequence[str]] = None,
+):
+    return _fetch_cities(
+        session,
+        [City.timezone_id.in_(
+            _timezone_ids_at_time(session, hour, at, minute_from, minute_to)
+        )],
+        limit=limit,
+        round_robin_by=round_robin_by,
+        rows=rows,
+        columns=columns,
+    )
+
+
+def _cities_at_time_criteria(session, hour: int, at: Optional[datetime], min_population: Optional[int]):
+    criteria = [City.timezone_id.in_(_timezone_ids_at_time(session, hour, at, 0, 59))]
+    if min_population:
+        criteria.append(City.population >= min_population)
+    return criteria
+
+
+@instrumented
+def top_cities_at_time(
+    session,
+    hour: int,
+    at: Optional[datetime] = None,
+    min_population: Optional[int] = None,
+    limit: Optional[int] = None,
+    rows: bool = False,
+    columns: Optional[Sequence[str]] = None,
+    offset: Optional[int] = None,
+):
+    """
+    Cities whose local time at `at` (default: now) is in `hour` and with
+    at least `min_population`, most populated first (ties by id).
+    """
+    return _fetch_cities(
+        session,
+        _cities_at_time_criteria(session, hour, at, min_population),
+        order_by=(City.population.desc(), City.id),
+        limit=limit,
+        rows=rows,
+        columns=columns,
+        offset=offset,
+    )
+
+
+@instrumented
+def count_cities_at_time(
+    session,
+    hour: int,
+    at: Optional[datetime] = None,
+    min_population: Optional[int] = None,
+) -> int:
+    stmt = (
+        select(func.count())
+        .select_from(City)
+        .where(*_cities_at_time_criteria(session, hour, at, min_population))
+    )
+    return session.scalar(stmt)
+
+
+@instrumented
+def max_population_at_time(session, hour: int, at: Optional[datetime] = None) -> Optional[int]:
+    """Largest population at `hour` (an index seek per zone), None if no city."""
+    stmt = select(func.max(City.population)).where(*_cities_at_time_criteria(session, hour, at, None))
+    return session.scalar(stmt)
+
+
+def next_local_time(
+    session,
+    tz_name: str,
+    hour: int,
+    minute: int = 0,
+    after: Optional[datetime] = None,
+) -> Optional[datetime]:
+    """
+    First UTC instant strictly after `after` (default: now) at which the
+    local time in `tz_name` reads hour:minute, or None if that lies past
+    the stored schedule. Times skipped by DST are never matched.
+    """
+    t = _epoch(after) + 1
+    target = hour * 3600 + minute * 60
+
+    stmt = (
+        select(TimezoneOffset.starts_at, TimezoneOffset.ends_at, TimezoneOffset.utc_offset)
+        .join(TimezoneOffset.timezone)
+        .where(IANATimezone.name == tz_name)
+        .where(TimezoneOffset.ends_at > t)
+        .order_by(TimezoneOffset.starts_at)
+    )
+
+    for starts_at, ends_at, utc_offset in session.execute(stmt):
+        base = max(starts_at, t)
+        candidate = base + (target - (base + utc_offset)) % 86400
+
+        if candidate < ends_at:
+            return datetime.fromtimestamp(candidate, timezone.utc)
+
+    return None
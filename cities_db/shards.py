@@ -0,0 +1,365 @@
+import heapq
+import json
+from datetime import datetime, timezone
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Optional, Sequence
+
+from sqlalchemy import func, select
+from sqlalchemy.engine import IteratorResult
+from sqlalchemy.engine.result import SimpleResultMetaData
+
+from cities_db import queries
+from cities_db.importer import create_indexes, optimize_cities_db
+from cities_db.models import City, CityStats, IANATimezone, TimezoneOffset
+from config import CITIES_DB_PATH, SHARD_MANIFEST_FILE_NAME, SHARDS_DIR
+from db.base import Base
+from db.generations import begin_generation, current_generation, publish_generation
+from db.session import create_session, get_engine
+from services.timezone_service import timezones_at_hour
+from utils.round_robin import round_robin
+
+# ---------------------------------------------------------
+# Shards by UTC offset group
+# ---------------------------------------------------------
+#
+# A zone's group is its base offset (the smallest UTC offset in its
+# stored schedule, i.e. standard time) rounded down to the hour:
+# Europe/Paris is in +01 all year, Asia/Kolkata (+05:30) in +05. Zones
+# at the same local hour share their current offset, so an hour query
+# lands on one shard, or two or three around DST and half-hour zones.
+#
+# Each shard is a cities.db of its own: every iana_timezones row (ids
+# stay the same), plus the cities, offsets and per-timezone city_stats
+# of its zones. Country stats span shards and stay in cities.db. Shards
+# are published as generations (db/generations.py) under SHARDS_DIR and
+# the manifest is replaced after all of them.
+
+
+def _group_label(group: int) -> str:
+    return f"{group:+03d}"
+
+
+def _shard_file_name(group: int) -> str:
+    return f"cities-utc{_group_label(group)}.db"
+
+
+def _zone_groups(session) -> dict[int, list[tuple[int, str, int]]]:
+    """Group -> [(timezone id, name, city count)] for zones with cities."""
+    base_offsets = dict(session.execute(
+        select(TimezoneOffset.timezone_id, func.min(TimezoneOffset.utc_offset))
+        .group_by(TimezoneOffset.timezone_id)
+    ).all())
+
+    stmt = (
+        select(IANATimezone.id, IANATimezone.name, func.count(City.id))
+        .join(City, City.timezone_id == IANATimezone.id)
+        .group_by(IANATimezone.id)
+        .order_by(IANATimezone.name)
+    )
+
+    groups: dict[int, list] = {}
+    for tz_id, tz_name, city_count in session.execute(stmt):
+        # Zones outside the schedule are filed under +00
+        group = (base_offsets.get(tz_id) or 0) // 3600
+        groups.setdefault(group, []).append((tz_id, tz_name, city_count))
+
+    return groups
+
+
+def _copy_shard(source: Path, shard_path: Path, zones: list[tuple[int, str, int]]):
+    engine = get_engine(shard_path)
+
+    Base.metadata.create_all(
+        engine,
+        tables=[
+            IANATimezone.__table__,
+            City.__table__,
+            TimezoneOffset.__table__,
+            CityStats.__table__,
+        ],
+    )
+
+    ids = ",".join(str(tz_id) for tz_id, _, _ in zones)
+    city_columns = ", ".join(column.name for column in City.__table__.columns)
+
+    # ATTACH / DETACH cannot run inside a transaction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("ATTACH DATABASE ? AS src", (str(source),))
+
+        conn.exec_driver_sql("BEGIN")
+        conn.exec_driver_sql("INSERT INTO iana_timezones SELECT id, name FROM src.iana_timezones")
+        # Explicit columns: cities is a view over city_data in the compact layout
+        conn.exec_driver_sql(f"""
+            INSERT INTO cities ({city_columns})
+            SELECT {city_columns} FROM src.cities WHERE timezone_id IN ({ids})
+            ORDER BY id
+        """)
+        conn.exec_driver_sql(f"""
+            INSERT INTO timezone_offsets
+            SELECT * FROM src.timezone_offsets WHERE timezone_id IN ({ids})
+        """)
+        conn.exec_driver_sql(f"""
+            INSERT INTO city_stats
+            SELECT s.* FROM src.city_stats s
+            JOIN src.iana_timezones z ON s.scope = 'timezone' AND s.key = z.name
+            WHERE z.id IN ({ids})
+        """)
+        conn.exec_driver_sql("COMMIT")
+
+        conn.exec_driver_sql("DETACH DATABASE src")
+
+    create_indexes(engine)
+    optimize_cities_db(engine)
+
+
+def build_shards(source_db=CITIES_DB_PATH, shards_dir: Path = SHARDS_DIR) -> dict:
+    """
+    Split the live `source_db` into one shard per offset group and write
+    the manifest:
+
+        {"source": ..., "built_at": ..., "shards": [
+            {"group": "+01", "file": "cities-utc+01.db",
+             "timezones": [...], "cities": 12345, "bytes": ...}, ...]}
+    """
+    source = current_generation(source_db)
+    if source is None:
+        raise FileNotFoundError(source_db)
+
+    shards_dir.mkdir(parents=True, exist_ok=True)
+
+    session, _ = create_session(source_db, profile="reader")
+    try:
+        groups = _zone_groups(session)
+    finally:
+        session.close()
+
+    shards = []
+    for group, zones in sorted(groups.items()):
+        live_path = shards_dir / _shard_file_name(group)
+        shard_path = begin_generation(live_path)
+
+        _copy_shard(source, shard_path, zones)
+        publish_generation(live_path, shard_path)
+
+        shards.append({
+            "group": _group_label(group),
+            "file": live_path.name,
+            "timezones": [tz_name for _, tz_name, _ in zones],
+            "cities": sum(city_count for _, _, city_count in zones),
+            "bytes": shard_path.stat().st_size,
+        })
+
+    manifest = {
+        "source": source.name,
+        "built_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "shards": shards,
+    }
+
+    manifest_path = shards_dir / SHARD_MANIFEST_FILE_NAME
+    tmp_path = manifest_path.with_suffix(".tmp")
+
+    with tmp_path.open("w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    tmp_path.replace(manifest_path)
+
+    return manifest
+
+
+# ---------------------------------------------------------
+# Router
+# ---------------------------------------------------------
+
+class ShardUnavailable(LookupError):
+    """A query needs shards this node does not hold."""
+
+    def __init__(self, groups: Sequence[str]):
+        super().__init__(f"Shards not held here: {', '.join(groups)}")
+        self.groups = list(groups)
+
+
+def _top_key(city):
+    # population DESC (NULLs last, as SQLite sorts them), then id
+    return (city.population is None, -(city.population or 0), city.id)
+
+
+def _project(rows, names: Sequence[str]) -> list:
+    """The same rows as Row tuples holding only `names`."""
+    names = list(names)
+    return IteratorResult(
+        SimpleResultMetaData(names),
+        (tuple(row._mapping[name] for name in names) for row in rows),
+    ).all()
+
+
+class ShardRouter:
+    """
+    Answers hour and timezone queries from the shards in `shards_dir`,
+    touching only the shards that hold the zones asked for.
+
+    `groups` limits the router to a subset of shards (e.g. ["+01",
+    "+02"]) for nodes that carry only part of the data; by default every
+    shard present on disk is used. A query that needs any other shard
+    raises ShardUnavailable rather than returning partial results.
+
+    ORM results come back detached from their (closed) shard sessions,
+    with their timezone loaded.
+    """
+
+    def __init__(self, shards_dir: Path = SHARDS_DIR, groups: Optional[Iterable[str]] = None):
+        self.shards_dir = Path(shards_dir)
+        manifest = json.loads((self.shards_dir / SHARD_MANIFEST_FILE_NAME).read_text(encoding="utf-8"))
+
+        self.shards = {shard["group"]: shard for shard in manifest["shards"]}
+        self.zone_groups = {
+            tz_name: shard["group"]
+            for shard in manifest["shards"]
+            for tz_name in shard["timezones"]
+        }
+
+        wanted = set(self.shards) if groups is None else set(groups)
+        self.held = sorted(
+            group for group in wanted
+            if group in self.shards and (self.shards_dir / self.shards[group]["file"]).exists()
+        )
+
+    def _session(self, group: str):
+        session, _ = create_session(self.shards_dir / self.shards[group]["file"], profile="reader")
+        return session
+
+    def route(self, tz_names: Iterable[str]) -> dict[str, list[str]]:
+        """Group -> the given zones it holds. Zones without cities are dropped."""
+        by_group: dict[str, list[str]] = {}
+        for tz_name in tz_names:
+            group = self.zone_groups.get(tz_name)
+            if group is not None:
+                by_group.setdefault(group, []).append(tz_name)
+
+        missing = sorted(set(by_group) - set(self.held))
+        if missing:
+            raise ShardUnavailable(missing)
+
+        return dict(sorted(by_group.items()))
+
+    def timezones_at_hour(self, hour: int) -> list[str]:
+        if not self.held:
+            raise ShardUnavailable(sorted(self.shards))
+
+        # Every shard carries the full iana_timezones table
+        session = self._session(self.held[0])
+        try:
+            return timezones_at_hour(session, hour)
+        finally:
+            session.close()
+
+    def _query(self, group: str, fn, *args, **kwargs):
+        session = self._session(group)
+        try:
+            result = fn(session, *args, **kwargs)
+
+            # Load the timezone while the session is open; rows are
+            # detached on close
+            for city in result:
+                if isinstance(city, City):
+                    city.timezone
+
+            return result
+        finally:
+            session.close()
+
+    # -------------------------------------------------
+    # Queries (same arguments and results as cities_db.queries)
+    # -------------------------------------------------
+
+    def cities_at_hour(
+        self,
+        hour: int,
+        limit: Optional[int] = None,
+        round_robin_by: Optional[str] = None,
+        rows: bool = False,
+        columns: Optional[Sequence[str]] = None,
+        offset: Optional[int] = None,
+    ):
+        """Unordered like queries.cities_at_hour: shards are read in group order."""
+        offset = offset or 0
+        wanted = None if limit is None else offset + limit
+
+        if rows and round_robin_by:
+            # Shuffled after the merge, so it has to be selected
+            columns = list(columns or queries.DEFAULT_ROW_COLUMNS)
+            if round_robin_by not in columns:
+                columns.append(round_robin_by)
+
+        cities = []
+        for group, tz_names in self.route(self.timezones_at_hour(hour)).items():
+            remaining = None if wanted is None else wanted - len(cities)
+            if remaining == 0:
+                break
+            cities.extend(self._query(
+                group, queries.cities_in_timezones, tz_names, remaining,
+                rows=rows, columns=columns,
+            ))
+
+        cities = cities[offset:wanted]
+
+        if round_robin_by:
+            cities = round_robin(cities, round_robin_by)
+
+        return cities
+
+    def top_cities_by_population_at_hour(
+        self,
+        hour: int,
+        limit: Optional[int] = None,
+        rows: bool = False,
+        columns: Optional[Sequence[str]] = None,
+        offset: Optional[int] = None,
+    ):
+        """
+        Each shard returns its own top offset + limit; the sorted lists
+        are merged on (population DESC, id), the order a single
+        database uses.
+        """
+        offset = offset or 0
+        wanted = None if limit is None else offset + limit
+
+        requested = None
+        if rows:
+            # The merge compares population and id; they are dropped
+            # again afterwards unless the caller asked for them
+            requested = list(columns or queries.DEFAULT_ROW_COLUMNS)
+            columns = requested + [name for name in ("population", "id") if name not in requested]
+
+        per_shard = [
+            self._query(
+                group, queries.top_cities_by_population_in_timezones, tz_names, wanted,
+                rows=rows, columns=columns,
+            )
+            for group, tz_names in self.route(self.timezones_at_hour(hour)).items()
+        ]
+
+        cities = list(islice(heapq.merge(*per_shard, key=_top_key), offset, wanted))
+
+        if requested is not None and len(requested) < len(columns):
+            cities = _project(cities, requested)
+
+        return cities
+
+    def cities_in_timezone(
+        self,
+        tz_name: str,
+        limit: Optional[int] = None,
+        round_robin_by: Optional[str] = None,
+        rows: bool = False,
+        columns: Optional[Sequence[str]] = None,
+    ):
+        routed = self.route([tz_name])
+        if not routed:
+            return []
+
+        (group, _), = routed.items()
+        return self._query(
+            group, queries.cities_in_timezone, tz_name, limit, round_robin_by,
+            rows=rows, columns=columns,
+        )
@@ -0,0 +1,163 @@
+import heapq
+import time
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+from cities_db.lite_queries import connect_readonly
+
+# ---------------------------------------------------------
+# In-memory cities snapshot
+# ---------------------------------------------------------
+#
+# Everything an hour query needs, loaded once from cities.db into a few
+# flat buffers: a UTF-8 name blob with offsets, interned country / state
+# tables, typed arrays for population and per-zone row ranges, and the
+# timezone_offsets schedule. Array and bytes payloads live outside the
+# object headers, so after fork() workers read them without dirtying a
+# page (see services/prefork_server.py).
+#
+# Rows are ordered by (timezone, population DESC), so each zone is one
+# contiguous, already sorted range.
+
+
+class CitySnapshot:
+    def __init__(self, db_path):
+        conn = connect_readonly(db_path)
+        try:
+            self._load(conn)
+        finally:
+            conn.close()
+
+        # Per-process memo of zones_at_hour for the current minute
+        self._zones_minute = None
+        self._zones_cache: dict[int, list[int]] = {}
+
+    def _load(self, conn):
+        zones = conn.execute("SELECT id, name FROM iana_timezones ORDER BY id").fetchall()
+        self.timezones = tuple(name for _, name in zones)
+        tz_index = {tz_id: i for i, (tz_id, _) in enumerate(zones)}
+
+        countries: dict = {}
+        states: dict = {}
+        names = bytearray()
+
+        self.name_offsets = array("I", [0])
+        self.population = array("q")
+        self.country_idx = array("I")
+        self.state_idx = array("I")
+        self.tz_start = array("I", [0] * len(self.timezones))
+        self.tz_end = array("I", [0] * len(self.timezones))
+
+        rows = conn.execute(
+            "SELECT timezone_id, name, state, country, COALESCE(population, 0) "
+            "FROM cities ORDER BY timezone_id, population DESC, id"
+        )
+        for i, (tz_id, name, state, country, population) in enumerate(rows):
+            z = tz_index[tz_id]
+            if self.tz_end[z] == 0:
+                self.tz_start[z] = i
+            self.tz_end[z] = i + 1
+
+            names += name.encode("utf-8")
+            self.name_offsets.append(len(names))
+            self.population.append(population)
+            self.country_idx.append(countries.setdefault(country, len(countries)))
+            self.state_idx.append(states.setdefault(state, len(states)))
+
+        self.names = bytes(names)
+        self.countries = tuple(countries)
+        self.states = tuple(states)
+
+        # timezone_offsets flattened per zone: intervals of zone z are
+        # off_ptr[z]:off_ptr[z + 1], sorted by start
+        self.off_ptr = array("I", [0])
+        self.off_start = array("q")
+        self.off_end = array("q")
+        self.off_utc = array("i")
+
+        intervals = conn.execute(
+            "SELECT timezone_id, starts_at, ends_at, utc_offset "
+            "FROM timezone_offsets ORDER BY timezone_id, starts_at"
+        ).fetchall()
+        by_zone: dict[int, list] = {}
+        for tz_id, starts_at, ends_at, utc_offset in intervals:
+            by_zone.setdefault(tz_index[tz_id], []).append((starts_at, ends_at, utc_offset))
+
+        for z in range(len(self.timezones)):
+            for starts_at, ends_at, utc_offset in by_zone.get(z, ()):
+                self.off_start.append(starts_at)
+                self.off_end.append(ends_at)
+                self.off_utc.append(utc_offset)
+            self.off_ptr.append(len(self.off_start))
+
+    def __len__(self) -> int:
+        return len(self.population)
+
+    def nbytes(self) -> int:
+        """Bytes held in the flat buffers (names and arrays)."""
+        buffers = (
+            self.name_offsets, self.population, self.country_idx, self.state_idx,
+            self.tz_start, self.tz_end, self.off_ptr, self.off_start, self.off_end, self.off_utc,
+        )
+        return len(self.names) + sum(b.itemsize * len(b) for b in buffers)
+
+    def name(self, i: int) -> str:
+        return self.names[self.name_offsets[i]:self.name_offsets[i + 1]].decode("utf-8")
+
+    def utc_offset(self, z: int, t: int) -> int:
+        """
+        UTC offset of zone `z` at epoch `t`: from the schedule, or from
+        zoneinfo outside it (a build older than OFFSET_SCHEDULE_YEARS).
+        """
+        lo, hi = self.off_ptr[z], self.off_ptr[z + 1]
+        i = bisect_right(self.off_start, t, lo, hi) - 1
+        if i < lo or t >= self.off_end[i]:
+            offset = datetime.fromtimestamp(t, timezone.utc).astimezone(ZoneInfo(self.timezones[z])).utcoffset()
+            return int(offset.total_seconds())
+        return self.off_utc[i]
+
+    def zones_at_hour(self, hour: int, t: int) -> list[int]:
+        # Offsets and transitions fall on whole minutes, so the answer
+        # only changes when the UTC minute does
+        minute = t // 60
+        if self._zones_minute != minute:
+            self._zones_minute, self._zones_cache = minute, {}
+
+        zones = self._zones_cache.get(hour)
+        if zones is None:
+            first_second, last_second = hour * 3600, hour * 3600 + 3599
+            zones = self._zones_cache[hour] = [
+                z for z in range(len(self.timezones))
+                if first_second <= (t + self.utc_offset(z, t)) % 86400 <= last_second
+            ]
+        return zones
+
+    def cities_at_hour(self, hour: int, at: Optional[datetime] = None, limit: int = 20) -> list[tuple]:
+        """
+        Same rows as lite_queries.cities_at_hour_lite: (name, state,
+        country, population, timezone), most populated first.
+        """
+        t = int(at.timestamp() if at else time.time())
+        population = self.population
+
+        def zone_rows(z):
+            for i in range(self.tz_start[z], self.tz_end[z]):
+                yield -population[i], i, z
+
+        # Zone ranges are sorted already: a lazy k-way merge of their heads
+        heads = [zone_rows(z) for z in self.zones_at_hour(hour, t)]
+
+        return [
+            (
+                self.name(i),
+                self.states[self.state_idx[i]],
+                self.countries[self.country_idx[i]],
+                population[i],
+                self.timezones[z],
+            )
+            for _, i, z in islice(heapq.merge(*heads), limit)
+        ]
@@ -1,22 +1,132 @@
+import os
 from pathlib import Path
 
 DATA_DIR = Path("data")
 DB_DIR = Path("databases")
 
+# GeoNames city dump to import. The citiesN tiers only hold populated
+# places with population > N; allCountries (~12M rows, every feature type)
+# relies on the import filters below. Switching tiers needs FORCE_REBUILD.
+GEONAMES_DATASETS = ("cities15000", "cities5000", "cities1000", "cities500", "allCountries")
+GEONAMES_DATASET = "cities500"
+
+GEONAMES_DUMP_URL = "https://download.geonames.org/export/dump"
+
 GEONAMES_URLS = {
-    "cities": "https://download.geonames.org/export/dump/cities500.zip",
-    "admin1": "https://download.geonames.org/export/dump/admin1CodesASCII.txt",
-    "countries": "https://download.geonames.org/export/dump/countryInfo.txt",
+    "cities": f"{GEONAMES_DUMP_URL}/{GEONAMES_DATASET}.zip",
+    "admin1": f"{GEONAMES_DUMP_URL}/admin1CodesASCII.txt",
+    "countries": f"{GEONAMES_DUMP_URL}/countryInfo.txt",
 }
 
+# Streaming filters applied while parsing the dump (None = no filter)
+GEONAMES_FEATURE_CLASSES = ("P",)
+GEONAMES_FEATURE_CODES = None
+# Historical, abandoned and destroyed places
+GEONAMES_EXCLUDED_FEATURE_CODES = ("PPLH", "PPLQ", "PPLW", "PPLCH")
+GEONAMES_MIN_POPULATION = 0
+
+# Rows per executemany batch, for both geonames.db and cities.db
+IMPORT_BATCH_SIZE = 20_000
+
+# Processes parsing the city dump (1 = serial); SQLite keeps a single writer
+GEONAMES_PARSE_WORKERS = os.cpu_count() or 1
+GEONAMES_PARSE_CHUNK_BYTES = 4 * 1024 * 1024
+
 FORCE_REBUILD = False
 
 GEONAMES_DB_PATH = DB_DIR / "geonames.db"
 CITIES_DB_PATH = DB_DIR / "cities.db"
 
-CITIES_ZIP = DATA_DIR / "cities500.zip"
+# Live DB paths are symlinks into this directory (see db/generations.py)
+DB_GENERATIONS_DIR = DB_DIR / "generations"
+DB_GENERATIONS_TO_KEEP = 3
+
+CITIES_ZIP = DATA_DIR / f"{GEONAMES_DATASET}.zip"
 ADMIN1_FILE = DATA_DIR / "admin1CodesASCII.txt"
 COUNTRY_FILE = DATA_DIR / "countryInfo.txt"
-CITIES_FILE = DATA_DIR / "cities500.txt"
+CITIES_FILE = DATA_DIR / f"{GEONAMES_DATASET}.txt"
+
+TIMEZONE_INDEX_FILE_NAME = "timezone.json"
+
+# Max entries in the hour-query result cache
+QUERY_CACHE_SIZE = 256
+
+# Worker threads for the async query layer (matches the reader pool)
+ASYNC_QUERY_WORKERS = 8
+
+# Years of UTC offset intervals stored in cities.db, starting this year
+OFFSET_SCHEDULE_YEARS = 2
+
+# city_stats summaries: population quantiles and exact counts at thresholds
+CITY_STATS_QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9, 0.99)
+CITY_STATS_THRESHOLDS = (1_000, 5_000, 15_000, 50_000, 100_000, 500_000, 1_000_000)
+
+# Intern country/state names into lookup tables (cities becomes a read-only view)
+COMPACT_CITIES_DB = False
+
+# Also split cities.db into one shard per base UTC offset hour
+# (cities_db/shards.py), listed in SHARDS_DIR / SHARD_MANIFEST_FILE_NAME
+SHARD_CITIES_DB = False
+SHARDS_DIR = DB_DIR / "shards"
+SHARD_MANIFEST_FILE_NAME = "manifest.json"
+
+# Query diagnostics (db/diagnostics.py)
+QUERY_DIAGNOSTICS = True
+SLOW_QUERY_MS = 100
+SLOW_QUERY_LOG_SIZE = 50
+
+# Bulk local time conversion (services/local_time_table.py): transition
+# tables cover instants up to January 1st, this many years ahead
+LOCAL_TIME_TABLE_YEARS = 20
+
+# Hour flip push events (services/hour_flip_scheduler.py)
+FLIP_EVENT_TOP_CITIES = 5
+FLIP_SUBSCRIBER_QUEUE_SIZE = 100
+EVENTS_HOST = "0.0.0.0"
+EVENTS_PORT = 8044
+
+# Static serve mode (services/static_server.py): URL prefix -> file or directory
+STATIC_HOST = "0.0.0.0"
+STATIC_PORT = 8043
+STATIC_MOUNTS = {
+    "/json/timezones/": Path("json/timezones"),
+    "/json/tiles/": Path("json/tiles"),
+    "/dist/": Path("dist"),
+    "/index.html": Path("index.html"),
+}
+# Data files are cached until their next scheduled rebuild: mtime + this
+DATA_REBUILD_INTERVAL = 24 * 3600
+
+# Write .gz siblings next to exported JSON for the static server
+EXPORT_PRECOMPRESS = True
+
+# Packed export (export/timezone_pack.py): every timezone file in one
+# object plus a byte-range index next to timezone.json. Entries are
+# stored as "identity" or compressed one by one as "gzip"
+EXPORT_PACK = True
+PACK_FILE_NAME = "timezones.pack"
+PACK_INDEX_FILE_NAME = "timezones.pack.json"
+PACK_ENCODING = "gzip"
+
+# Prefork serve mode (services/prefork_server.py): workers sharing one
+# copy-on-write cities snapshot
+PREFORK_HOST = "0.0.0.0"
+PREFORK_PORT = 8045
+PREFORK_WORKERS = os.cpu_count() or 1
+# Seconds between checks for a new cities.db generation (the master then
+# reloads the snapshot and replaces its workers), and how long a replaced
+# worker may spend finishing its open connections
+PREFORK_RELOAD_INTERVAL = 2
+PREFORK_DRAIN_SECONDS = 5
+
+# Query API (services/query_api.py) over cities_db.queries
+API_HOST = "0.0.0.0"
+API_PORT = 8046
 
-TIMEZONE_INDEX_FILE_NAME = "timezone.json"
\ No newline at end of file
+# Map tile pyramid (export/tile_exporter.py): z/x/y tiles keeping the
+# TILE_BUDGET most populated cities each, as "json" or compact "bin"
+TILES_DIR = Path("json/tiles")
+TILE_MIN_ZOOM = 0
+TILE_MAX_ZOOM = 8
+TILE_BUDGET = 64
+TILE_FORMAT = "json"
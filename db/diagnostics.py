@@ -0,0 +1,280 @@
+import bisect
+import functools
+import json
+import logging
+import re
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import event
+from sqlalchemy.engine import Row
+
+from config import SLOW_QUERY_MS, SLOW_QUERY_LOG_SIZE
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# Histograms
+# ---------------------------------------------------------
+
+# Upper bounds in seconds (Prometheus "le"), roughly x2.5 apart
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+# Distinct SQL shapes tracked individually; the rest share one series
+MAX_STATEMENTS = 200
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum", "rows", "errors")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.rows = 0
+        self.errors = 0
+
+    def observe(self, seconds: float, rows: int = 0, error: bool = False):
+        # Failed calls count towards latency too, and separately as errors
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.rows += rows
+        self.errors += error
+
+    def snapshot(self) -> dict:
+        cumulative, buckets = 0, {}
+        for bound, n in zip(LATENCY_BUCKETS, self.counts):
+            cumulative += n
+            buckets[str(bound)] = cumulative
+        buckets["+Inf"] = self.count
+
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "rows": self.rows,
+            "errors": self.errors,
+            "buckets": buckets,
+        }
+
+
+# ---------------------------------------------------------
+# Registry
+# ---------------------------------------------------------
+
+_IN_LIST = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+_VALUES_ROWS = re.compile(r"(?:\(\?\.\.\.\)\s*,\s*)+\(\?\.\.\.\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _statement_key(statement: str) -> str:
+    # Expanding IN lists render one "?" per value; collapse them so each
+    # query shape is a single series.
+    statement = _IN_LIST.sub("(?...)", statement)
+    statement = _VALUES_ROWS.sub("(?...), ...", statement)
+    return _WHITESPACE.sub(" ", statement).strip()[:300]
+
+
+class Diagnostics:
+    def __init__(self, slow_query_ms: float = SLOW_QUERY_MS, slow_log_size: int = SLOW_QUERY_LOG_SIZE):
+        self.slow_query_seconds = slow_query_ms / 1000
+        self.queries: dict[str, Histogram] = {}
+        self.statements: dict[str, Histogram] = {}
+        self.slow_queries = deque(maxlen=slow_log_size)
+        self.gauge_sources = {}
+        self._lock = threading.Lock()
+
+    def _histogram(self, table: dict, key: str) -> Histogram:
+        histogram = table.get(key)
+        if histogram is None:
+            if table is self.statements and len(table) >= MAX_STATEMENTS:
+                key = "other"
+            histogram = table.setdefault(key, Histogram())
+        return histogram
+
+    def observe_query(self, name: str, seconds: float, rows: int, error: bool = False):
+        with self._lock:
+            self._histogram(self.queries, name).observe(seconds, rows, error)
+
+    def observe_statement(self, statement: str, seconds: float, error: bool = False):
+        key = _statement_key(statement)
+        with self._lock:
+            self._histogram(self.statements, key).observe(seconds, error=error)
+
+    def record_slow(self, statement: str, parameters, seconds: float, plan: list[str]):
+        entry = {
+            "at": time.time(),
+            "ms": round(seconds * 1000, 3),
+            "statement": _statement_key(statement),
+            "parameters": repr(parameters)[:300],
+            "plan": plan,
+        }
+        self.slow_queries.append(entry)
+        logger.warning("🐢 Slow query (%.1f ms): %s", entry["ms"], entry["statement"])
+
+    def register_gauges(self, name: str, source):
+        """
+        `source()` returns a flat dict of numbers, e.g. cache statistics.
+        """
+        self.gauge_sources[name] = source
+
+    def reset(self):
+        with self._lock:
+            self.queries.clear()
+            self.statements.clear()
+            self.slow_queries.clear()
+
+    # -------------------------------------------------
+    # Export
+    # -------------------------------------------------
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            queries = {k: h.snapshot() for k, h in self.queries.items()}
+            statements = {k: h.snapshot() for k, h in self.statements.items()}
+
+        return {
+            "queries": queries,
+            "statements": statements,
+            "slow_queries": list(self.slow_queries),
+            "gauges": {name: source() for name, source in self.gauge_sources.items()},
+        }
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.snapshot(), ensure_ascii=False, **kwargs)
+
+    def to_prometheus(self) -> str:
+        snap = self.snapshot()
+        lines = []
+
+        for metric, label, series in (
+            ("timefinder_query_seconds", "query", snap["queries"]),
+            ("timefinder_sql_seconds", "statement", snap["statements"]),
+        ):
+            lines.append(f"# TYPE {metric} histogram")
+            for key, h in series.items():
+                labels = f'{label}="{_escape_label(key)}"'
+                for bound, n in h["buckets"].items():
+                    lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {n}')
+                lines.append(f"{metric}_sum{{{labels}}} {h['sum']}")
+                lines.append(f"{metric}_count{{{labels}}} {h['count']}")
+
+        lines.append("# TYPE timefinder_query_rows_total counter")
+        for key, h in snap["queries"].items():
+            lines.append(f'timefinder_query_rows_total{{query="{_escape_label(key)}"}} {h["rows"]}')
+
+        for metric, label, series in (
+            ("timefinder_query_errors_total", "query", snap["queries"]),
+            ("timefinder_sql_errors_total", "statement", snap["statements"]),
+        ):
+            lines.append(f"# TYPE {metric} counter")
+            for key, h in series.items():
+                lines.append(f'{metric}{{{label}="{_escape_label(key)}"}} {h["errors"]}')
+
+        lines.append("# TYPE timefinder_slow_queries gauge")
+        lines.append(f"timefinder_slow_queries {len(snap['slow_queries'])}")
+
+        for source, values in snap["gauges"].items():
+            for key, value in values.items():
+                if isinstance(value, (int, float)):
+                    metric = f"timefinder_{source}_{key}"
+                    lines.append(f"# TYPE {metric} gauge")
+                    lines.append(f"{metric} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+diagnostics = Diagnostics()
+
+
+# ---------------------------------------------------------
+# Hooks
+# ---------------------------------------------------------
+
+def instrument_engine(engine, registry: Diagnostics = diagnostics):
+    """
+    Time every statement run through `engine`; statements slower than the
+    threshold are logged together with their EXPLAIN QUERY PLAN.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info["query_started"].pop()
+        registry.observe_statement(statement, seconds)
+
+        if seconds >= registry.slow_query_seconds and _is_read(statement):
+            registry.record_slow(statement, parameters, seconds, _explain(cursor, statement, parameters))
+
+    # A failed statement never reaches after_cursor_execute: pop its start
+    # here, or the stack grows on every error of a pooled connection
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        conn = context.connection
+        if conn is None or not conn.info.get("query_started"):
+            return
+
+        seconds = time.perf_counter() - conn.info["query_started"].pop()
+        if context.statement is not None:
+            registry.observe_statement(context.statement, seconds, error=True)
+
+
+def _is_read(statement: str) -> bool:
+    return statement.lstrip()[:4].upper() in ("SELE", "WITH")
+
+
+def _explain(cursor, statement, parameters) -> list[str]:
+    try:
+        plan_cursor = cursor.connection.cursor()
+        plan_cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        plan = [row[-1] for row in plan_cursor.fetchall()]
+        plan_cursor.close()
+        return plan
+    except Exception as e:
+        return [f"unavailable: {e}"]
+
+
+def _row_count(result) -> int:
+    # A single Row is a tuple of its columns, but one result row
+    if result is None:
+        return 0
+    if isinstance(result, Row):
+        return 1
+    if isinstance(result, (list, tuple, dict)):
+        return len(result)
+    return 1
+
+
+def instrumented(fn=None, *, name: str | None = None, registry: Diagnostics = diagnostics):
+    """
+    Decorator recording latency and row count of a query helper.
+    """
+
+    def decorate(fn):
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            result, error = None, True
+            try:
+                result = fn(*args, **kwargs)
+                error = False
+                return result
+            finally:
+                registry.observe_query(label, time.perf_counter() - started, _row_count(result), error)
+
+        return wrapper
+
+    return decorate(fn) if fn is not None else decorate
@@ -0,0 +1,120 @@
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from config import DB_GENERATIONS_DIR, DB_GENERATIONS_TO_KEEP
+from db.session import dispose_engines
+
+# ---------------------------------------------------------
+# Blue/green database generations
+# ---------------------------------------------------------
+#
+# The live path (e.g. databases/cities.db) is a symlink to an immutable
+# generation file under DB_GENERATIONS_DIR. Builders write a brand-new
+# generation next to it and publish it with an atomic symlink swap, so
+# readers only ever see a complete database: connections already open
+# keep the old file, new sessions resolve the link to the new one.
+
+SIDECAR_SUFFIXES = ("-wal", "-shm", "-journal")
+
+
+def _generation_glob(live_path: Path) -> str:
+    return f"{live_path.stem}.*{live_path.suffix}"
+
+
+def current_generation(live_path) -> Path | None:
+    """
+    The file a live path currently points at (the path itself for
+    databases built before generations existed), or None.
+    """
+    live_path = Path(live_path)
+    if not live_path.exists():
+        return None
+    return live_path.resolve()
+
+
+def begin_generation(live_path, copy_current: bool = False) -> Path:
+    """
+    Create a new, unpublished generation file for `live_path`.
+
+    With copy_current the live database is copied in (SQLite backup API,
+    safe while readers are active) so incremental builders can skip work
+    that is already done.
+    """
+    live_path = Path(live_path)
+    DB_GENERATIONS_DIR.mkdir(parents=True, exist_ok=True)
+
+    new_path = DB_GENERATIONS_DIR / f"{live_path.stem}.{time.time_ns()}{live_path.suffix}"
+
+    current = current_generation(live_path)
+    if copy_current and current is not None:
+        src = sqlite3.connect(f"file:{current.as_posix()}?mode=ro", uri=True)
+        dst = sqlite3.connect(new_path)
+        try:
+            src.backup(dst)
+        finally:
+            src.close()
+            dst.close()
+
+    return new_path
+
+
+def publish_generation(live_path, new_path, keep: int = DB_GENERATIONS_TO_KEEP):
+    """
+    Atomically point `live_path` at `new_path`, then prune all but the
+    newest `keep` generations.
+    """
+    live_path = Path(live_path)
+    new_path = Path(new_path)
+
+    # The builder's engine must not keep the file open in WAL mode
+    dispose_engines(new_path)
+
+    link_tmp = live_path.with_name(f".{live_path.name}.{os.getpid()}.tmp")
+    if link_tmp.is_symlink() or link_tmp.exists():
+        link_tmp.unlink()
+
+    link_tmp.symlink_to(os.path.relpath(new_path.resolve(), live_path.parent.resolve()))
+    os.replace(link_tmp, live_path)
+
+    prune_generations(live_path, keep)
+
+
+def prune_generations(live_path, keep: int = DB_GENERATIONS_TO_KEEP):
+    live_path = Path(live_path)
+    live = current_generation(live_path)
+
+    generations = sorted(
+        DB_GENERATIONS_DIR.glob(_generation_glob(live_path)),
+        key=lambda p: int(p.name.split(".")[-2]),
+        reverse=True,
+    )
+
+    for path in generations[max(keep, 1):]:
+        if live is not None and path.resolve() == live:
+            continue
+
+        dispose_engines(path)
+
+        for candidate in [path, *(path.with_name(path.name + s) for s in SIDECAR_SUFFIXES)]:
+            candidate.unlink(missing_ok=True)
+
+
+class GenerationWatcher:
+    """
+    Lets long-lived readers (caches, in-memory snapshots) notice that a new
+    generation was published. Call changed() between requests.
+    """
+
+    def __init__(self, live_path):
+        self.live_path = Path(live_path)
+        self.generation = current_generation(self.live_path)
+
+    def changed(self) -> bool:
+        generation = current_generation(self.live_path)
+        if generation == self.generation:
+            return False
+
+        self.generation = generation
+        return True
@@ -1,12 +1,174 @@
+import threading
 from pathlib import Path
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 
-def create_session(db_path: str):
-    db_path = Path(db_path)
-    db_path.parent.mkdir(parents=True, exist_ok=True)
+from config import QUERY_DIAGNOSTICS
+from db.diagnostics import instrument_engine
 
-    engine = create_engine(f"sqlite:///{db_path}")
-    Session = sessionmaker(bind=engine)
+# ---------------------------------------------------------
+# Connection profiles
+# ---------------------------------------------------------
+
+# Readers open the file read-only and lean on the OS page cache.
+# WAL is a property of the database file: the builder profile switches
+# it on, so readers never block on (or behind) a writer.
+READER_PRAGMAS = {
+    "query_only": "ON",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,       # KiB (negative = size, not pages)
+    "temp_store": "MEMORY",
+}
+
+# Builders trade durability for bulk-load speed; a failed build is
+# simply rebuilt from the raw GeoNames files.
+BUILDER_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "OFF",
+    "cache_size": -256 * 1024,
+    "temp_store": "MEMORY",
+    "foreign_keys": "OFF",
+}
+
+PROFILES = {
+    "reader": READER_PRAGMAS,
+    "builder": BUILDER_PRAGMAS,
+}
+
+READER_POOL_SIZE = 8
+READER_MAX_OVERFLOW = 16
+
+
+# ---------------------------------------------------------
+# Engine registry
+# ---------------------------------------------------------
+
+_engines: dict[tuple[str, str], tuple] = {}
+_lock = threading.Lock()
+
+# Last file each (symlinked) path resolved to, see db.generations
+_resolved_links: dict[str, str] = {}
+
+
+def _registry_key(db_path, profile: str) -> tuple[str, str]:
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown connection profile: {profile!r}")
+    return str(Path(db_path).resolve()), profile
+
+
+def _apply_pragmas(engine, pragmas: dict):
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, _record):
+        cursor = dbapi_conn.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def _build_engine(db_path: Path, profile: str):
+    connect_args = {"check_same_thread": False}
+
+    if profile == "reader":
+        url = f"sqlite:///file:{db_path.as_posix()}?mode=ro&uri=true"
+        engine = create_engine(
+            url,
+            connect_args=connect_args,
+            pool_size=READER_POOL_SIZE,
+            max_overflow=READER_MAX_OVERFLOW,
+            pool_pre_ping=False,
+        )
+    else:
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        engine = create_engine(
+            f"sqlite:///{db_path}",
+            connect_args=connect_args,
+        )
+
+    _apply_pragmas(engine, PROFILES[profile])
+
+    if QUERY_DIAGNOSTICS:
+        instrument_engine(engine)
+
+    return engine
+
+
+def _dispose_locked(resolved: str):
+    for key in list(_engines):
+        if key[0] == resolved:
+            engine, _ = _engines.pop(key)
+            engine.dispose()
+
+
+def _get_entry(db_path, profile: str):
+    link = str(Path(db_path).absolute())
+
+    # Resolving, swapping and creating happen under one lock: a thread
+    # that resolved the old generation must not create an engine for it
+    # after another thread has disposed that generation
+    with _lock:
+        key = _registry_key(db_path, profile)
+
+        previous = _resolved_links.get(link)
+        if previous != key[0]:
+            _resolved_links[link] = key[0]
+            if previous is not None:
+                _dispose_locked(previous)
+
+        entry = _engines.get(key)
+        if entry is None:
+            engine = _build_engine(Path(key[0]), profile)
+            entry = (engine, sessionmaker(bind=engine))
+            _engines[key] = entry
+
+    return entry
+
+
+def live_files() -> set[str]:
+    """
+    Files the database paths used in this process resolve to now (as of
+    their latest use); superseded generations are not in it.
+    """
+    with _lock:
+        return set(_resolved_links.values())
+
+
+def get_engine(db_path, profile: str = "builder"):
+    """
+    Return the process-wide engine for (db_path, profile),
+    creating it on first use.
+
+    Engines are keyed by the resolved file, so when a database path is a
+    symlink that gets swapped to a new generation, the next call returns
+    an engine for the new file and the superseded one is disposed.
+    Connections still checked out finish on the old file.
+    """
+    return _get_entry(db_path, profile)[0]
+
+
+def create_session(db_path: str, profile: str = "builder"):
+    engine, Session = _get_entry(db_path, profile)
 
     return Session(), engine
+
+
+def raw_connection(db_path, profile: str = "reader"):
+    """
+    Pooled DB-API connection for code that talks sqlite3 directly.
+    Closing it returns it to the pool.
+    """
+    return get_engine(db_path, profile).raw_connection()
+
+
+def dispose_engines(db_path=None):
+    """
+    Close pooled connections, either for one database or for all of them.
+    Must be called before the file behind an engine is replaced or deleted.
+    """
+    with _lock:
+        if db_path is not None:
+            _dispose_locked(str(Path(db_path).resolve()))
+            return
+
+        for engine, _ in _engines.values():
+            engine.dispose()
+        _engines.clear()
@@ -8,8 +8,14 @@ def download_if_needed(url: str, dest: Path, force: bool):
         print(f"⏭️  Skipping download of {url}, local file is up to date.")
         return
 
-    r = requests.get(url)
-    dest.write_bytes(r.content)
+    # Streamed to disk: allCountries.zip is several hundred MB
+    tmp_path = dest.with_suffix(dest.suffix + ".part")
+    with requests.get(url, stream=True) as r:
+        r.raise_for_status()
+        with tmp_path.open("wb") as f:
+            for chunk in r.iter_content(chunk_size=1 << 20):
+                f.write(chunk)
+    tmp_path.replace(dest)
 
     if dest.suffix == ".zip":
         with zipfile.ZipFile(dest) as z:
@@ -0,0 +1,250 @@
+import json
+import math
+import shutil
+import struct
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import select
+
+from cities_db.models import City, IANATimezone
+from cities_db.queries import timezones_at_time
+
+from config import (
+    FORCE_REBUILD,
+    TILE_BUDGET,
+    TILE_FORMAT,
+    TILE_MAX_ZOOM,
+    TILE_MIN_ZOOM,
+)
+
+# ---------------------------------------------------------
+# Tile pyramid
+# ---------------------------------------------------------
+#
+# Web Mercator z/x/y tiles. Cities are visited by population DESC and a
+# city goes into a tile while that tile holds fewer than `budget` cities,
+# so every tile keeps its `budget` most populated cities. A city kept at
+# zoom z is also kept at every deeper zoom (a child tile only holds
+# cities its parent had room for), so each city gets one min zoom.
+
+MAX_LATITUDE = 85.0511287798
+
+TILE_META_FILE_NAME = "meta.json"
+
+# Binary tiles: magic, then timezone names, then fixed-size city records
+# followed by the name (all little-endian)
+TILE_MAGIC = b"5OT1"
+_BIN_CITY = struct.Struct("<iiIH2sB")
+
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+
+def tile_xy(lat: float, lng: float, zoom: int) -> tuple[int, int]:
+    """Web Mercator tile containing (lat, lng) at `zoom`."""
+    n = 1 << zoom
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def _e5(degrees: float) -> int:
+    # Same value the JSON tiles carry: round(degrees, 5)
+    return round(round(degrees, 5) * 100_000)
+
+
+def encode_tile(cities: list[tuple], fmt: str = TILE_FORMAT) -> bytes:
+    """
+    Serialize one tile. `cities` are (name, country_code, population,
+    latitude, longitude, timezone) tuples, most populated first; each
+    record refers to the tile's timezone list by index.
+    """
+    timezones = list(dict.fromkeys(c[5] for c in cities))
+    tz_index = {tz: i for i, tz in enumerate(timezones)}
+
+    if fmt == "json":
+        return _encode({
+            "timezones": timezones,
+            "cities": [
+                [name, country_code, population or 0, round(lat, 5), round(lng, 5), tz_index[tz]]
+                for name, country_code, population, lat, lng, tz in cities
+            ],
+        }).encode("utf-8")
+
+    if fmt != "bin":
+        raise ValueError(f"Unknown tile format: {fmt!r}")
+
+    parts = [TILE_MAGIC, struct.pack("<H", len(timezones))]
+    for tz in timezones:
+        raw = tz.encode("utf-8")
+        parts.append(struct.pack("<B", len(raw)) + raw)
+
+    parts.append(struct.pack("<I", len(cities)))
+    for name, country_code, population, lat, lng, tz in cities:
+        # Names are capped at 255 bytes, cut on a character boundary
+        raw = name.encode("utf-8")[:255].decode("utf-8", "ignore").encode("utf-8")
+        parts.append(_BIN_CITY.pack(
+            _e5(lat), _e5(lng), population or 0, tz_index[tz],
+            (country_code or "").encode("ascii"), len(raw),
+        ))
+        parts.append(raw)
+
+    return b"".join(parts)
+
+
+def decode_tile(data: bytes) -> dict:
+    """Inverse of encode_tile for either format, in the JSON tile shape."""
+    if not data.startswith(TILE_MAGIC):
+        return json.loads(data)
+
+    offset = len(TILE_MAGIC)
+    (tz_count,) = struct.unpack_from("<H", data, offset)
+    offset += 2
+
+    timezones = []
+    for _ in range(tz_count):
+        length = data[offset]
+        timezones.append(data[offset + 1:offset + 1 + length].decode("utf-8"))
+        offset += 1 + length
+
+    (city_count,) = struct.unpack_from("<I", data, offset)
+    offset += 4
+
+    cities = []
+    for _ in range(city_count):
+        lat, lng, population, tz, country_code, length = _BIN_CITY.unpack_from(data, offset)
+        offset += _BIN_CITY.size
+        name = data[offset:offset + length].decode("utf-8")
+        offset += length
+        cities.append([
+            name, country_code.decode("ascii"), population,
+            lat / 100_000, lng / 100_000, tz,
+        ])
+
+    return {"timezones": timezones, "cities": cities}
+
+
+def _thin(rows, min_zoom: int, max_zoom: int, budget: int) -> list[tuple]:
+    """
+    (min zoom, x, y at max_zoom, city) for every city that makes some
+    tile's budget. `rows` must be ordered by population DESC.
+    """
+    counts = [defaultdict(int) for _ in range(max_zoom + 1)]
+    kept = []
+
+    for row in rows:
+        x, y = tile_xy(row[3], row[4], max_zoom)
+
+        for zoom in range(min_zoom, max_zoom + 1):
+            shift = max_zoom - zoom
+            if counts[zoom][(x >> shift, y >> shift)] < budget:
+                break
+        else:
+            continue
+
+        for deeper in range(zoom, max_zoom + 1):
+            shift = max_zoom - deeper
+            counts[deeper][(x >> shift, y >> shift)] += 1
+
+        kept.append((zoom, x, y, tuple(row)))
+
+    return kept
+
+
+def export_tiles(
+    session,
+    output_dir: Path,
+    hour: Optional[int] = None,
+    at: Optional[datetime] = None,
+    min_zoom: int = TILE_MIN_ZOOM,
+    max_zoom: int = TILE_MAX_ZOOM,
+    budget: int = TILE_BUDGET,
+    fmt: str = TILE_FORMAT,
+) -> Optional[dict]:
+    """
+    Write a population-thinned tile pyramid to output_dir/z/x/y.<fmt>
+    plus meta.json (zoom range, budget, tile and byte counts per zoom).
+
+    With `hour`, only cities whose local time at `at` (default: now) is
+    in that hour are considered, and the budget applies after filtering.
+    Every city also names its timezone, so clients can filter the full
+    pyramid by hour themselves.
+
+    The pyramid is built next to `output_dir` and swapped in when
+    complete. Returns the meta dict, or None if the export was skipped.
+    """
+    if (output_dir / TILE_META_FILE_NAME).exists() and not FORCE_REBUILD:
+        return None
+
+    stmt = (
+        select(
+            City.name,
+            City.country_code,
+            City.population,
+            City.latitude,
+            City.longitude,
+            IANATimezone.name,
+        )
+        .join(IANATimezone, City.timezone_id == IANATimezone.id)
+        .order_by(City.population.desc(), City.id)
+        .execution_options(yield_per=10_000)
+    )
+
+    if hour is not None:
+        stmt = stmt.where(IANATimezone.name.in_(timezones_at_time(session, hour, at=at)))
+
+    kept = _thin(session.execute(stmt), min_zoom, max_zoom, budget)
+
+    tmp_dir = output_dir.with_name(output_dir.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    meta = {
+        "format": fmt,
+        "min_zoom": min_zoom,
+        "max_zoom": max_zoom,
+        "budget": budget,
+        "hour": hour,
+        "at": at.isoformat() if at and hour is not None else None,
+        "cities": len(kept),
+        "tiles": {},
+        "bytes": {},
+    }
+
+    for zoom in range(min_zoom, max_zoom + 1):
+        shift = max_zoom - zoom
+
+        # kept is in population order, so each tile stays sorted
+        tiles = defaultdict(list)
+        for city_zoom, x, y, city in kept:
+            if city_zoom <= zoom:
+                tiles[(x >> shift, y >> shift)].append(city)
+
+        size = 0
+        for (x, y), cities in tiles.items():
+            data = encode_tile(cities, fmt)
+            path = tmp_dir / str(zoom) / str(x) / f"{y}.{fmt}"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+            size += len(data)
+
+        meta["tiles"][zoom] = len(tiles)
+        meta["bytes"][zoom] = size
+
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    with (tmp_dir / TILE_META_FILE_NAME).open("w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+    # Swap the finished pyramid in
+    old_dir = output_dir.with_name(output_dir.name + ".old")
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if output_dir.exists():
+        output_dir.replace(old_dir)
+    tmp_dir.replace(output_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+    return meta
@@ -1,107 +1,115 @@
+import gzip
 import json
 from pathlib import Path
+from itertools import chain
 from typing import List
 from sqlalchemy import select
-from collections import defaultdict
 
 from cities_db.models import City, IANATimezone
+from cities_db.queries import all_city_stats
 
-from config import FORCE_REBUILD, TIMEZONE_INDEX_FILE_NAME
+from config import FORCE_REBUILD, PACK_INDEX_FILE_NAME, TIMEZONE_INDEX_FILE_NAME
 
 
 def safe_tz_filename(tz_name: str) -> str:
     """Convert IANA timezone to filename-safe string."""
     return tz_name.replace("/", "_")
 
-def write_timezone_file(output_dir: Path, tz_name: str, data: dict):
-    filename = safe_tz_filename(tz_name) + ".json"
-    path = output_dir / filename
 
-    # Skip if file exists and no rebuild requested
-    if path.exists() and not FORCE_REBUILD:
-        # logger.debug("Skipping %s (already exists)", path.name)
-        return
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+
+def _country_key(country) -> str:
+    # json.dump writes a None key as "null"
+    return _encode("null" if country is None else country)
+
+
+def _timezone_file_path(output_dir: Path, tz_name: str) -> Path:
+    return output_dir / (safe_tz_filename(tz_name) + ".json")
 
-    # Convert defaultdict → dict (JSON-safe)
-    data["countries"] = dict(data["countries"])
+
+def write_timezone_file(output_dir: Path, tz_name: str, rows) -> bool:
+    """
+    Stream one timezone file from `rows` of (country, city, state,
+    population, lat, lng) ordered by country. The bytes match json.dump of
+    the grouped dict, but only one row is held at a time.
+    Returns False when there was nothing to write.
+    """
+    path = _timezone_file_path(output_dir, tz_name)
+
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return False
 
     tmp_path = path.with_suffix(".tmp")
 
     with tmp_path.open("w", encoding="utf-8") as f:
-        json.dump(
-            data,
-            f,
-            ensure_ascii=False,
-            separators=(",", ":"),
-        )
+        f.write(f'{{"timezone":{_encode(tz_name)},"countries":{{')
+
+        current_country = None
+        for i, (country, city_name, state_name, population, lat, lng) in enumerate(chain((first,), rows)):
+            if i == 0:
+                f.write(f"{_country_key(country)}:[")
+            elif country != current_country:
+                f.write(f"],{_country_key(country)}:[")
+            else:
+                f.write(",")
+            current_country = country
+
+            f.write(_encode({
+                "city": city_name,
+                "state": state_name,
+                "population": population,
+                "lat": lat,
+                "lng": lng,
+            }))
+
+        f.write("]}}")
 
     # Atomic replace
     tmp_path.replace(path)
+    return True
 
 
 def export_cities_by_timezone(session, output_dir: Path):
     """
     Create one JSON file per timezone.
     Each file groups cities by country.
+
+    Zones are queried and written one at a time, so only a single zone is
+    ever sorted and nothing grows with the size of cities.db.
     """
 
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    stmt = (
-        select(
-            IANATimezone.name,
-            City.name,
-            City.state,
-            City.population,
-            City.latitude,
-            City.longitude,
-            City.country,
-        )
-        .join(City.timezone)
-        .order_by(
-            IANATimezone.name,
-            City.country,
-            City.population.desc(),
+    timezones = session.execute(
+        select(IANATimezone.id, IANATimezone.name).order_by(IANATimezone.name)
+    ).all()
+
+    for tz_id, tz_name in timezones:
+        # Skip if file exists and no rebuild requested
+        if _timezone_file_path(output_dir, tz_name).exists() and not FORCE_REBUILD:
+            continue
+
+        stmt = (
+            select(
+                City.country,
+                City.name,
+                City.state,
+                City.population,
+                City.latitude,
+                City.longitude,
+            )
+            .where(City.timezone_id == tz_id)
+            .order_by(
+                City.country,
+                City.population.desc(),
+            )
         )
-    )
-
-    result = session.execute(stmt)
-
-    current_tz = None
-    data = None
-
-    for (
-        tz_name,
-        city_name,
-        state_name,
-        population,
-        lat,
-        lng,
-        country_code,
-    ) in result:
-
-        if tz_name != current_tz:
-            # Flush previous timezone file
-            if data is not None:
-                write_timezone_file(output_dir, current_tz, data)
-
-            current_tz = tz_name
-            data = {
-                "timezone": tz_name,
-                "countries": defaultdict(list),
-            }
-
-        data["countries"][country_code].append({
-            "city": city_name,
-            "state": state_name,
-            "population": population,
-            "lat": lat,
-            "lng": lng,
-        })
-
-    # Flush last file
-    if data is not None:
-        write_timezone_file(output_dir, current_tz, data)
+
+        write_timezone_file(output_dir, tz_name, session.execute(stmt))
+
 
 def tz_name_from_filename(filename: str) -> str:
     """
@@ -111,10 +119,22 @@ def tz_name_from_filename(filename: str) -> str:
     return filename.replace(".json", "").replace("_", "/")
 
 
-def generate_timezone_index(output_dir: Path):
+def timezone_files(output_dir: Path) -> List[Path]:
+    """Exported per-timezone JSON files, without the index files."""
+    return [
+        path
+        for path in sorted(output_dir.glob("*.json"))
+        if path.name not in (TIMEZONE_INDEX_FILE_NAME, PACK_INDEX_FILE_NAME)
+    ]
+
+
+def generate_timezone_index(output_dir: Path, session=None):
     """
     Generates _timezone.index containing all timezones
     for which JSON files exist.
+
+    With a cities.db session, a "stats" object adds each zone's
+    city_stats summary (counts, population range, quantiles).
     """
 
     index_path = output_dir / TIMEZONE_INDEX_FILE_NAME
@@ -124,17 +144,28 @@ def generate_timezone_index(output_dir: Path):
         return
 
     timezones: List[str] = []
+    stems: List[str] = []
 
-    for path in sorted(output_dir.glob("*.json")):
-        if path.name == TIMEZONE_INDEX_FILE_NAME:
-            continue
-
+    for path in timezone_files(output_dir):
         timezones.append(tz_name_from_filename(path.name))
+        stems.append(path.stem)
 
     data = {
         "timezones": timezones
     }
 
+    if session is not None:
+        # Matched by file name: listed names are derived from it
+        stats = {
+            safe_tz_filename(tz): summary
+            for tz, summary in all_city_stats(session, "timezone").items()
+        }
+        data["stats"] = {
+            tz: {k: v for k, v in stats[stem].items() if k != "largest_city_id"}
+            for tz, stem in zip(timezones, stems)
+            if stem in stats
+        }
+
     tmp_path = index_path.with_suffix(".tmp")
 
     with tmp_path.open("w", encoding="utf-8") as f:
@@ -145,4 +176,30 @@ def generate_timezone_index(output_dir: Path):
             indent=2,
         )
 
-    tmp_path.replace(index_path)
\ No newline at end of file
+    tmp_path.replace(index_path)
+
+
+def precompress_exports(output_dir: Path) -> int:
+    """
+    Write a .gz sibling next to every exported JSON file whose sibling is
+    missing or older, for servers that send precompressed variants.
+    Returns the number of files compressed.
+    """
+    written = 0
+
+    for path in sorted(output_dir.glob("*.json")):
+        gz_path = path.with_name(path.name + ".gz")
+        if gz_path.exists() and gz_path.stat().st_mtime_ns >= path.stat().st_mtime_ns:
+            continue
+
+        tmp_path = gz_path.with_suffix(".tmp")
+        # mtime=0 keeps the bytes (and so the ETag) stable across exports
+        with path.open("rb") as src, tmp_path.open("wb") as raw:
+            with gzip.GzipFile(filename="", mode="wb", fileobj=raw, compresslevel=9, mtime=0) as dst:
+                for chunk in iter(lambda: src.read(1 << 20), b""):
+                    dst.write(chunk)
+
+        tmp_path.replace(gz_path)
+        written += 1
+
+    return written
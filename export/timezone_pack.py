@@ -0,0 +1,191 @@
+import gzip
+import hashlib
+import json
+import mmap
+from pathlib import Path
+from typing import Iterator, Optional
+
+from config import FORCE_REBUILD, PACK_ENCODING, PACK_FILE_NAME, PACK_INDEX_FILE_NAME
+from export.timezone_json_exporter import timezone_files
+
+# ---------------------------------------------------------
+# Packed export
+# ---------------------------------------------------------
+#
+# Every per-timezone JSON file, concatenated into one object, and an
+# index next to timezone.json:
+#
+#   {
+#     "pack": "timezones.pack",
+#     "size": 1234567,
+#     "hash": "<sha256 of the pack>",
+#     "encoding": "gzip",
+#     "entries": {"America/New_York": [offset, length, hash], ...}
+#   }
+#
+# An entry's hash covers its stored bytes, so a range can be checked
+# before it is decoded. The pack hash is the ETag services.static_server
+# sends for the pack, unquoted; the server takes it as If-Range with or
+# without the quotes, so a pack rebuilt under a stale index comes back
+# whole instead of as the wrong bytes.
+
+ENCODINGS = ("identity", "gzip")
+
+_TIMEZONE_PREFIX = b'{"timezone":'
+
+
+def _hash(data) -> str:
+    # Same digest and length as the static server's ETags
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def _timezone_name(data: bytes) -> str:
+    # Exported files start with {"timezone":"<IANA name>",...; the name
+    # is read from there because file names are lossy ("_" for "/")
+    if not data.startswith(_TIMEZONE_PREFIX):
+        raise ValueError("not an exported timezone file")
+    name, _ = json.JSONDecoder().raw_decode(data[:512].decode("utf-8", "ignore"), len(_TIMEZONE_PREFIX))
+    return name
+
+
+def _encode_entry(data: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        # mtime=0 keeps the bytes (and so the hashes) stable across exports
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    return data
+
+
+def write_timezone_pack(output_dir: Path, encoding: str = PACK_ENCODING) -> Optional[dict]:
+    """
+    Pack the exported timezone files in output_dir into PACK_FILE_NAME
+    and write its byte-range index to PACK_INDEX_FILE_NAME.
+
+    The pack is replaced before the index, each atomically. Returns the
+    index, or None if the pack exists and no rebuild was requested.
+    """
+    if encoding not in ENCODINGS:
+        raise ValueError(f"encoding must be one of {ENCODINGS}")
+
+    pack_path = output_dir / PACK_FILE_NAME
+    index_path = output_dir / PACK_INDEX_FILE_NAME
+
+    if index_path.exists() and pack_path.exists() and not FORCE_REBUILD:
+        return None
+
+    entries = {}
+    digest = hashlib.sha256()
+    offset = 0
+
+    tmp_pack = pack_path.with_suffix(".tmp")
+
+    with tmp_pack.open("wb") as f:
+        for path in timezone_files(output_dir):
+            data = path.read_bytes()
+            stored = _encode_entry(data, encoding)
+
+            f.write(stored)
+            digest.update(stored)
+
+            entries[_timezone_name(data)] = [offset, len(stored), _hash(stored)]
+            offset += len(stored)
+
+    index = {
+        "pack": PACK_FILE_NAME,
+        "size": offset,
+        "hash": digest.hexdigest()[:32],
+        "encoding": encoding,
+        "entries": dict(sorted(entries.items())),
+    }
+
+    tmp_index = index_path.with_suffix(".tmp")
+
+    with tmp_index.open("w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+
+    tmp_pack.replace(pack_path)
+    tmp_index.replace(index_path)
+
+    return index
+
+
+# ---------------------------------------------------------
+# Reader
+# ---------------------------------------------------------
+
+class TimezonePack:
+    """
+    Read-only view of a packed export. The pack is mmap'ed: raw() slices
+    it without copying, payload() and load() decode one entry.
+
+    Slices returned by raw() keep the mapping alive; release them before
+    close().
+    """
+
+    def __init__(self, output_dir: Path):
+        output_dir = Path(output_dir)
+        index = json.loads((output_dir / PACK_INDEX_FILE_NAME).read_text(encoding="utf-8"))
+
+        self.encoding = index["encoding"]
+        self.hash = index["hash"]
+        self.entries: dict[str, tuple[int, int, str]] = {
+            name: tuple(entry) for name, entry in index["entries"].items()
+        }
+
+        self._file = (output_dir / index["pack"]).open("rb")
+        size = self._file.seek(0, 2)
+        if size != index["size"]:
+            # The pack is replaced just before its index
+            self._file.close()
+            raise ValueError(f"{index['pack']} is {size} bytes, its index expects {index['size']}")
+
+        # mmap cannot map an empty file
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self._view = memoryview(self._mmap) if size else memoryview(b"")
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, tz_name: str) -> bool:
+        return tz_name in self.entries
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.entries)
+
+    def raw(self, tz_name: str) -> memoryview:
+        """Stored bytes of one entry, as a zero-copy slice of the pack."""
+        offset, length, _ = self.entries[tz_name]
+        return self._view[offset:offset + length]
+
+    def payload(self, tz_name: str) -> bytes:
+        """The entry's JSON document, decoded."""
+        raw = self.raw(tz_name)
+        try:
+            if self.encoding == "gzip":
+                return gzip.decompress(raw)
+            return bytes(raw)
+        finally:
+            raw.release()
+
+    def load(self, tz_name: str) -> dict:
+        return json.loads(self.payload(tz_name))
+
+    def verify(self) -> list[str]:
+        """Names of entries whose stored bytes do not match their hash."""
+        bad = []
+        for tz_name, (_, _, expected) in self.entries.items():
+            with self.raw(tz_name) as raw:
+                if _hash(raw) != expected:
+                    bad.append(tz_name)
+        return bad
+
+    def close(self):
+        self._view.release()
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,23 +1,147 @@
+from functools import partial
+from itertools import islice
+
+from config import (
+    GEONAMES_FEATURE_CLASSES,
+    GEONAMES_FEATURE_CODES,
+    GEONAMES_EXCLUDED_FEATURE_CODES,
+    GEONAMES_MIN_POPULATION,
+    GEONAMES_PARSE_WORKERS,
+    GEONAMES_PARSE_CHUNK_BYTES,
+    IMPORT_BATCH_SIZE,
+)
 from geonames_db.models import GeoNamesCity, Admin1Code, CountryInfo
+from utils.chunked_parse import map_ranges, read_lines
+
+
+CITY_COLUMNS = tuple(c.name for c in GeoNamesCity.__table__.columns)
+
+_INSERT_CITY = (
+    f"INSERT INTO {GeoNamesCity.__tablename__} ({', '.join(CITY_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in CITY_COLUMNS)})"
+)
+
+
+def _city_parser(
+    feature_classes=GEONAMES_FEATURE_CLASSES,
+    feature_codes=GEONAMES_FEATURE_CODES,
+    excluded_feature_codes=GEONAMES_EXCLUDED_FEATURE_CODES,
+    min_population: int = GEONAMES_MIN_POPULATION,
+):
+    """
+    Build `parse(line) -> row | None`; rows are tuples in CITY_COLUMNS
+    order and filtered lines return None before anything is converted.
+    """
+    feature_classes = frozenset(feature_classes) if feature_classes is not None else None
+    feature_codes = frozenset(feature_codes) if feature_codes is not None else None
+    excluded_feature_codes = frozenset(excluded_feature_codes or ())
+
+    def parse(line: str):
+        parts = line.rstrip("\n").split("\t")
+
+        feature_class, feature_code = parts[6], parts[7]
+        if feature_classes is not None and feature_class not in feature_classes:
+            return None
+        if feature_codes is not None and feature_code not in feature_codes:
+            return None
+        if feature_code in excluded_feature_codes:
+            return None
+
+        population = int(parts[14] or 0)
+        if population < min_population:
+            return None
+
+        # Rows without a zone never make it into cities.db
+        if not parts[17]:
+            return None
+
+        return (
+            int(parts[0]),
+            parts[1],
+            parts[2],
+            float(parts[4]),
+            float(parts[5]),
+            feature_class,
+            feature_code,
+            parts[8],
+            parts[10],
+            population,
+            parts[17],
+        )
+
+    return parse
+
+
+def iter_geonames_cities(file_path, **filters):
+    """
+    Stream rows of any GeoNames dump (cities15000 … allCountries) as
+    CITY_COLUMNS tuples. `filters` override the config defaults.
+    """
+    parse = _city_parser(**filters)
 
-def import_cities500(session, file_path):
     with open(file_path, encoding="utf-8") as f:
         for line in f:
-            parts = line.strip().split("\t")
-            session.add(
-                GeoNamesCity(
-                    geonameid=int(parts[0]),
-                    name=parts[1],
-                    asciiname=parts[2],
-                    latitude=float(parts[4]),
-                    longitude=float(parts[5]),
-                    country_code=parts[8],
-                    admin1_code=parts[10],
-                    population=int(parts[14] or 0),
-                    timezone=parts[17],
-                )
-            )
+            row = parse(line)
+            if row is not None:
+                yield row
+
+
+def parse_cities_range(file_path, start: int, end: int, **filters) -> list[tuple]:
+    """
+    Worker side of the parallel import: parse one newline-aligned byte
+    range into CITY_COLUMNS tuples.
+    """
+    parse = _city_parser(**filters)
+    return [
+        row
+        for row in map(parse, read_lines(file_path, start, end))
+        if row is not None
+    ]
+
+
+def _batches(rows, size: int):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def import_cities500(
+    session,
+    file_path,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    workers: int = GEONAMES_PARSE_WORKERS,
+    **filters,
+) -> int:
+    """
+    Import the configured city dump; memory stays bounded regardless of
+    the file size.
+
+    With several workers the file is split into newline-aligned ranges
+    parsed in a process pool, and this process stays the single SQLite
+    writer, inserting chunks in file order as they come back. Rows and
+    row order are identical to the serial path.
+    `filters` override the config defaults of _city_parser.
+    """
+    if workers > 1:
+        batches = map_ranges(
+            file_path,
+            partial(parse_cities_range, **filters),
+            workers,
+            GEONAMES_PARSE_CHUNK_BYTES,
+        )
+    else:
+        batches = _batches(iter_geonames_cities(file_path, **filters), batch_size)
+
+    conn = session.connection()
+    imported = 0
+
+    for batch in batches:
+        if batch:
+            conn.exec_driver_sql(_INSERT_CITY, batch)
+            imported += len(batch)
+
     session.commit()
+    return imported
 
 
 def import_admin1(session, file_path):
@@ -36,3 +160,14 @@ def import_countries(session, file_path):
             parts = line.strip().split("\t")
             session.add(CountryInfo(iso=parts[0], country=parts[4]))
     session.commit()
+
+
+def create_indexes(engine):
+    # Built after the bulk load, which is much cheaper than maintaining it
+    # row by row. build_cities walks zones in population order straight
+    # off this index, so it never sorts or groups in memory.
+    with engine.begin() as conn:
+        conn.exec_driver_sql("""
+        CREATE INDEX IF NOT EXISTS idx_cities500_tz_population
+        ON cities500 (timezone, population DESC);
+        """)
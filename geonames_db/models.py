@@ -9,6 +9,8 @@ class GeoNamesCity(Base):
     asciiname = Column(String)
     latitude = Column(Float, nullable=False)
     longitude = Column(Float, nullable=False)
+    feature_class = Column(String(1))
+    feature_code = Column(String(10))
     country_code = Column(String(2), nullable=False)
     admin1_code = Column(String)
     population = Column(Integer)
@@ -1,10 +1,20 @@
+import argparse
+import sys
+import time
 from pathlib import Path
 
+import config
 from config import (
     DATA_DIR,
     DB_DIR,
     GEONAMES_URLS,
-    FORCE_REBUILD,
+    GEONAMES_DATASET,
+    OFFSET_SCHEDULE_YEARS,
+    COMPACT_CITIES_DB,
+    SHARD_CITIES_DB,
+    EXPORT_PRECOMPRESS,
+    EXPORT_PACK,
+    TILES_DIR,
     GEONAMES_DB_PATH,
     CITIES_DB_PATH,
     CITIES_ZIP,
@@ -13,34 +23,33 @@ from config import (
     ADMIN1_FILE
 )
 
-from export.timezone_json_exporter import export_cities_by_timezone, generate_timezone_index
-from utils.files import ensure_dir
-from downloader.geonames import download_if_needed
-
-from db.session import create_session
-from db.base import Base
-
-# GeoNames DB
-from geonames_db.models import GeoNamesCity, Admin1Code, CountryInfo
-from geonames_db.importer import (
-    import_cities500,
-    import_admin1,
-    import_countries,
-)
-
-# Cities DB
-from cities_db.models import City, IANATimezone
-from cities_db.importer import build_timezones, build_cities, create_indexes
-from cities_db.queries import bottom_cities_by_population_in_timezone, cities_at_hour, top_cities_by_population_at_hour, top_cities_by_population_in_timezone
+# Everything heavier than config (SQLAlchemy, models, requests, the
+# exporters) is imported inside the stage that needs it, so a single
+# subcommand only pays for its own imports. It also lets --force set
+# config.FORCE_REBUILD before any module copies it at import time.
 
 
 # ---------------------------------------------------------
 # Bootstrap helpers
 # ---------------------------------------------------------
 
-def rebuild_db_if_needed(db_path: Path):
-    if FORCE_REBUILD and db_path.exists():
-        db_path.unlink()
+def is_populated(db_path: Path, model) -> bool:
+    from sqlalchemy.exc import OperationalError
+
+    from db.generations import current_generation
+    from db.session import create_session
+
+    if current_generation(db_path) is None:
+        return False
+
+    session, _ = create_session(db_path, profile="reader")
+    try:
+        return session.query(model).first() is not None
+    except OperationalError:
+        # Table missing: an older or partial database
+        return False
+    finally:
+        session.close()
 
 
 # ---------------------------------------------------------
@@ -48,40 +57,59 @@ def rebuild_db_if_needed(db_path: Path):
 # ---------------------------------------------------------
 
 def create_directories():
+    from utils.files import ensure_dir
+
     print("Making sure directories exist")
     ensure_dir(DATA_DIR)
     ensure_dir(DB_DIR)
     print("Directories are now setup")
 
 def download_data():
+    from downloader.geonames import download_if_needed
+
     print("⬇️  Downloading GeoNames data if needed")
 
     download_if_needed(
         GEONAMES_URLS["cities"],
         CITIES_ZIP,
-        FORCE_REBUILD,
+        config.FORCE_REBUILD,
     )
 
     download_if_needed(
         GEONAMES_URLS["admin1"],
         ADMIN1_FILE,
-        FORCE_REBUILD,
+        config.FORCE_REBUILD,
     )
 
     download_if_needed(
         GEONAMES_URLS["countries"],
         COUNTRY_FILE,
-        FORCE_REBUILD,
+        config.FORCE_REBUILD,
     )
     
     print("✅ GeoNames data download complete")
     
 def build_geonames_db():
+    from db.base import Base
+    from db.generations import begin_generation, publish_generation
+    from db.session import create_session
+    from geonames_db.importer import (
+        import_cities500,
+        import_admin1,
+        import_countries,
+        create_indexes as create_geonames_indexes,
+    )
+    from geonames_db.models import GeoNamesCity, Admin1Code, CountryInfo
+
     print("🗄️  Building geonames.db")
 
-    rebuild_db_if_needed(GEONAMES_DB_PATH)
+    if not config.FORCE_REBUILD and is_populated(GEONAMES_DB_PATH, GeoNamesCity):
+        print("✅ geonames.db already populated")
+        return
 
-    geo_session, geo_engine = create_session(GEONAMES_DB_PATH)
+    # Build off to the side; the live file is only swapped once complete
+    db_path = begin_generation(GEONAMES_DB_PATH)
+    geo_session, geo_engine = create_session(db_path)
 
     # Create tables
     Base.metadata.create_all(
@@ -94,27 +122,39 @@ def build_geonames_db():
     )
 
     # Import raw data
-    if FORCE_REBUILD or not geo_session.query(GeoNamesCity).first():
-        print("📥 Importing cities500")
-        import_cities500(geo_session, CITIES_FILE)
+    print(f"📥 Importing {GEONAMES_DATASET}")
+    started = time.perf_counter()
+    imported = import_cities500(geo_session, CITIES_FILE)
+    elapsed = time.perf_counter() - started
+    print(f"   {imported} places in {elapsed:.1f}s ({imported / max(elapsed, 1e-9):,.0f} rows/s)")
 
-        print("📥 Importing admin1 codes")
-        import_admin1(geo_session, ADMIN1_FILE)
+    print("📥 Importing admin1 codes")
+    import_admin1(geo_session, ADMIN1_FILE)
 
-        print("📥 Importing country info")
-        import_countries(geo_session, COUNTRY_FILE)
-    else:
-        print("✅ geonames.db already populated")
+    print("📥 Importing country info")
+    import_countries(geo_session, COUNTRY_FILE)
+
+    create_geonames_indexes(geo_engine)
 
     geo_session.close()
+
+    publish_generation(GEONAMES_DB_PATH, db_path)
+    print(f"🔀 geonames.db now serving {db_path.name}")
     
 def build_cities_db():
+    from cities_db.importer import build_timezones, build_cities, build_city_stats, build_offset_schedule, create_indexes, optimize_cities_db
+    from cities_db.models import City, CityStats, IANATimezone, TimezoneOffset
+    from db.base import Base
+    from db.generations import begin_generation, publish_generation
+    from db.session import create_session
+
     print("🏙️  Building cities.db")
 
-    rebuild_db_if_needed(CITIES_DB_PATH)
+    # New generation seeded from the live one, so finished steps are skipped
+    db_path = begin_generation(CITIES_DB_PATH, copy_current=not config.FORCE_REBUILD)
 
-    geo_session, geo_engine = create_session(GEONAMES_DB_PATH)
-    city_session, city_engine = create_session(CITIES_DB_PATH)
+    geo_session, geo_engine = create_session(GEONAMES_DB_PATH, profile="reader")
+    city_session, city_engine = create_session(db_path)
 
     # Create tables
     Base.metadata.create_all(
@@ -122,41 +162,88 @@ def build_cities_db():
         tables=[
             IANATimezone.__table__,
             City.__table__,
+            TimezoneOffset.__table__,
+            CityStats.__table__,
         ],
     )
 
     # Populate iana_timezones
-    if FORCE_REBUILD or not city_session.query(IANATimezone).first():
+    if config.FORCE_REBUILD or not city_session.query(IANATimezone).first():
         print("🌍 Populating IANA timezones")
         build_timezones(geo_session, city_session)
     else:
         print("✅ iana_timezones already populated")
 
     # Populate cities
-    if FORCE_REBUILD or not city_session.query(City).first():
+    if config.FORCE_REBUILD or not city_session.query(City).first():
         print("🏗️  Populating cities table")
-
-        # Re-open GeoNames session for reading
-        geo_session, _ = create_session(GEONAMES_DB_PATH)
-
         build_cities(geo_session, city_session)
-
-        geo_session.close()
     else:
         print("✅ cities table already populated")
+
+    # Offsets depend on the current year, so the window is always refreshed
+    print(f"🕰️  Building {OFFSET_SCHEDULE_YEARS}-year UTC offset schedule")
+    build_offset_schedule(city_session, OFFSET_SCHEDULE_YEARS)
         
     create_indexes(city_engine)
+
+    # Cheap with the indexes in place; always matches the cities table
+    print("📊 Materializing per-timezone and per-country stats")
+    build_city_stats(city_session)
     
+    geo_session.close()
     city_session.close()
+
+    print("🧹 Optimizing cities.db")
+    report = optimize_cities_db(city_engine, compact=COMPACT_CITIES_DB)
+    for stage in ("before", "after"):
+        stats = report[stage]
+        print(
+            f"   {stage:>6}: {stats['bytes'] / 1024 / 1024:.1f} MiB "
+            f"({stats['page_count']} pages of {stats['page_size']} B)"
+        )
+
+    publish_generation(CITIES_DB_PATH, db_path)
+    print(f"🔀 cities.db now serving {db_path.name}")
+
+    if SHARD_CITIES_DB:
+        from cities_db.shards import build_shards
+
+        manifest = build_shards(CITIES_DB_PATH)
+        print(f"🧩 Split cities.db into {len(manifest['shards'])} UTC offset shards")
     
 def export_json():
-    city_session, _ = create_session(CITIES_DB_PATH)
+    from db.session import create_session
+    from export.tile_exporter import export_tiles
+    from export.timezone_json_exporter import export_cities_by_timezone, generate_timezone_index, precompress_exports
+    from export.timezone_pack import write_timezone_pack
+
+    city_session, _ = create_session(CITIES_DB_PATH, profile="reader")
     export_cities_by_timezone(
         session=city_session,
         output_dir=Path("json/timezones"),
     )
     
-    generate_timezone_index(Path("json/timezones"))
+    generate_timezone_index(Path("json/timezones"), session=city_session)
+
+    if EXPORT_PACK:
+        pack = write_timezone_pack(Path("json/timezones"))
+        if pack is not None:
+            print(
+                f"📦 Packed {len(pack['entries'])} timezones into {pack['pack']} "
+                f"({pack['size'] / 2**20:.1f} MiB, {pack['encoding']})"
+            )
+
+    if EXPORT_PRECOMPRESS:
+        compressed = precompress_exports(Path("json/timezones"))
+        print(f"🗜️  Precompressed {compressed} JSON files")
+
+    tiles = export_tiles(city_session, TILES_DIR)
+    if tiles is not None:
+        print(
+            f"🗺️  Exported {sum(tiles['tiles'].values())} map tiles "
+            f"({tiles['cities']} cities, z{tiles['min_zoom']}–z{tiles['max_zoom']})"
+        )
     
     city_session.close()
 
@@ -168,12 +255,14 @@ def init():
     export_json()
     
 def some_data():
-    
-    city_session, city_engine = create_session(CITIES_DB_PATH)
+    from cities_db.queries import bottom_cities_by_population_in_timezone, cities_at_hour, top_cities_by_population_at_hour, top_cities_by_population_in_timezone
+    from db.session import create_session
+
+    city_session, city_engine = create_session(CITIES_DB_PATH, profile="reader")
     
     print("🕔 Querying cities at hour 17")
 
-    cities = cities_at_hour(city_session, 17)
+    cities = cities_at_hour(city_session, 17, rows=True)
 
     print(f"✅ Found {len(cities)} cities currently between 17:00–17:59")
 
@@ -181,7 +270,7 @@ def some_data():
     for city in cities[:10]:
         print(
             f"{city.name}, {city.state}, {city.country}, {city.population}"
-            f"({city.timezone.name})"
+            f"({city.timezone})"
         )
 
     print("🎉 Done")
@@ -216,11 +305,150 @@ def some_data():
         
 
 
-def main():
-    print("🚀 Starting TimeFinder build pipeline")
-    init()
-    print("🤘 Build pipeline complete")
-    # some_data()
+def query_hour(hour: int, limit: int):
+    # Stdlib sqlite3 on the built database: no SQLAlchemy, no zoneinfo scan
+    from cities_db.lite_queries import cities_at_hour_lite, connect_readonly
+
+    conn = connect_readonly(CITIES_DB_PATH)
+    try:
+        cities = cities_at_hour_lite(conn, hour, limit=limit)
+    finally:
+        conn.close()
+
+    print(f"🕔 {len(cities)} most populated cities at {hour:02d}:00–{hour:02d}:59")
+    for name, state, country, population, tz_name in cities:
+        print(f"{name}, {state}, {country}, {population} ({tz_name})")
+
+
+def serve(kind: str, host: str | None, port: int | None, workers: int | None):
+    import asyncio
+    import logging
+
+    logging.basicConfig(level=logging.INFO)
+
+    if kind == "prefork":
+        from services.prefork_server import serve_prefork
+
+        serve_prefork(
+            CITIES_DB_PATH,
+            host or config.PREFORK_HOST,
+            port or config.PREFORK_PORT,
+            workers or config.PREFORK_WORKERS,
+        )
+    elif kind == "api":
+        from services.query_api import serve_api
+
+        asyncio.run(serve_api(CITIES_DB_PATH, host or config.API_HOST, port or config.API_PORT))
+    elif kind == "events":
+        from services.hour_flip_scheduler import serve_events
+
+        asyncio.run(serve_events(CITIES_DB_PATH, host or config.EVENTS_HOST, port or config.EVENTS_PORT))
+    else:
+        from services.static_server import serve_static
+
+        asyncio.run(serve_static(host or config.STATIC_HOST, port or config.STATIC_PORT))
+
+
+def import_time_report(argv: list[str]):
+    """
+    Re-run the command under `python -X importtime` and summarize it: wall
+    time of the whole process (interpreter start included) and the
+    slowest top-level imports.
+    """
+    import subprocess
+
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", __file__, *argv],
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    wall = time.perf_counter() - started
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            sys.stderr.write(line + "\n")
+            continue
+
+        fields = line[len("import time:"):].split("|")
+        try:
+            cumulative = int(fields[1])
+        except ValueError:
+            continue  # header line
+
+        # Nested imports are indented under their parent
+        name = fields[2]
+        if not name.startswith("  "):
+            imports.append((cumulative, name.strip()))
+
+    total = sum(us for us, _ in imports)
+    print(f"\n⏱️  {wall * 1000:.0f} ms wall, {total / 1000:.0f} ms in imports")
+    for us, name in sorted(imports, reverse=True)[:15]:
+        print(f"   {us / 1000:>7.1f} ms  {name}")
+
+    return result.returncode
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="main.py",
+        description="TimeFinder build pipeline and queries. Without a command, runs the whole pipeline.",
+    )
+    parser.add_argument("--force", action="store_true", help="rebuild even if outputs exist (FORCE_REBUILD)")
+    parser.add_argument("--import-time", action="store_true", help="report interpreter and import time")
+
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("download", help="download the GeoNames files")
+    commands.add_parser("import", help="build geonames.db from the downloaded files")
+    commands.add_parser("build", help="build cities.db from geonames.db")
+    commands.add_parser("export", help="write the timezone JSON files and map tiles")
+
+    query = commands.add_parser("query", help="query the built cities.db")
+    query_kinds = query.add_subparsers(dest="kind", required=True)
+    query_hour_parser = query_kinds.add_parser("hour", help="most populated cities at a local hour")
+    query_hour_parser.add_argument("hour", type=int, choices=range(24), metavar="HOUR")
+    query_hour_parser.add_argument("--limit", type=int, default=20)
+
+    serve_parser = commands.add_parser("serve", help="serve the exported files, hour flip events or city queries")
+    serve_parser.add_argument("kind", nargs="?", choices=("static", "events", "prefork", "api"), default="static")
+    serve_parser.add_argument("--host")
+    serve_parser.add_argument("--port", type=int)
+    serve_parser.add_argument("--workers", type=int, help="prefork worker processes")
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+
+    if args.import_time:
+        return import_time_report([a for a in argv if a != "--import-time"])
+
+    if args.force:
+        config.FORCE_REBUILD = True
+
+    if args.command is None:
+        print("🚀 Starting TimeFinder build pipeline")
+        init()
+        print("🤘 Build pipeline complete")
+        # some_data()
+    elif args.command == "download":
+        create_directories()
+        download_data()
+    elif args.command == "import":
+        build_geonames_db()
+    elif args.command == "build":
+        build_cities_db()
+    elif args.command == "export":
+        export_json()
+    elif args.command == "query":
+        query_hour(args.hour, args.limit)
+    elif args.command == "serve":
+        serve(args.kind, args.host, args.port, args.workers)
+
+    return 0
 
 
 
@@ -229,4 +457,4 @@ def main():
 # ---------------------------------------------------------
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,265 @@
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+from collections import Counter
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlsplit
+
+from sqlalchemy import select
+
+from cities_db import async_queries
+from cities_db.models import IANATimezone
+from config import EVENTS_HOST, EVENTS_PORT, FLIP_EVENT_TOP_CITIES, FLIP_SUBSCRIBER_QUEUE_SIZE
+from services.timezone_service import next_local_time_at
+
+logger = logging.getLogger(__name__)
+
+
+def _zone_names(session) -> list[str]:
+    return list(session.execute(select(IANATimezone.name)).scalars())
+
+
+class Subscription:
+    def __init__(self, scheduler, target: tuple[int, int]):
+        self.scheduler = scheduler
+        self.target = target
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=FLIP_SUBSCRIBER_QUEUE_SIZE)
+
+    def deliver(self, event: dict):
+        # A stalled client loses its oldest events, never blocks the rest
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def next_event(self) -> dict:
+        return await self.queue.get()
+
+    def close(self):
+        self.scheduler.unsubscribe(self)
+
+
+class HourFlipScheduler:
+    """
+    Pushes "zone Z just reached HH:MM" events to subscribers.
+
+    For every local time somebody subscribed to, each zone in cities.db has
+    one entry in a timer heap holding the next UTC instant (from zoneinfo)
+    it reaches that time. The loop sleeps until the earliest entry, fires
+    it, and re-arms that zone, so idle subscribers cost nothing between
+    flips.
+    """
+
+    def __init__(self, db_path, top_cities: int = FLIP_EVENT_TOP_CITIES, clock=None):
+        self.db_path = db_path
+        self.top_cities = top_cities
+        self.clock = clock or (lambda: datetime.now(timezone.utc))
+
+        self._zones: list[str] = []
+        self._timers: list[tuple[datetime, str, tuple[int, int], int]] = []
+        self._subscribers: dict[tuple[int, int], set[Subscription]] = {}
+        self._targets: Counter = Counter()
+        # Arming token per target; timers left over from an earlier
+        # subscription round carry an old token and are skipped
+        self._armed: dict[tuple[int, int], int] = {}
+        self._tokens = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    # -------------------------------------------------
+    # Subscriptions
+    # -------------------------------------------------
+
+    def subscribe(self, hour: int, minute: int = 0) -> Subscription:
+        target = (hour, minute)
+        subscription = Subscription(self, target)
+        self._subscribers.setdefault(target, set()).add(subscription)
+
+        self._targets[target] += 1
+        if self._targets[target] == 1:
+            self._arm_target(target)
+
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        target = subscription.target
+        self._subscribers.get(target, set()).discard(subscription)
+
+        self._targets[target] -= 1
+        if self._targets[target] <= 0:
+            del self._targets[target]
+            self._subscribers.pop(target, None)
+            # Its timers are dropped lazily when they fire
+            self._armed.pop(target, None)
+
+    # -------------------------------------------------
+    # Timer queue
+    # -------------------------------------------------
+
+    def _arm(self, tz_name: str, target: tuple[int, int], token: int, after: datetime):
+        try:
+            fire_at = next_local_time_at(tz_name, *target, after)
+        except Exception:
+            # Defensive: skip any broken zone
+            return
+        heapq.heappush(self._timers, (fire_at, tz_name, target, token))
+
+    def _arm_target(self, target: tuple[int, int]):
+        token = self._armed[target] = next(self._tokens)
+        now = self.clock()
+        for tz_name in self._zones:
+            self._arm(tz_name, target, token, now)
+        self._wakeup.set()
+
+    async def start(self):
+        self._zones = await async_queries.run_query(self.db_path, _zone_names)
+        for target in self._targets:
+            self._arm_target(target)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+
+            if not self._timers:
+                await self._wakeup.wait()
+                continue
+
+            delay = (self._timers[0][0] - self.clock()).total_seconds()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                    continue  # New target armed; re-check the head
+                except asyncio.TimeoutError:
+                    pass
+
+            now = self.clock()
+            due = []
+            while self._timers and self._timers[0][0] <= now:
+                due.append(heapq.heappop(self._timers))
+
+            for fire_at, tz_name, target, token in due:
+                if self._armed.get(target) != token:
+                    continue
+                self._arm(tz_name, target, token, fire_at)
+
+                try:
+                    await self._publish(fire_at, tz_name, target)
+                except Exception:
+                    logger.exception("Failed to publish flip for %s", tz_name)
+
+    async def _publish(self, fire_at: datetime, tz_name: str, target: tuple[int, int]):
+        subscribers = list(self._subscribers.get(target, ()))
+        if not subscribers:
+            return
+
+        cities = await async_queries.top_cities_by_population_in_timezone(
+            self.db_path,
+            tz_name,
+            self.top_cities,
+            rows=True,
+            columns=("name", "state", "country", "population"),
+        )
+
+        event = {
+            "timezone": tz_name,
+            "local_time": f"{target[0]:02d}:{target[1]:02d}",
+            "at": fire_at.isoformat(),
+            "top_cities": [dict(city._mapping) for city in cities],
+        }
+        logger.info("🔔 %s just hit %s", tz_name, event["local_time"])
+
+        for subscription in subscribers:
+            subscription.deliver(event)
+
+
+# ---------------------------------------------------------
+# Server-Sent Events endpoint
+# ---------------------------------------------------------
+
+async def _reply_empty(writer, status: str):
+    writer.write(f"HTTP/1.1 {status}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode("latin-1"))
+    await writer.drain()
+
+
+async def _handle_sse(scheduler: HourFlipScheduler, reader, writer):
+    try:
+        request_line = (await reader.readline()).decode("latin-1")
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+
+        try:
+            method, target, _ = request_line.split(" ", 2)
+        except ValueError:
+            await _reply_empty(writer, "400 Bad Request")
+            return
+
+        url = urlsplit(target)
+        params = parse_qs(url.query)
+
+        if method != "GET" or url.path != "/events":
+            await _reply_empty(writer, "404 Not Found")
+            return
+
+        try:
+            hour = int(params.get("hour", ["17"])[0])
+            minute = int(params.get("minute", ["0"])[0])
+        except ValueError:
+            await _reply_empty(writer, "400 Bad Request")
+            return
+
+        if not (0 <= hour < 24 and 0 <= minute < 60):
+            await _reply_empty(writer, "400 Bad Request")
+            return
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Access-Control-Allow-Origin: *\r\n"
+            b"Connection: keep-alive\r\n\r\n"
+        )
+        await writer.drain()
+
+        subscription = scheduler.subscribe(hour, minute)
+        try:
+            while True:
+                event = await subscription.next_event()
+                payload = json.dumps(event, ensure_ascii=False)
+                writer.write(f"event: flip\ndata: {payload}\n\n".encode("utf-8"))
+                await writer.drain()
+        finally:
+            subscription.close()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_events(db_path, host: str = EVENTS_HOST, port: int = EVENTS_PORT):
+    """
+    GET /events?hour=17&minute=0 streams one SSE "flip" event per zone
+    reaching that local time.
+    """
+    scheduler = HourFlipScheduler(db_path)
+    await scheduler.start()
+
+    server = await asyncio.start_server(
+        lambda r, w: _handle_sse(scheduler, r, w), host, port
+    )
+    logger.info("📡 Flip events on http://%s:%d/events", host, port)
+
+    async with server:
+        try:
+            await server.serve_forever()
+        finally:
+            await scheduler.stop()
@@ -0,0 +1,130 @@
+"""
+Minimal keep-alive HTTP/1.1 loop for the JSON endpoints
+(services.prefork_server, services.query_api).
+"""
+
+import asyncio
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Request bodies are never used; up to this many bytes are read and
+# dropped so the connection stays in sync, larger ones close it
+MAX_DISCARDED_BODY = 1 << 20
+
+
+def json_response(status: str, payload, keep_alive: bool) -> bytes:
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode("latin-1") + body
+
+
+async def _discard_body(reader, headers: dict) -> bool:
+    """
+    Read past the request body. False if it cannot be delimited (chunked,
+    bad or oversized Content-Length, truncated): the connection then has
+    to close, or its bytes would be parsed as the next request.
+    """
+    if "transfer-encoding" in headers:
+        return False
+
+    length = headers.get("content-length", "0")
+    if not length.isdigit() or int(length) > MAX_DISCARDED_BODY:
+        return False
+
+    try:
+        await reader.readexactly(int(length))
+    except asyncio.IncompleteReadError:
+        return False
+    return True
+
+
+class Connections:
+    """
+    Open connections of one server, split into idle (waiting for the
+    next request) and busy, so a shutdown can close the idle ones at
+    once and let the busy ones finish their current request.
+    """
+
+    def __init__(self):
+        self.idle: set = set()
+        self.busy: set = set()
+        self.closing = False
+
+    def close_idle(self):
+        """From now on every connection closes after its current response."""
+        self.closing = True
+        for writer in self.idle:
+            # readline() sees EOF and the handler returns normally
+            writer.close()
+
+    def close_all(self):
+        self.close_idle()
+        for writer in self.busy:
+            writer.close()
+
+
+async def handle_json(route, reader, writer, connections: Connections | None = None):
+    """
+    Serve requests on one connection until it closes. `route(method,
+    target)` is a coroutine returning (status line, JSON payload).
+    """
+    connections = connections or Connections()
+    connections.idle.add(writer)
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+
+            connections.idle.discard(writer)
+            connections.busy.add(writer)
+
+            headers = {}
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            try:
+                method, target, version = request_line.decode("latin-1").split()
+            except ValueError:
+                writer.write(json_response("400 Bad Request", {"error": "bad request"}, False))
+                break
+
+            keep_alive = (
+                version == "HTTP/1.1"
+                and headers.get("connection", "").lower() != "close"
+                and await _discard_body(reader, headers)
+            )
+
+            try:
+                status, payload = await route(method, target)
+            except Exception:
+                logger.exception("Request failed: %s %s", method, target)
+                status, payload = "500 Internal Server Error", {"error": "internal error"}
+
+            # A method the endpoint does not serve ends the connection
+            if status.startswith("405") or connections.closing:
+                keep_alive = False
+
+            writer.write(json_response(status, payload, keep_alive))
+            await writer.drain()
+
+            if not keep_alive:
+                break
+
+            connections.busy.discard(writer)
+            connections.idle.add(writer)
+    except (ConnectionError, asyncio.CancelledError):
+        # Cancelled: the server is shutting down and the connection is dropped
+        pass
+    finally:
+        connections.idle.discard(writer)
+        connections.busy.discard(writer)
+        writer.close()
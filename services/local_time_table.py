@@ -0,0 +1,266 @@
+"""
+Bulk UTC -> local time conversion from zoneinfo transition tables.
+
+    table = LocalTimeTable()
+    local = table.convert(timestamps, table.zone_ids(tz_names))
+    local.hour[i], local.minute[i], local.utc_offset[i], local.abbreviation[i]
+
+Every zone's transitions (read from the TZif files zoneinfo itself
+loads) go into one sorted table keyed by (zone id, UTC second). Most
+pairs are then a direct lookup in a per-zone bucket array, the others a
+bisect into that table (searchsorted), all run through map() and list
+comprehensions instead of one datetime per pair. Instants past `until`
+fall back to zoneinfo one by one.
+"""
+
+import struct
+import zoneinfo
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from importlib import resources
+from operator import add
+from pathlib import Path
+from typing import Iterable, NamedTuple, Optional, Sequence
+
+from config import LOCAL_TIME_TABLE_YEARS
+from services.timezone_service import offset_intervals
+
+# Keys are zone_id * _SPAN + (t - _T_MIN); transitions before _T_MIN
+# (TZif "big bang" sentinels) are clamped to it
+_T_MIN = -(1 << 40)
+_SPAN = 1 << 42
+
+# Instants from 1970 to `until` are also bucketed by 2**_BUCKET_BITS
+# seconds (~6 days), so most lookups skip the bisect
+_BUCKET_BITS = 19
+
+# Probe step after a zone's last explicit transition (footer rules
+# change offset at most twice a year)
+_TAIL_STEP = timedelta(days=7)
+_TAIL_FROM = datetime(1900, 1, 1, tzinfo=timezone.utc)
+
+
+class LocalTimes(NamedTuple):
+    hour: array
+    minute: array
+    utc_offset: array          # seconds east of UTC
+    abbreviation: list[str]
+
+
+# ---------------------------------------------------------
+# TZif
+# ---------------------------------------------------------
+
+def _tzif_bytes(tz_name: str) -> bytes:
+    # Same search order as zoneinfo: TZPATH, then the tzdata package
+    for directory in zoneinfo.TZPATH:
+        path = Path(directory) / tz_name
+        if path.is_file():
+            return path.read_bytes()
+
+    try:
+        package, _, name = f"tzdata.zoneinfo.{tz_name.replace('/', '.')}".rpartition(".")
+        return resources.files(package).joinpath(name).read_bytes()
+    except (ImportError, FileNotFoundError):
+        raise zoneinfo.ZoneInfoNotFoundError(tz_name) from None
+
+
+def _read_tzif(data: bytes):
+    """
+    (transitions, type of each transition, types as (utc offset, is_dst,
+    abbreviation), footer TZ string) of one TZif file (RFC 8536).
+    """
+    header = struct.Struct(">4sc15x6l")
+
+    magic, version, isutcnt, isstdcnt, leapcnt, timecnt, typecnt, charcnt = header.unpack_from(data)
+    if magic != b"TZif":
+        raise ValueError("not a TZif file")
+
+    time_format, time_size = ">{}l", 4
+    pos = header.size
+
+    if version != b"\x00":
+        # Skip the 32-bit block; v2+ repeats everything with 64-bit times
+        pos += timecnt * 5 + typecnt * 6 + charcnt + leapcnt * 8 + isstdcnt + isutcnt
+        _, _, isutcnt, isstdcnt, leapcnt, timecnt, typecnt, charcnt = header.unpack_from(data, pos)
+        time_format, time_size = ">{}q", 8
+        pos += header.size
+
+    transitions = struct.unpack_from(time_format.format(timecnt), data, pos)
+    pos += timecnt * time_size
+    type_idx = data[pos:pos + timecnt]
+    pos += timecnt
+
+    raw_types = [struct.unpack_from(">lbB", data, pos + i * 6) for i in range(typecnt)]
+    pos += typecnt * 6
+    chars = data[pos:pos + charcnt]
+    pos += charcnt + leapcnt * (time_size + 4) + isstdcnt + isutcnt
+
+    types = [
+        (utcoff, bool(isdst), chars[abbrind:chars.index(b"\x00", abbrind)].decode())
+        for utcoff, isdst, abbrind in raw_types
+    ]
+
+    footer = None
+    if version != b"\x00":
+        footer = data[pos + 1:data.index(b"\n", pos + 1)].decode()
+
+    return transitions, list(type_idx), types, footer
+
+
+def _zone_entries(tz_name: str, until: datetime) -> list[tuple[int, tuple]]:
+    """[(starts_at, (utc offset, abbreviation))] for one zone, up to `until`."""
+    transitions, type_idx, types, footer = _read_tzif(_tzif_bytes(tz_name))
+    end = int(until.timestamp())
+
+    entries = []
+    if transitions:
+        # Like zoneinfo: before the first transition, the first standard-time type
+        before = next((t for t in types if not t[1]), types[0])
+        entries.append((_T_MIN, before))
+        entries += [(max(t, _T_MIN), types[i]) for t, i in zip(transitions, type_idx) if t < end]
+
+    # After the last transition zoneinfo follows the footer's rule, so
+    # those intervals come from zoneinfo itself. Zones without
+    # transitions start at _TAIL_FROM; earlier instants fall back.
+    tail_from = _TAIL_FROM
+    if transitions and transitions[-1] > _TAIL_FROM.timestamp():
+        tail_from = datetime.fromtimestamp(transitions[-1], timezone.utc)
+
+    if tail_from < until:
+        # A footer without rules ("<+07>-7") has a single interval
+        step = _TAIL_STEP if footer and "," in footer else until - tail_from
+        for starts_at, _, utc_offset, abbreviation, _ in offset_intervals(tz_name, tail_from, until, step):
+            entries.append((int(starts_at.timestamp()), (utc_offset, False, abbreviation)))
+
+    return [(t, (utc_offset, abbreviation)) for t, (utc_offset, _, abbreviation) in entries]
+
+
+# ---------------------------------------------------------
+# Table
+# ---------------------------------------------------------
+
+class LocalTimeTable:
+    def __init__(self, zones: Optional[Iterable[str]] = None, until: Optional[datetime] = None):
+        if until is None:
+            until = datetime(datetime.now(timezone.utc).year + LOCAL_TIME_TABLE_YEARS, 1, 1, tzinfo=timezone.utc)
+
+        self.zones = sorted(zoneinfo.available_timezones() if zones is None else zones)
+        self.until = until
+        self._zone_index = {name: i for i, name in enumerate(self.zones)}
+        self._zoneinfos = [zoneinfo.ZoneInfo(name) for name in self.zones]
+
+        end = int(until.timestamp())
+        self._buckets_per_row = max(0, -(-end >> _BUCKET_BITS))
+
+        # bisect_right(keys, key) - 1 is the entry in effect, so the
+        # per-entry values are stored one slot to the right; None marks
+        # "outside the table"
+        keys = []
+        offsets = [0]
+        abbreviations = [None]
+        buckets = array("i")
+
+        # Links and zones with identical histories share one row
+        rows: dict[tuple, int] = {}
+        zone_rows = []
+
+        for tz_name in self.zones:
+            entries = _zone_entries(tz_name, until)
+            row = rows.get(tuple(entries))
+            if row is None:
+                row = rows[tuple(entries)] = len(rows)
+                first = len(keys)
+
+                entries = [(_T_MIN, None), *entries, (end, None)]
+                keys += [row * _SPAN + t - _T_MIN for t, _ in entries]
+                offsets += [info[0] if info else 0 for _, info in entries]
+                abbreviations += [info[1] if info else None for _, info in entries]
+                buckets += self._row_buckets([t for t, _ in entries], first)
+            zone_rows.append(row)
+
+        # Index -1 (not in the indexed window) reads this trailing -1
+        buckets.append(-1)
+
+        self._keys = keys
+        self._offsets = array("i", offsets)
+        self._abbreviations = abbreviations
+        self._buckets = buckets
+        self._zone_rows = array("H", zone_rows)
+        # First bucket of each zone's row
+        self._zone_buckets = array("q", [row * self._buckets_per_row for row in zone_rows])
+
+    def _row_buckets(self, times: list[int], first: int) -> array:
+        """
+        Value slot in effect for each bucket of one row, or -1 where a
+        transition falls inside the bucket.
+        """
+        width = 1 << _BUCKET_BITS
+        row = array("i", bytes(4 * self._buckets_per_row))
+
+        j = 0
+        for b in range(self._buckets_per_row):
+            start = b * width
+            while j + 1 < len(times) and times[j + 1] <= start:
+                j += 1
+            row[b] = -1 if j + 1 < len(times) and times[j + 1] < start + width else first + j + 1
+
+        return row
+
+    def __len__(self) -> int:
+        """Transitions stored, over all distinct zone histories."""
+        return len(self._keys)
+
+    def zone_ids(self, tz_names: Iterable[str]) -> array:
+        try:
+            return array("H", map(self._zone_index.__getitem__, tz_names))
+        except KeyError as e:
+            raise zoneinfo.ZoneInfoNotFoundError(e.args[0]) from None
+
+    def convert(self, timestamps: Sequence[int], zone_ids: Sequence[int]) -> LocalTimes:
+        """
+        Local hour, minute, UTC offset and abbreviation of every
+        (integer UTC epoch second, zone id) pair.
+        """
+        if len(timestamps) != len(zone_ids):
+            raise ValueError("timestamps and zone_ids differ in length")
+
+        zone_rows = self._zone_rows
+        per_row = self._buckets_per_row
+
+        # Direct lookup for buckets without a transition...
+        buckets = [
+            first + b if 0 <= (b := t >> _BUCKET_BITS) < per_row else -1
+            for t, first in zip(timestamps, map(self._zone_buckets.__getitem__, zone_ids))
+        ]
+        slots = list(map(self._buckets.__getitem__, buckets))
+
+        # ...a bisect (searchsorted) for the rest
+        if -1 in slots:
+            search = partial(bisect_right, self._keys)
+            for i in [i for i, slot in enumerate(slots) if slot < 0]:
+                slots[i] = search(zone_rows[zone_ids[i]] * _SPAN + timestamps[i] - _T_MIN)
+
+        utc_offset = array("i", map(self._offsets.__getitem__, slots))
+        abbreviation = list(map(self._abbreviations.__getitem__, slots))
+
+        if None in abbreviation:
+            self._fallback(timestamps, zone_ids, utc_offset, abbreviation)
+
+        seconds = [s % 86400 for s in map(add, timestamps, utc_offset)]
+        return LocalTimes(
+            hour=array("b", [s // 3600 for s in seconds]),
+            minute=array("b", [s // 60 % 60 for s in seconds]),
+            utc_offset=utc_offset,
+            abbreviation=abbreviation,
+        )
+
+    def _fallback(self, timestamps, zone_ids, utc_offset, abbreviation):
+        for i, abbr in enumerate(abbreviation):
+            if abbr is not None:
+                continue
+            local = datetime.fromtimestamp(timestamps[i], self._zoneinfos[zone_ids[i]])
+            utc_offset[i] = int(local.utcoffset().total_seconds())
+            abbreviation[i] = local.tzname()
@@ -0,0 +1,240 @@
+"""
+Prefork serve mode: one master loads the cities snapshot, then forks
+workers that all accept on the same listening socket.
+
+The snapshot is a handful of flat buffers (cities_db/snapshot.py), and
+gc.freeze() moves every object loaded before the fork out of the
+collector's reach, so workers share those pages copy-on-write instead of
+each holding its own copy. POSIX only (os.fork).
+
+When a new cities.db generation is published (db/generations.py) the
+master loads a fresh snapshot, forks a new set of workers on the same
+socket and lets the old ones drain.
+
+    GET /cities?hour=17&limit=20   most populated cities at that local hour
+    GET /health                    worker pid and snapshot size
+"""
+
+import asyncio
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from config import (
+    CITIES_DB_PATH,
+    PREFORK_DRAIN_SECONDS,
+    PREFORK_HOST,
+    PREFORK_PORT,
+    PREFORK_RELOAD_INTERVAL,
+    PREFORK_WORKERS,
+)
+from cities_db.snapshot import CitySnapshot
+from db.generations import GenerationWatcher
+from services.json_http import Connections, handle_json
+
+logger = logging.getLogger(__name__)
+
+CITY_FIELDS = ("name", "state", "country", "population", "timezone")
+
+
+def _route(snapshot: CitySnapshot, method: str, target: str) -> tuple[str, object]:
+    url = urlsplit(target)
+    params = parse_qs(url.query)
+
+    if method != "GET":
+        return "405 Method Not Allowed", {"error": "GET only"}
+
+    if url.path == "/health":
+        return "200 OK", {"pid": os.getpid(), "cities": len(snapshot)}
+
+    if url.path != "/cities":
+        return "404 Not Found", {"error": "not found"}
+
+    try:
+        hour = int(params.get("hour", ["17"])[0])
+        limit = int(params.get("limit", ["20"])[0])
+    except ValueError:
+        return "400 Bad Request", {"error": "hour and limit must be integers"}
+
+    if not (0 <= hour < 24 and 0 < limit <= 1000):
+        return "400 Bad Request", {"error": "hour must be 0-23, limit 1-1000"}
+
+    cities = snapshot.cities_at_hour(hour, limit=limit)
+    return "200 OK", [dict(zip(CITY_FIELDS, city)) for city in cities]
+
+
+async def _serve(snapshot: CitySnapshot, sock: socket.socket):
+    async def route(method: str, target: str):
+        return _route(snapshot, method, target)
+
+    stopping = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopping.set)
+
+    connections = Connections()
+    server = await asyncio.start_server(lambda r, w: handle_json(route, r, w, connections), sock=sock)
+    await stopping.wait()
+
+    # Stop accepting (no wait_closed(): from 3.12 on it waits for every
+    # connection), close idle keep-alive connections, give the busy ones
+    # PREFORK_DRAIN_SECONDS to finish and then drop them
+    server.close()
+    connections.close_idle()
+
+    handlers = asyncio.all_tasks() - {asyncio.current_task()}
+    if handlers:
+        _, pending = await asyncio.wait(handlers, timeout=PREFORK_DRAIN_SECONDS)
+        if pending:
+            connections.close_all()
+            await asyncio.wait(pending, timeout=1)
+
+
+def _worker(sock: socket.socket, snapshot: CitySnapshot | None, db_path):
+    gc.enable()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    if snapshot is None:
+        # preload=False: every worker pays for its own copy
+        snapshot = CitySnapshot(db_path)
+
+    asyncio.run(_serve(snapshot, sock))
+
+
+def _load_snapshot(db_path) -> CitySnapshot:
+    started = time.perf_counter()
+
+    # No collections while loading: they would only touch objects that
+    # are about to be frozen anyway
+    gc.disable()
+    snapshot = CitySnapshot(db_path)
+    logger.info(
+        "🧊 Snapshot: %d cities, %.1f MiB of buffers, loaded in %.0f ms",
+        len(snapshot), snapshot.nbytes() / 2**20, (time.perf_counter() - started) * 1000,
+    )
+    return snapshot
+
+
+def _fork_workers(sock: socket.socket, snapshot: CitySnapshot | None, db_path, workers: int) -> list[int]:
+    # Everything allocated so far goes to the permanent generation, so no
+    # worker's collector ever writes to those objects' headers
+    gc.freeze()
+
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _worker(sock, snapshot, db_path)
+            finally:
+                os._exit(0)
+        pids.append(pid)
+
+    return pids
+
+
+def _reap(pids: list[int]) -> int:
+    """Remove workers that exited on their own from `pids`; how many did."""
+    exited = 0
+    while True:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            break
+        if pid in pids:
+            pids.remove(pid)
+            exited += 1
+            logger.warning("💥 Worker %d exited (status %d), starting a replacement", pid, status)
+    return exited
+
+
+def _stop_workers(pids: list[int]):
+    """SIGTERM (drain, then exit) every worker and wait for them."""
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    for pid in pids:
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+
+
+def serve_prefork(
+    db_path=CITIES_DB_PATH,
+    host: str = PREFORK_HOST,
+    port: int = PREFORK_PORT,
+    workers: int = PREFORK_WORKERS,
+    preload: bool = True,
+):
+    """
+    Load the snapshot (unless preload=False), fork `workers` processes on
+    one listening socket and supervise them: every PREFORK_RELOAD_INTERVAL
+    seconds the master replaces workers that died and checks for a new
+    generation of db_path; if there is one, it swaps in fresh workers on
+    the new data. SIGTERM / SIGINT on the master stops every worker.
+    """
+    started = time.perf_counter()
+
+    watcher = GenerationWatcher(db_path)
+    snapshot = _load_snapshot(db_path) if preload else None
+
+    # The master keeps the socket open: replacement workers accept on it
+    sock = socket.create_server((host, port), backlog=1024)
+
+    pids = _fork_workers(sock, snapshot, db_path, workers)
+    logger.info(
+        "🍴 %d workers on http://%s:%d/ (forked %.0f ms after start)",
+        workers, host, port, (time.perf_counter() - started) * 1000,
+    )
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    try:
+        while not stopping:
+            time.sleep(PREFORK_RELOAD_INTERVAL)
+            if stopping:
+                break
+
+            exited = _reap(pids)
+            if exited:
+                pids += _fork_workers(sock, snapshot, db_path, exited)
+
+            if not watcher.changed():
+                continue
+
+            logger.info("🔄 New generation %s, replacing workers", watcher.generation.name)
+
+            # The old snapshot goes once the old workers no longer share it
+            gc.unfreeze()
+            snapshot = None
+            if preload:
+                snapshot = _load_snapshot(db_path)
+
+            # New workers accept before the old ones stop, so the socket
+            # is never left without a listener
+            previous, pids = pids, _fork_workers(sock, snapshot, db_path, workers)
+            _stop_workers(previous)
+    finally:
+        _stop_workers(pids)
+        sock.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    serve_prefork()
@@ -0,0 +1,93 @@
+"""
+JSON API over cities_db.queries (through cities_db.async_queries).
+
+    GET /cities?hour=17&limit=20&offset=40      most populated first, paged
+    GET /cities?hour=17&limit=20&round_robin=country   (one page, no offset)
+    GET /random?hour=17                         one random city at that hour
+    GET /health
+"""
+
+import asyncio
+import logging
+from urllib.parse import parse_qs, urlsplit
+
+from cities_db import async_queries
+from config import API_HOST, API_PORT, CITIES_DB_PATH
+from services.json_http import handle_json
+
+logger = logging.getLogger(__name__)
+
+CITY_COLUMNS = ("name", "state", "country", "country_code", "population", "timezone")
+ROUND_ROBIN_COLUMNS = ("country", "country_code", "state", "timezone")
+MAX_LIMIT = 1000
+
+
+def _int_param(params: dict, name: str, default: int, low: int, high: int) -> int:
+    value = int(params.get(name, [str(default)])[0])
+    if not low <= value <= high:
+        raise ValueError(f"{name} must be {low}-{high}")
+    return value
+
+
+async def _route(db_path, method: str, target: str) -> tuple[str, object]:
+    url = urlsplit(target)
+    params = parse_qs(url.query)
+
+    if method != "GET":
+        return "405 Method Not Allowed", {"error": "GET only"}
+
+    if url.path == "/health":
+        return "200 OK", {"status": "ok"}
+
+    if url.path not in ("/cities", "/random"):
+        return "404 Not Found", {"error": "not found"}
+
+    try:
+        hour = _int_param(params, "hour", 17, 0, 23)
+        limit = _int_param(params, "limit", 20, 1, MAX_LIMIT)
+        offset = _int_param(params, "offset", 0, 0, 10**9)
+    except ValueError as e:
+        return "400 Bad Request", {"error": str(e)}
+
+    if url.path == "/random":
+        city = await async_queries.random_city_at_hour(db_path, hour, rows=True, columns=CITY_COLUMNS)
+        if city is None:
+            return "404 Not Found", {"error": f"no cities at hour {hour}"}
+        return "200 OK", dict(city._mapping)
+
+    round_robin_by = params.get("round_robin", [None])[0]
+    if round_robin_by is not None:
+        if round_robin_by not in ROUND_ROBIN_COLUMNS:
+            return "400 Bad Request", {"error": f"round_robin must be one of {ROUND_ROBIN_COLUMNS}"}
+        # cities_at_hour is unordered and interleaves within one page, so
+        # offsets would not page through a stable sequence
+        if offset:
+            return "400 Bad Request", {"error": "offset cannot be combined with round_robin"}
+        cities = await async_queries.cities_at_hour(
+            db_path, hour, limit, round_robin_by, rows=True, columns=CITY_COLUMNS,
+        )
+    else:
+        cities = await async_queries.top_cities_by_population_at_hour(
+            db_path, hour, limit, rows=True, columns=CITY_COLUMNS, offset=offset,
+        )
+
+    return "200 OK", [dict(city._mapping) for city in cities]
+
+
+async def serve_api(db_path=CITIES_DB_PATH, host: str = API_HOST, port: int = API_PORT):
+    async def route(method: str, target: str):
+        return await _route(db_path, method, target)
+
+    server = await asyncio.start_server(lambda r, w: handle_json(route, r, w), host, port)
+    logger.info("🔎 Query API on http://%s:%d/", host, port)
+
+    async with server:
+        try:
+            await server.serve_forever()
+        finally:
+            async_queries.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve_api())
@@ -0,0 +1,444 @@
+"""
+Static serve mode for the exported tree (index.html, dist/, json/timezones/).
+
+Strong ETags are content hashes and If-None-Match is answered with 304.
+Precompressed .br/.gz siblings are served when the client accepts them,
+and bodies go out with sendfile. Range requests, including multi-range
+(multipart/byteranges), are served from the uncompressed file, which is
+how clients read single entries of the packed export
+(export/timezone_pack.py). Cache-Control follows the data:
+timezone.json expires at the next hour flip of any exported zone, the
+other files at their next scheduled rebuild.
+"""
+
+import asyncio
+import hashlib
+import logging
+import mimetypes
+import os
+import secrets
+import zoneinfo
+from datetime import datetime, timezone
+from email.utils import formatdate
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+from config import (
+    DATA_REBUILD_INTERVAL,
+    STATIC_HOST,
+    STATIC_MOUNTS,
+    STATIC_PORT,
+    TIMEZONE_INDEX_FILE_NAME,
+)
+from export.timezone_json_exporter import safe_tz_filename
+from services.timezone_service import hour_flip_schedule
+
+logger = logging.getLogger(__name__)
+
+# Precompressed siblings, preferred first
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+mimetypes.add_type("application/json", ".json")
+
+
+def _accepted_encodings(header: str) -> set[str]:
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticFiles:
+    def __init__(self, mounts=STATIC_MOUNTS, rebuild_interval: int = DATA_REBUILD_INTERVAL, clock=None):
+        # Longest prefix wins
+        self.mounts = sorted(
+            ((prefix, Path(target).resolve()) for prefix, target in mounts.items()),
+            key=lambda mount: -len(mount[0]),
+        )
+        self.rebuild_interval = rebuild_interval
+        self.clock = clock or (lambda: datetime.now(timezone.utc))
+
+        # path -> (mtime_ns, size, etag)
+        self._etags: dict[Path, tuple[int, int, str]] = {}
+        # index path -> (index mtime_ns, next flip)
+        self._flips: dict[Path, tuple[int, datetime]] = {}
+
+    # -------------------------------------------------
+    # Lookup
+    # -------------------------------------------------
+
+    def resolve(self, url_path: str) -> Path | None:
+        for prefix, target in self.mounts:
+            if target.is_file():
+                if url_path == prefix:
+                    return target
+                continue
+
+            if not url_path.startswith(prefix):
+                continue
+
+            path = (target / url_path[len(prefix):]).resolve()
+            # No escaping the mount through "..", symlinks or variants
+            if target in path.parents and path.is_file() and path.suffix not in (".br", ".gz"):
+                return path
+
+        return None
+
+    def variant(self, path: Path, accept_encoding: str) -> tuple[Path, os.stat_result, str | None]:
+        accepted = _accepted_encodings(accept_encoding)
+
+        for coding, suffix in ENCODINGS:
+            if coding not in accepted:
+                continue
+            candidate = path.with_name(path.name + suffix)
+            try:
+                stat = candidate.stat()
+            except FileNotFoundError:
+                continue
+            # A sibling older than its source is left over from a past export
+            if stat.st_mtime_ns >= path.stat().st_mtime_ns:
+                return candidate, stat, coding
+
+        return path, path.stat(), None
+
+    def etag(self, path: Path, stat: os.stat_result) -> str:
+        cached = self._etags.get(path)
+        if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+
+        digest = hashlib.sha256()
+        with path.open("rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+
+        etag = f'"{digest.hexdigest()[:32]}"'
+        self._etags[path] = (stat.st_mtime_ns, stat.st_size, etag)
+        return etag
+
+    # -------------------------------------------------
+    # Freshness
+    # -------------------------------------------------
+
+    def next_flip(self, index_path: Path) -> datetime:
+        """
+        Next instant any zone exported next to `index_path` changes its
+        local hour, i.e. when the set of zones at each hour changes.
+        """
+        now = self.clock()
+        mtime_ns = index_path.stat().st_mtime_ns
+
+        cached = self._flips.get(index_path)
+        if cached is not None and cached[0] == mtime_ns and now < cached[1]:
+            return cached[1]
+
+        # File names are lossy ("_" stands for "/"); map them back through
+        # the zones zoneinfo knows
+        by_file = {safe_tz_filename(name): name for name in zoneinfo.available_timezones()}
+        zones = [
+            by_file[p.stem]
+            for p in index_path.parent.glob("*.json")
+            if p.name != TIMEZONE_INDEX_FILE_NAME and p.stem in by_file
+        ]
+
+        schedule = hour_flip_schedule(zones, now)
+        flip = min((flip for _, flip, _ in schedule.values()), default=now)
+
+        self._flips[index_path] = (mtime_ns, flip)
+        return flip
+
+    def cache_control(self, path: Path, stat: os.stat_result) -> str:
+        if path.suffix == ".html":
+            return "no-cache"
+
+        now = self.clock()
+        if path.name == TIMEZONE_INDEX_FILE_NAME:
+            expires = self.next_flip(path)
+        else:
+            expires = datetime.fromtimestamp(stat.st_mtime + self.rebuild_interval, timezone.utc)
+
+        max_age = max(0, int((expires - now).total_seconds()))
+        return f"public, max-age={max_age}"
+
+
+# ---------------------------------------------------------
+# HTTP
+# ---------------------------------------------------------
+
+REASONS = {
+    200: "OK",
+    206: "Partial Content",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    416: "Range Not Satisfiable",
+}
+
+# More ranges than this in one request are ignored (the whole file is sent)
+MAX_RANGES = 16
+
+# Request bodies are never used; up to this many bytes are read and
+# dropped so the connection stays in sync, larger ones close it
+MAX_DISCARDED_BODY = 1 << 20
+
+
+def _head(status: int, headers: list[tuple[str, str]], keep_alive: bool) -> bytes:
+    lines = [f"HTTP/1.1 {status} {REASONS[status]}"]
+    lines.append(f"Date: {formatdate(usegmt=True)}")
+    lines.extend(f"{name}: {value}" for name, value in headers)
+    lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def parse_ranges(header: str, size: int) -> list[tuple[int, int]] | None:
+    """
+    (start, end inclusive) byte ranges of a Range header, sorted, with
+    overlapping and adjacent ranges merged, so no byte is sent twice.
+    None means the header is to be ignored (not bytes, malformed, too
+    many ranges); an empty list means no range is satisfiable.
+    """
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes" or not specs.strip():
+        return None
+
+    parts = specs.split(",")
+    if len(parts) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for part in parts:
+        first, dash, last = part.strip().partition("-")
+        if not dash:
+            return None
+        try:
+            if first == "":
+                # Suffix range: the last N bytes
+                length = int(last)
+                if length < 0:
+                    return None
+                if length and size:
+                    ranges.append((max(0, size - length), size - 1))
+                continue
+
+            start = int(first)
+            end = int(last) if last else None
+        except ValueError:
+            return None
+
+        if start < 0 or (end is not None and end < start):
+            return None
+        if start < size:
+            ranges.append((start, size - 1 if end is None else min(end, size - 1)))
+
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    # Disjoint after the merge; never more than the file itself
+    if sum(end - start + 1 for start, end in merged) > size:
+        return None
+
+    return merged
+
+
+async def _send_file(writer, path: Path, ranges: list[tuple[int, int]]):
+    await writer.drain()
+    with path.open("rb") as f:
+        for start, end in ranges:
+            # os.sendfile on plain TCP transports, read/write otherwise
+            await asyncio.get_running_loop().sendfile(writer.transport, f, start, end - start + 1)
+
+
+async def _respond_ranges(writer, method, path, stat, ranges, content_type, common, keep_alive):
+    size = stat.st_size
+
+    if not ranges:
+        writer.write(_head(416, common + [
+            ("Content-Range", f"bytes */{size}"),
+            ("Content-Length", "0"),
+        ], keep_alive))
+        return
+
+    if len(ranges) == 1:
+        (start, end), = ranges
+        writer.write(_head(206, common + [
+            ("Content-Type", content_type),
+            ("Content-Range", f"bytes {start}-{end}/{size}"),
+            ("Content-Length", str(end - start + 1)),
+        ], keep_alive))
+        if method == "GET":
+            await _send_file(writer, path, ranges)
+        return
+
+    # multipart/byteranges: each part is a header block, then its bytes
+    boundary = secrets.token_hex(16)
+    part_heads = [
+        (
+            f"\r\n--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode("latin-1")
+        for start, end in ranges
+    ]
+    tail = f"\r\n--{boundary}--\r\n".encode("latin-1")
+    length = sum(map(len, part_heads)) + sum(end - start + 1 for start, end in ranges) + len(tail)
+
+    writer.write(_head(206, common + [
+        ("Content-Type", f"multipart/byteranges; boundary={boundary}"),
+        ("Content-Length", str(length)),
+    ], keep_alive))
+    if method != "GET":
+        return
+
+    for part_head, byte_range in zip(part_heads, ranges):
+        writer.write(part_head)
+        await _send_file(writer, path, [byte_range])
+    writer.write(tail)
+
+
+async def _respond(files: StaticFiles, writer, method: str, target: str, headers: dict, keep_alive: bool):
+    if method not in ("GET", "HEAD"):
+        writer.write(_head(405, [("Allow", "GET, HEAD"), ("Content-Length", "0")], keep_alive))
+        return
+
+    url_path = unquote(urlsplit(target).path)
+    if url_path == "/":
+        url_path = "/index.html"
+
+    path = files.resolve(url_path)
+    if path is None:
+        writer.write(_head(404, [("Content-Length", "0")], keep_alive))
+        return
+
+    # Ranges address the file itself, never a compressed variant
+    range_header = headers.get("range")
+    if range_header:
+        body, stat, coding = path, path.stat(), None
+    else:
+        body, stat, coding = files.variant(path, headers.get("accept-encoding", ""))
+    etag = files.etag(body, stat)
+
+    content_type, _ = mimetypes.guess_type(path.name)
+    content_type = content_type or "application/octet-stream"
+    if content_type.startswith("text/") or content_type == "application/json":
+        content_type += "; charset=utf-8"
+
+    common = [
+        ("ETag", etag),
+        ("Cache-Control", files.cache_control(path, stat)),
+        ("Vary", "Accept-Encoding"),
+        ("Accept-Ranges", "bytes"),
+    ]
+
+    if _etag_matches(headers.get("if-none-match", ""), etag):
+        writer.write(_head(304, common, keep_alive))
+        return
+
+    # If-Range with another ETag: the client's ranges are of an older
+    # file, so it gets the current one whole. The bare digest (the
+    # packed export's index "hash") is accepted as well as the quoted ETag
+    if range_header and headers.get("if-range", etag).strip() in (etag, etag.strip('"')):
+        ranges = parse_ranges(range_header, stat.st_size)
+        if ranges is not None:
+            await _respond_ranges(writer, method, body, stat, ranges, content_type, common, keep_alive)
+            return
+
+    response = common + [
+        ("Content-Type", content_type),
+        ("Content-Length", str(stat.st_size)),
+        ("Last-Modified", formatdate(stat.st_mtime, usegmt=True)),
+    ]
+    if coding:
+        response.append(("Content-Encoding", coding))
+
+    writer.write(_head(200, response, keep_alive))
+
+    if method == "GET" and stat.st_size:
+        await _send_file(writer, body, [(0, stat.st_size - 1)])
+
+
+async def _discard_body(reader, headers: dict) -> bool:
+    """
+    Read past the request body. False if it cannot be delimited (chunked,
+    bad or oversized Content-Length, truncated): the connection then has
+    to close, or its bytes would be parsed as the next request.
+    """
+    if "transfer-encoding" in headers:
+        return False
+
+    length = headers.get("content-length", "0")
+    if not length.isdigit() or int(length) > MAX_DISCARDED_BODY:
+        return False
+
+    try:
+        await reader.readexactly(int(length))
+    except asyncio.IncompleteReadError:
+        return False
+    return True
+
+
+async def _handle(files: StaticFiles, reader, writer):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+
+            headers = {}
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            try:
+                method, target, version = request_line.decode("latin-1").split()
+            except ValueError:
+                writer.write(_head(400, [("Content-Length", "0")], False))
+                break
+
+            keep_alive = (
+                version == "HTTP/1.1"
+                and headers.get("connection", "").lower() != "close"
+                and await _discard_body(reader, headers)
+            )
+
+            await _respond(files, writer, method, target, headers, keep_alive)
+            await writer.drain()
+
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_static(host: str = STATIC_HOST, port: int = STATIC_PORT, mounts=STATIC_MOUNTS):
+    files = StaticFiles(mounts)
+
+    server = await asyncio.start_server(lambda r, w: _handle(files, r, w), host, port)
+    logger.info("📦 Serving static files on http://%s:%d/", host, port)
+
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve_static())
@@ -1,13 +1,16 @@
 import logging
-from datetime import datetime, timezone
+import math
+from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo, available_timezones
 
 from sqlalchemy import select
 from cities_db.models import IANATimezone
+from db.diagnostics import instrumented
 
 logger = logging.getLogger(__name__)
 
 
+@instrumented
 def timezones_at_hour(session, target_hour: int) -> list[str]:
     """
     Returns IANA timezone names that currently have the given local hour,
@@ -47,7 +50,163 @@ def timezones_at_hour(session, target_hour: int) -> list[str]:
             sorted(missing_timezones),
         )
 
-    print(f"✅ Found {existing_timezones} timezones at hour {target_hour}")
+    logger.debug("✅ Found %s timezones at hour %d", existing_timezones, target_hour)
 
     # 4. Return only valid timezones
     return sorted(existing_timezones)
+
+
+def local_hours_by_timezone(session, now_utc: datetime | None = None) -> dict[int, int]:
+    """
+    Maps every timezone id in cities.db to its current local hour,
+    evaluating each zone exactly once.
+    """
+
+    now_utc = now_utc or datetime.now(timezone.utc)
+    hours: dict[int, int] = {}
+
+    for tz_id, tz_name in session.execute(select(IANATimezone.id, IANATimezone.name)):
+        try:
+            hours[tz_id] = now_utc.astimezone(ZoneInfo(tz_name)).hour
+        except Exception:
+            # Defensive: skip any broken zone
+            continue
+
+    return hours
+
+
+
+def _next_offset_change(zone: ZoneInfo, start: datetime, end: datetime) -> datetime:
+    """
+    Binary search for the first whole second in (start, end] whose
+    UTC offset differs from the offset at `start`.
+    """
+
+    offset = start.astimezone(zone).utcoffset()
+    lo = math.floor(start.timestamp())
+    hi = math.ceil(end.timestamp())
+
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if datetime.fromtimestamp(mid, zone).utcoffset() == offset:
+            lo = mid
+        else:
+            hi = mid
+
+    return datetime.fromtimestamp(hi, timezone.utc)
+
+
+def next_hour_flip(tz_name: str, now_utc: datetime) -> tuple[int, datetime, int]:
+    """
+    Returns (current local hour, UTC instant of the next local hour change,
+    local hour after that change) for one timezone.
+
+    DST transitions inside the current hour are honoured, so the returned
+    instant is never later than the real change.
+    """
+
+    zone = ZoneInfo(tz_name)
+    local_time = now_utc.astimezone(zone)
+
+    into_hour = timedelta(
+        minutes=local_time.minute,
+        seconds=local_time.second,
+        microseconds=local_time.microsecond,
+    )
+    flip_at = now_utc + timedelta(hours=1) - into_hour
+
+    # Offset changes before the next top of the hour (DST, or a zone
+    # changing its rules) move the flip forward.
+    if (flip_at - timedelta(microseconds=1)).astimezone(zone).utcoffset() != local_time.utcoffset():
+        flip_at = _next_offset_change(zone, now_utc, flip_at)
+
+    return local_time.hour, flip_at, flip_at.astimezone(zone).hour
+
+
+def hour_flip_schedule(tz_names, now_utc: datetime | None = None) -> dict[str, tuple[int, datetime, int]]:
+    """
+    next_hour_flip() for every given timezone, skipping names zoneinfo
+    doesn't know.
+    """
+
+    now_utc = now_utc or datetime.now(timezone.utc)
+    schedule = {}
+
+    for tz_name in tz_names:
+        try:
+            schedule[tz_name] = next_hour_flip(tz_name, now_utc)
+        except Exception:
+            # Defensive: skip any broken zone
+            continue
+
+    return schedule
+
+
+def offset_intervals(tz_name: str, start_utc: datetime, end_utc: datetime, step: timedelta = timedelta(hours=6)):
+    """
+    Split [start_utc, end_utc) into intervals of constant UTC offset for
+    one timezone, as (starts_at, ends_at, offset, abbreviation, is_dst).
+
+    Transitions are located by stepping through the window and bisecting
+    to the second; zones never change offset twice within `step`.
+    """
+
+    zone = ZoneInfo(tz_name)
+    intervals = []
+
+    interval_start = start_utc
+    cursor = start_utc
+
+    while cursor < end_utc:
+        probe = min(cursor + step, end_utc)
+
+        if probe.astimezone(zone).utcoffset() != cursor.astimezone(zone).utcoffset():
+            change = _next_offset_change(zone, cursor, probe)
+            intervals.append(_interval(zone, interval_start, change))
+            interval_start = change
+
+        cursor = probe
+
+    intervals.append(_interval(zone, interval_start, end_utc))
+
+    return intervals
+
+
+def _interval(zone: ZoneInfo, starts_at: datetime, ends_at: datetime):
+    local_time = starts_at.astimezone(zone)
+    dst = local_time.dst()
+
+    return (
+        starts_at,
+        ends_at,
+        int(local_time.utcoffset().total_seconds()),
+        local_time.tzname(),
+        bool(dst),
+    )
+
+
+def next_local_time_at(tz_name: str, hour: int, minute: int, after_utc: datetime) -> datetime:
+    """
+    First UTC instant strictly after `after_utc` at which the local time in
+    `tz_name` reads hour:minute. Wall times skipped by DST never match;
+    repeated ones match on their first occurrence.
+    """
+
+    zone = ZoneInfo(tz_name)
+    local_date = after_utc.astimezone(zone).date()
+
+    for day in range(3):
+        wall = datetime.combine(local_date + timedelta(days=day), datetime.min.time()).replace(
+            hour=hour, minute=minute, tzinfo=zone
+        )
+        candidate = wall.astimezone(timezone.utc)
+
+        # Skipped wall times don't survive the round trip
+        local = candidate.astimezone(zone)
+        if (local.hour, local.minute) != (hour, minute):
+            continue
+
+        if candidate > after_utc:
+            return candidate
+
+    raise ValueError(f"{tz_name} never reaches {hour:02d}:{minute:02d} near {after_utc}")
@@ -1,11 +1,14 @@
 import json
 import os
 import random
-import pytz
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+import config
+from cities_db.queries import max_population_at_time, top_cities_at_time
 from .constants import DB_PATH
-from .data_aggregator import download_geonames, aggregate_data
+from .data_aggregator import LEGACY_COLUMNS, _reader, decay_population
 
 # Configure logging to output to the console
 logging.basicConfig(
@@ -16,53 +19,68 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 def build_database(force=False):
+    """Runs the main.py pipeline up to cities.db (no separate JSON build)."""
+    import main as pipeline
+
     logger.info(f"Starting database build (Force={force})...")
+    previous, config.FORCE_REBUILD = config.FORCE_REBUILD, config.FORCE_REBUILD or force
     try:
-        download_geonames(force=force)
-        logger.info("GeoNames download complete. Starting aggregation...")
-        aggregate_data(force=force)
-        logger.info("Database aggregation successful. world_cities.json is ready.")
+        pipeline.create_directories()
+        pipeline.download_data()
+        logger.info("GeoNames download complete. Building databases...")
+        pipeline.build_geonames_db()
+        pipeline.build_cities_db()
+        logger.info("Database build successful. cities.db is ready.")
     except Exception as e:
         logger.error(f"Database build failed: {str(e)}")
+    finally:
+        config.FORCE_REBUILD = previous
+
+def _with_local_time(city, now_utc, zones):
+    # One zone lookup per timezone, not per city
+    local_time = zones.get(city.timezone)
+    if local_time is None:
+        local_time = zones[city.timezone] = now_utc.astimezone(ZoneInfo(city.timezone))
+
+    return {
+        "city": city.name,
+        "state": city.state,
+        "country": city.country,
+        "population": city.population,
+        "local_time_str": local_time.strftime("%I:%M %p"),
+        "timezone_id": city.timezone,
+        # Current abbreviation (e.g., CEST, PST) and UTC Offset (e.g., +0200)
+        "timezone_abbr": local_time.strftime('%Z'),
+        "utc_offset": local_time.strftime('%z'),
+    }
 
 def get_cities(hour: int, population: int):
     if not os.path.exists(DB_PATH):
         build_database()
 
-    with open(DB_PATH, "r", encoding="utf-8") as f:
-        tz_map = json.load(f)
-
-    now_utc = datetime.now(pytz.utc)
-    winners = []
+    now_utc = datetime.now(timezone.utc)
+    with _reader(DB_PATH) as session:
+        cities = top_cities_at_time(
+            session, hour, now_utc, min_population=population, rows=True, columns=LEGACY_COLUMNS,
+        )
 
-    for tz_id, locations in tz_map.items():
-        try:
-            tz = pytz.timezone(tz_id)
-            local_time = now_utc.astimezone(tz)
-            
-            # Filter by the requested hour
-            if local_time.hour == hour:
-                # Get current abbreviation (e.g., CEST, PST) and UTC Offset (e.g., +0200)
-                tz_abbreviation = local_time.strftime('%Z')
-                utc_offset = local_time.strftime('%z')
-                
-                for loc in locations:
-                    if loc['population'] >= population:
-                        loc_with_time = loc.copy()
-                        loc_with_time['local_time_str'] = local_time.strftime("%I:%M %p")
-                        loc_with_time['timezone_id'] = tz_id
-                        loc_with_time['timezone_abbr'] = tz_abbreviation
-                        loc_with_time['utc_offset'] = utc_offset
-                        winners.append(loc_with_time)
-        except Exception:
-            continue
-    return winners
+    zones = {}
+    return [_with_local_time(city, now_utc, zones) for city in cities]
 
 def get_cities_until_found(hour: int, population: int):
-    cities = get_cities(hour, population)
-    if not cities and population > 10:
-        return get_cities_until_found(hour, int(population * 0.9))
-    return cities, population
+    if not os.path.exists(DB_PATH):
+        build_database()
+
+    now_utc = datetime.now(timezone.utc)
+    with _reader(DB_PATH) as session:
+        max_pop = max_population_at_time(session, hour, now_utc)
+        population = decay_population(population, max_pop, 10)
+        cities = top_cities_at_time(
+            session, hour, now_utc, min_population=population, rows=True, columns=LEGACY_COLUMNS,
+        )
+
+    zones = {}
+    return [_with_local_time(city, now_utc, zones) for city in cities], population
 
 def pick_random_city(hour: int, population: int):
     cities, final_pop = get_cities_until_found(hour, population)
@@ -71,4 +89,4 @@ def pick_random_city(hour: int, population: int):
     return random.choice(cities), final_pop
 
 def cities_to_json(data):
-    return json.dumps(data, indent=4)
\ No newline at end of file
+    return json.dumps(data, indent=4)
@@ -0,0 +1,71 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+def byte_ranges(path, chunk_bytes: int) -> list[tuple[int, int]]:
+    """
+    Split `path` into [start, end) byte ranges of about `chunk_bytes`,
+    each ending just after a newline so no line straddles two ranges.
+    """
+    size = os.path.getsize(path)
+    ranges = []
+
+    with open(path, "rb") as f:
+        start = 0
+        while start < size:
+            end = min(start + chunk_bytes, size)
+            if end < size:
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+            ranges.append((start, end))
+            start = end
+
+    return ranges
+
+
+def read_lines(path, start: int, end: int) -> list[str]:
+    """
+    Decoded lines (without the newline) of one range from byte_ranges.
+    The range is read in one go (about chunk_bytes).
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    # str.splitlines would also break on \x1c, \u2028 and friends
+    lines = data.decode("utf-8").split("\n")
+    if lines and not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def map_ranges(path, parse_range, workers: int, chunk_bytes: int, max_pending: int | None = None):
+    """
+    Yield `parse_range(path, start, end)` for every range of `path`, in file
+    order, parsed on `workers` processes.
+
+    At most `max_pending` ranges (default 2 per worker) are parsed ahead of
+    the consumer, so a slow writer bounds memory instead of letting parsed
+    chunks pile up. `parse_range` must be picklable (module level or a
+    functools.partial of one). With one worker everything runs in-process.
+    """
+    ranges = byte_ranges(path, chunk_bytes)
+
+    if workers <= 1:
+        for start, end in ranges:
+            yield parse_range(path, start, end)
+        return
+
+    max_pending = max_pending or 2 * workers
+    pending = deque()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for start, end in ranges:
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+            pending.append(pool.submit(parse_range, path, start, end))
+
+        while pending:
+            yield pending.popleft().result()